@@ -0,0 +1,104 @@
+"""
+哈希算法性能测试
+在当前机器上测量每种可用哈希算法的吞吐量(MB/s)，用于选择贴图管理工具使用的哈希算法。
+使用--strategies时改为比较不同文件大小下各种读取策略(readinto/mmap/file_digest/4KB分块)的吞吐量。
+
+用法:
+    python hash_benchmark.py                        # 使用临时生成的测试文件
+    python hash_benchmark.py --size 512             # 指定测试文件大小(MB)
+    python hash_benchmark.py D:\\maps\\a.exr ...    # 使用实际贴图文件(例如NAS上的贴图)
+    python hash_benchmark.py --strategies           # 比较读取策略
+    python hash_benchmark.py --strategies --dir \\\\nas\\share\\tmp   # 在网络存储上比较读取策略
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from texture_hashing import available_algorithms, hash_file, HASH_STRATEGIES
+
+# 读取策略测试使用的文件大小(KB)
+STRATEGY_FILE_SIZES_KB = [64, 1024, 16 * 1024, 128 * 1024]
+
+def benchmark_algorithm(algorithm, file_paths, repeat):
+    """Return the best throughput in MB/s of hashing all files with one algorithm"""
+    total_bytes = sum(os.path.getsize(path) for path in file_paths)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in file_paths:
+            hash_file(path, algorithm)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return total_bytes / (1024 * 1024) / best if best else float("inf")
+
+def _write_random_file(directory, size_bytes):
+    fd, path = tempfile.mkstemp(suffix=".bin", dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        remaining = size_bytes
+        while remaining > 0:
+            block = min(remaining, 1024 * 1024)
+            f.write(os.urandom(block))
+            remaining -= block
+    return path
+
+def benchmark_strategies(algorithm, sizes_kb, repeat, directory=None):
+    """Print MB/s of every read strategy for each file size"""
+    strategies = [strategy for strategy in HASH_STRATEGIES if strategy != "auto"] + ["auto"]
+    print(f"读取策略对比 (算法: {algorithm}, 重复 {repeat} 次取最快)")
+    print(f"{'文件大小':>10} " + " ".join(f"{strategy:>12}" for strategy in strategies))
+    for size_kb in sizes_kb:
+        path = _write_random_file(directory, size_kb * 1024)
+        try:
+            # 小文件重复多次以获得稳定的计时
+            iterations = max(1, (64 * 1024) // size_kb)
+            row = []
+            for strategy in strategies:
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    for _ in range(iterations):
+                        hash_file(path, algorithm, strategy)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                row.append(size_kb / 1024 * iterations / best if best else float("inf"))
+            print(f"{size_kb:>8}KB " + " ".join(f"{value:>12.1f}" for value in row))
+        finally:
+            os.remove(path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="测量各哈希算法的吞吐量")
+    parser.add_argument("files", nargs="*", help="用于测试的贴图文件，不指定时生成临时文件")
+    parser.add_argument("--size", type=int, default=256, help="临时测试文件大小(MB)，默认256")
+    parser.add_argument("--repeat", type=int, default=3, help="每种算法重复次数，取最快一次，默认3")
+    parser.add_argument("--strategies", action="store_true", help="比较不同文件大小下各读取策略的吞吐量")
+    parser.add_argument("--algorithm", default="md5", help="读取策略对比使用的算法，默认md5")
+    parser.add_argument("--sizes", type=int, nargs="+", default=STRATEGY_FILE_SIZES_KB,
+                        help="读取策略对比使用的文件大小(KB)")
+    parser.add_argument("--dir", default=None, help="生成测试文件的目录，用于测试指定存储，默认系统临时目录")
+    args = parser.parse_args(argv)
+
+    if args.strategies:
+        benchmark_strategies(args.algorithm, args.sizes, args.repeat, args.dir)
+        return 0
+
+    temp_path = None
+    file_paths = args.files
+    if not file_paths:
+        temp_path = _write_random_file(args.dir, args.size * 1024 * 1024)
+        file_paths = [temp_path]
+
+    try:
+        total_mb = sum(os.path.getsize(path) for path in file_paths) / (1024 * 1024)
+        print(f"测试数据: {len(file_paths)} 个文件, 共 {total_mb:.1f} MB (重复 {args.repeat} 次取最快)")
+        for algorithm in available_algorithms():
+            throughput = benchmark_algorithm(algorithm, file_paths, args.repeat)
+            print(f"{algorithm:>10}: {throughput:10.1f} MB/s")
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
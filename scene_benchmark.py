@@ -0,0 +1,51 @@
+"""
+场景枚举性能测试
+在3ds Max中比较两种读取场景贴图引用的方式：逐个属性访问的Python遍历和一次执行的批量MAXScript遍历，
+输出每种方式的耗时、pymxs调用次数和找到的贴图引用数量，并检查两者找到的贴图文件是否一致。
+
+用法（在3ds Max的MAXScript侦听器中）:
+    python.ExecuteFile @"D:\\tools\\texture_manager\\scene_benchmark.py"
+"""
+import os
+import sys
+import time
+
+if "__file__" in globals():
+    _script_dir = os.path.dirname(os.path.abspath(__file__))
+    if _script_dir not in sys.path:
+        sys.path.insert(0, _script_dir)
+
+from texture_pymxs import PymxsSceneAdapter
+
+def benchmark_enumeration(bulk, repeat):
+    """Return (best seconds, pymxs calls, references) of enumerating all texture references with one backend"""
+    best = None
+    references = []
+    adapter = PymxsSceneAdapter(bulk=bulk)
+    for _ in range(repeat):
+        start = time.perf_counter()
+        references = list(adapter.iter_texture_references())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, adapter.pymxs_calls, references
+
+def main(repeat=3):
+    print(f"场景枚举对比 (重复 {repeat} 次取最快)")
+    results = {}
+    for name, bulk in (("逐个遍历", False), ("批量遍历", True)):
+        elapsed, calls, references = benchmark_enumeration(bulk, repeat)
+        results[name] = references
+        files = len(set(os.path.normcase(reference.filename) for reference in references))
+        print(f"{name}: {elapsed:8.3f} 秒, pymxs调用 {calls:>8} 次, 引用 {len(references):>6} 个, 文件 {files:>6} 个")
+
+    walked, bulk = (set(os.path.normcase(reference.filename) for reference in references)
+                    for references in results.values())
+    if walked - bulk:
+        print(f"批量遍历缺少 {len(walked - bulk)} 个文件，例如: {sorted(walked - bulk)[:5]}")
+    if bulk - walked:
+        # 批量遍历访问材质的所有贴图槽，逐个遍历只检查常用槽位
+        print(f"批量遍历额外找到 {len(bulk - walked)} 个文件，例如: {sorted(bulk - walked)[:5]}")
+    return 0
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+离线贴图审计
+在没有3ds Max和界面的机器上（例如Linux渲染农场节点）批量审计导出的场景清单：
+每个场景清单在进程池中独立扫描，输出引用数量、丢失贴图和重复贴图，每个场景一行JSON。
+
+场景清单在3ds Max中导出:
+    import texture_core, texture_pymxs
+    texture_core.write_scene_manifest(texture_pymxs.PymxsSceneAdapter(), r"D:\\proj\\a_manifest.json")
+
+用法:
+    python texture_audit.py manifests/*.json
+    python texture_audit.py --workers 16 --path-map //nas/share=/mnt/share -o audit.jsonl manifests/*.json
+    python texture_audit.py --algorithm blake2b --no-cache a_manifest.json
+    python texture_audit.py --project-index D:/proj/.texture_project_index.sqlite manifests/*.json
+"""
+import os
+import sys
+import json
+import glob
+import argparse
+import concurrent.futures
+
+from texture_hashing import (
+    HashCache, HASH_CACHE_PATH, DEFAULT_HASH_ALGORITHM, available_algorithms, is_hash_error
+)
+from texture_core import ManifestSceneAdapter, TextureScanner, ProjectIndex
+
+def parse_path_map(values):
+    """Parse PREFIX=REPLACEMENT arguments into a path map list"""
+    path_map = []
+    for value in values or []:
+        prefix, sep, replacement = value.partition("=")
+        if not sep or not prefix:
+            raise argparse.ArgumentTypeError(f"路径映射格式应为 PREFIX=REPLACEMENT: {value}")
+        path_map.append((prefix, replacement))
+    return path_map
+
+def audit_scene(manifest_path, options):
+    """
+    Audit one scene manifest and return a JSON-serializable summary.
+    Runs in a worker process, so it builds its own hash cache connection and scanner.
+    The shared cache is only read here; new entries are returned in "cache_rows" and written by the parent.
+    """
+    if options["cache_path"]:
+        hash_cache = HashCache(options["cache_path"], read_only=True)
+    else:
+        hash_cache = HashCache(":memory:")
+    try:
+        scanner = TextureScanner(hash_cache, options["algorithm"], options["hash_workers"])
+        adapter = ManifestSceneAdapter(manifest_path, options["path_map"])
+        result = scanner.scan(adapter)
+        duplicates = set(scanner.find_duplicates(result.records, result.scanned_files, result.file_hashes))
+
+        missing = {}
+        duplicate_groups = {}
+        for reference in result.references:
+            if is_hash_error(reference.hash):
+                missing.setdefault(reference.filename, []).append(reference.describe())
+            elif reference.hash in duplicates:
+                duplicate_groups.setdefault(reference.hash, set()).add(reference.filename)
+
+        summary = {
+            "manifest": manifest_path,
+            "scene": adapter.get_scene_file(),
+            "algorithm": scanner.hash_algorithm,
+            "references": len(result.references),
+            "unique_files": len(result.scanned_files),
+            "missing": missing,  # filename -> ["material / slot", ...]
+            "duplicates": {hash_value: sorted(files) for hash_value, files in duplicate_groups.items()},
+            "records": result.records.to_dicts(),
+            "cache": hash_cache.stats_text()
+        }
+        if options["cache_path"]:
+            summary["cache_rows"] = hash_cache.take_pending()
+        if options["project_index"]:
+            # 项目索引只在主进程中写入，文件哈希值随结果返回
+            summary["file_hashes"] = result.file_hashes
+            summary["file_stats"] = result.file_stats
+        return summary
+    finally:
+        hash_cache.close()
+
+def expand_manifests(patterns):
+    """Expand glob patterns (Windows shells do not expand them)"""
+    manifests = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        manifests.extend(matches if matches else [pattern])
+    return manifests
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="离线批量审计场景清单中的贴图")
+    parser.add_argument("manifests", nargs="+", help="场景清单JSON文件（支持通配符）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="并行审计的进程数（默认: CPU核心数）")
+    parser.add_argument("--hash-workers", type=int, default=4,
+                        help="每个进程中并行哈希的线程数（默认: 4）")
+    parser.add_argument("--path-map", action="append", default=[], metavar="PREFIX=REPLACEMENT",
+                        help="将清单中的路径前缀映射到本机路径，可多次指定")
+    parser.add_argument("--algorithm", default=DEFAULT_HASH_ALGORITHM, choices=available_algorithms(),
+                        help=f"哈希算法（默认: {DEFAULT_HASH_ALGORITHM}）")
+    parser.add_argument("--cache", default=HASH_CACHE_PATH, help="哈希缓存数据库路径")
+    parser.add_argument("--no-cache", action="store_true", help="不使用持久哈希缓存")
+    parser.add_argument("--project-index", help="用审计结果更新的项目索引数据库（与3ds Max中的项目索引相同）")
+    parser.add_argument("-o", "--output", help="输出JSONL文件（默认输出到标准输出）")
+    args = parser.parse_args(argv)
+
+    try:
+        path_map = parse_path_map(args.path_map)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    options = {
+        "algorithm": args.algorithm,
+        "hash_workers": args.hash_workers,
+        "path_map": path_map,
+        "cache_path": None if args.no_cache else args.cache,
+        "project_index": bool(args.project_index)
+    }
+    manifests = expand_manifests(args.manifests)
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    project_index = ProjectIndex(args.project_index) if args.project_index else None
+    # 只有主进程写入哈希缓存，工作进程只读，不会互相等待写锁
+    hash_cache = HashCache(options["cache_path"]).open() if options["cache_path"] else None
+    failures = 0
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            futures = {executor.submit(audit_scene, path, options): path for path in manifests}
+            for future in concurrent.futures.as_completed(futures):
+                manifest_path = futures[future]
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    failures += 1
+                    summary = {"manifest": manifest_path, "error": str(e)}
+                else:
+                    if hash_cache is not None:
+                        hash_cache.merge(*summary.pop("cache_rows"))
+                    if project_index is not None:
+                        project_index.update_scene(summary["scene"], summary.pop("file_hashes"),
+                                                   summary.pop("file_stats"), summary["algorithm"])
+                    print(f"{os.path.basename(manifest_path)}: 引用 {summary['references']}，"
+                          f"文件 {summary['unique_files']}，丢失 {len(summary['missing'])}，"
+                          f"重复 {len(summary['duplicates'])}", file=sys.stderr)
+                out.write(json.dumps(summary, ensure_ascii=False) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if project_index is not None:
+            project_index.close()
+        if hash_cache is not None:
+            hash_cache.close()
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1997 @@
+"""
+贴图扫描核心
+不依赖Qt和pymxs，通过场景适配器(SceneAdapter)访问场景：
+- 在3ds Max中由texture_manager的界面配合texture_pymxs.PymxsSceneAdapter使用
+- 在离线批处理(texture_audit.py)中配合ManifestSceneAdapter读取导出的场景清单
+"""
+import os
+import re
+import json
+import time
+import shutil
+import sqlite3
+import functools
+import contextlib
+import concurrent.futures
+
+from texture_hashing import (
+    HashCache, HASH_CACHE_PATH, HASH_WORKER_COUNT, DEFAULT_HASH_ALGORITHM, LEGACY_HASH_ALGORITHM,
+    available_algorithms, hash_file_digests, is_hash_error, normalize_texture_path,
+    stat_key, OperationCancelled, DirectoryListing
+)
+
+# 记录文件格式
+RECORD_FORMAT = "texture_records"
+RECORD_FORMAT_VERSION = 2  # 版本1为没有文件头的纯列表，固定使用MD5
+
+# 记录索引：工具在目录中维护的记录文件列表（类型、版本、场景名、修改时间），查找记录时不必解析目录中的每个JSON文件
+RECORD_INDEX_NAME = ".texture_records_index"
+RECORD_INDEX_FORMAT = "texture_record_index"
+RECORD_INDEX_VERSION = 1
+RECORD_SNIFF_BYTES = 4096  # 识别未登记的JSON文件时最多读取的文件头字节数
+
+# 修改日志：记录文件旁边只追加的JSON Lines日志，记录重命名、重新指向和撤回事件
+JOURNAL_EVENTS = ("rename", "repoint", "revert")
+JOURNAL_COMPACT_EVENTS = 500  # 日志中的事件超过该数量时重写记录文件（快照）并清空日志
+
+# 场景清单格式（由3ds Max导出，供离线批处理使用）
+MANIFEST_FORMAT = "texture_scene_manifest"
+MANIFEST_FORMAT_VERSION = 1
+
+# 贴图库：按内容寻址的归档目录，文件以哈希值命名并按哈希值前缀分到子目录中，整个项目中每个贴图只存储一次
+TEXTURE_STORE_DIR_NAME = "texture_store"  # 贴图库在项目文件夹中的目录名
+TEXTURE_STORE_SHARDS = (2, 2)  # 子目录层级，每级使用的哈希值字符数，例如 ab/cd/abcd....png
+STORE_MANIFEST_FORMAT = "texture_store_manifest"  # 每个场景的贴图库引用清单
+STORE_MANIFEST_VERSION = 1
+
+# 项目索引：项目中所有场景使用的贴图（哈希值 -> 文件 -> 场景），每次扫描时更新，跨场景查询重复贴图和使用位置
+PROJECT_INDEX_NAME = ".texture_project_index.sqlite"
+PROJECT_INDEX_SCHEMA_VERSION = 1
+
+# 丢失贴图查找：搜索目录（贴图库）中按文件名建立的索引，在多次会话之间保留
+LIBRARY_INDEX_PATH = os.path.join(os.path.dirname(HASH_CACHE_PATH), "library_index.sqlite")
+LIBRARY_INDEX_SCHEMA_VERSION = 1
+LIBRARY_INDEX_MAX_AGE_DAYS = 7  # 搜索目录的索引超过该天数后在查找前重新建立
+LIBRARY_INDEX_WORKERS = 16  # 并行列出目录的线程数
+LIBRARY_FILE_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".tga", ".tif", ".tiff", ".exr", ".hdr", ".hdri", ".bmp", ".dds", ".psd", ".tx", ".gif", ".ies"
+}
+
+def build_record_file(records, algorithm, scene=""):
+    """Wrap records in the versioned record file header; header fields come first so sniff_record_file can read them"""
+    return {
+        "format": RECORD_FORMAT,
+        "version": RECORD_FORMAT_VERSION,
+        "algorithm": algorithm,
+        "scene": scene,
+        "records": records
+    }
+
+def parse_record_file(data):
+    """
+    Return (algorithm, records) from loaded record file JSON.
+    Headerless lists from older versions are treated as MD5 records.
+    """
+    if isinstance(data, list):
+        return LEGACY_HASH_ALGORITHM, data
+    if isinstance(data, dict) and data.get("format") == RECORD_FORMAT and isinstance(data.get("records"), list):
+        return data.get("algorithm", LEGACY_HASH_ALGORITHM), data["records"]
+    raise ValueError("JSON格式错误：应为贴图记录列表或带文件头的记录文件")
+
+def write_record_file(file_path, records, algorithm, scene=""):
+    """Write records with the versioned header and register the file in its directory's record index"""
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(build_record_file(records, algorithm, scene), f, ensure_ascii=False, indent=2)
+    try:
+        directory = os.path.dirname(os.path.abspath(file_path))
+        index = load_record_index(directory)
+        index[os.path.basename(file_path)] = _record_index_entry(os.stat(file_path), RECORD_FORMAT, RECORD_FORMAT_VERSION, scene)
+        save_record_index(directory, index)
+    except OSError as e:
+        print(f"更新记录索引失败: {str(e)}")
+
+_RECORD_FORMAT_PATTERN = re.compile(r'"format"\s*:\s*"' + RECORD_FORMAT + '"')
+_RECORD_VERSION_PATTERN = re.compile(r'"version"\s*:\s*(\d+)')
+_RECORD_SCENE_PATTERN = re.compile(r'"scene"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+def sniff_record_file(file_path, limit=RECORD_SNIFF_BYTES):
+    """
+    Identify a JSON file from at most limit bytes of its head, without parsing it.
+    Returns (version, scene) for texture record files and None for anything else.
+    """
+    with open(file_path, 'rb') as f:
+        head = f.read(limit).decode('utf-8', errors='ignore').lstrip('\ufeff \t\r\n')
+    if head.startswith('['):
+        # 旧版没有文件头的记录列表：第一条记录中应有hash字段
+        end = head.find('}')
+        return (1, "") if end != -1 and '"hash"' in head[:end] else None
+    if not head.startswith('{'):
+        return None
+    records_start = head.find('"records"')
+    header = head if records_start == -1 else head[:records_start]
+    if not _RECORD_FORMAT_PATTERN.search(header):
+        return None
+    version = _RECORD_VERSION_PATTERN.search(header)
+    scene = _RECORD_SCENE_PATTERN.search(header)
+    return int(version.group(1)) if version else RECORD_FORMAT_VERSION, json.loads(scene.group(1)) if scene else ""
+
+def _record_index_entry(stat_result, record_type, version, scene):
+    return {"type": record_type, "version": version, "scene": scene,
+            "mtime_ns": stat_result.st_mtime_ns, "size": stat_result.st_size}
+
+def load_record_index(directory):
+    """Return {file name: entry} from the record index in directory, or {} if it is missing or unreadable"""
+    try:
+        with open(os.path.join(directory, RECORD_INDEX_NAME), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("format") == RECORD_INDEX_FORMAT and data.get("version") == RECORD_INDEX_VERSION:
+            return data.get("files", {})
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {}
+
+def save_record_index(directory, files):
+    """Write the record index, replacing the old one atomically"""
+    index_path = os.path.join(directory, RECORD_INDEX_NAME)
+    temp_path = index_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({"format": RECORD_INDEX_FORMAT, "version": RECORD_INDEX_VERSION, "files": files},
+                  f, ensure_ascii=False)
+    os.replace(temp_path, index_path)
+
+def list_record_files(directory):
+    """
+    Return [(path, version, scene, mtime_ns)] of the texture record files in directory.
+    Files whose size and mtime match the record index are not opened; new or changed JSON files are
+    identified by sniff_record_file and the index is updated (best effort, e.g. read-only folders).
+    """
+    index = load_record_index(directory)
+    updated = {}
+    records = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.lower().endswith(".json"):
+                continue
+            try:
+                stat_result = entry.stat()
+                cached = index.get(entry.name)
+                if cached and cached.get("mtime_ns") == stat_result.st_mtime_ns and cached.get("size") == stat_result.st_size:
+                    info = cached
+                else:
+                    sniffed = sniff_record_file(entry.path)
+                    if sniffed is None:
+                        info = _record_index_entry(stat_result, "other", 0, "")
+                    else:
+                        info = _record_index_entry(stat_result, RECORD_FORMAT, sniffed[0], sniffed[1])
+            except OSError:
+                continue
+            updated[entry.name] = info
+            if info["type"] == RECORD_FORMAT:
+                records.append((entry.path, info["version"], info["scene"], info["mtime_ns"]))
+
+    if updated != index:
+        try:
+            save_record_index(directory, updated)
+        except OSError as e:
+            print(f"更新记录索引失败: {str(e)}")
+    return records
+
+def migrate_record_hashes(records, new_hashes, legacy_hashes):
+    """
+    Re-key records written with another hash algorithm, returning new record dicts.
+    new_hashes / legacy_hashes map each scene file to its digest in the current and the
+    record's algorithm; records whose file is not in the scene keep their old hash.
+    """
+    legacy_to_new = {}
+    for file_path, new_hash in new_hashes.items():
+        legacy_hash = legacy_hashes.get(file_path)
+        if legacy_hash and not is_hash_error(legacy_hash):
+            legacy_to_new[legacy_hash] = new_hash
+
+    return [dict(record, hash=legacy_to_new.get(record["hash"], record["hash"])) for record in records]
+
+def scene_record_path(scene_file):
+    """The scene's own record file <场景名>_textures.json next to it, or None for an unsaved scene"""
+    if not scene_file:
+        return None
+    scene_name = os.path.splitext(os.path.basename(scene_file))[0]
+    return os.path.join(os.path.dirname(scene_file), scene_name + "_textures.json")
+
+def find_existing_record(scene_file):
+    """
+    从场景文件根目录中尝试获取JSON记录
+    1. 首先检查与场景文件同名的<场景名>_textures.json
+    2. 否则使用目录中最新的贴图记录JSON文件（通过记录索引查找，不解析其他JSON文件）；
+       这可能是其他场景的记录，只作为初始数据读取，不应写回
+
+    返回 (records, record_path, algorithm, message)，未找到时records为None
+    """
+    if not scene_file:
+        return None, None, None, "未找到场景文件，无法获取JSON记录"
+
+    scene_dir = os.path.dirname(scene_file)
+    scene_name = os.path.splitext(os.path.basename(scene_file))[0]
+
+    # 首先检查与场景文件同名的JSON记录
+    json_path = scene_record_path(scene_file)
+
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            algorithm, data = parse_record_file(json.load(f))
+        return data, json_path, algorithm, f"成功获取JSON记录: {os.path.basename(json_path)}"
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"读取JSON记录失败: {str(e)}")
+
+    # 如果未找到同名文件，通过记录索引查找目录中的贴图记录，优先使用属于该场景的最新记录
+    try:
+        found_files = list_record_files(scene_dir)
+    except OSError as e:
+        print(f"读取场景目录失败: {str(e)}")
+        found_files = []
+    found_files.sort(key=lambda item: (item[2] == scene_name, item[3]), reverse=True)
+    for newest_file, _, _, _ in found_files:
+        try:
+            with open(newest_file, 'r', encoding='utf-8') as f:
+                algorithm, data = parse_record_file(json.load(f))
+            if len(data) > 0 and "hash" in data[0]:
+                return data, newest_file, algorithm, f"成功获取最新JSON记录: {os.path.basename(newest_file)}"
+        except Exception:
+            continue
+
+    return None, None, None, "未找到JSON记录，将使用标准方式获取贴图信息"
+
+def journal_path(record_path):
+    """The modification journal that belongs to a record file"""
+    return os.path.splitext(record_path)[0] + ".journal.jsonl"
+
+class RecordJournal:
+    """
+    Append-only JSON Lines journal of naming events, kept next to a record file.
+    Each line is one event: {"ts": unix time, "event": rename / repoint / revert, "hash": file hash, "name": new name}.
+    The record file is the compacted snapshot; replaying the journal over it restores the current names,
+    so saving a change appends a few lines instead of rewriting every record. Events are idempotent,
+    so replaying a journal that was already folded into the snapshot (e.g. after a crash while compacting) is harmless.
+    """
+    def __init__(self, record_path):
+        self.record_path = record_path
+        self.path = journal_path(record_path)
+        self._event_count = None
+
+    def append(self, events):
+        """Append (event, hash, name) tuples; returns the number of events written"""
+        timestamp = round(time.time(), 3)
+        lines = []
+        for event, hash_value, name in events:
+            if event not in JOURNAL_EVENTS:
+                raise ValueError(f"未知的日志事件: {event}")
+            lines.append(json.dumps({"ts": timestamp, "event": event, "hash": hash_value, "name": name},
+                                    ensure_ascii=False))
+        if not lines:
+            return 0
+        event_count = self.event_count()
+        data = ("\n".join(lines) + "\n").encode('utf-8')
+        with open(self.path, 'ab+') as f:
+            # 上次写入被中断时先结束不完整的行，避免新事件与其连在一起
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data
+            f.write(data)
+        self._event_count = event_count + len(lines)
+        return len(lines)
+
+    def read(self):
+        """All events in order; a line cut off by a crash is skipped"""
+        events = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(event, dict) and event.get("event") in JOURNAL_EVENTS and "hash" in event:
+                        events.append(event)
+        except FileNotFoundError:
+            pass
+        self._event_count = len(events)
+        return events
+
+    def replay(self, records):
+        """Apply the journal to record dicts loaded from the snapshot in place; returns the number of records changed"""
+        names = {}
+        for event in self.read():
+            names[event["hash"]] = event.get("name", "")
+        changed = 0
+        for item in records:
+            name = names.get(item.get("hash"))
+            if name and item.get("modified(1)") != name:
+                item["modified(1)"] = name
+                changed += 1
+        return changed
+
+    def event_count(self):
+        if self._event_count is None:
+            self.read()
+        return self._event_count
+
+    def needs_compaction(self):
+        return self.event_count() >= JOURNAL_COMPACT_EVENTS
+
+    def clear(self):
+        """Start a new journal once the snapshot holds every event"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self._event_count = 0
+
+def modification_number(key):
+    """N of a modified(N) key"""
+    return int(key.split("(")[1].split(")")[0])
+
+def modification_keys(keys):
+    """The modified(N) keys among keys, sorted by N"""
+    return sorted([key for key in keys if key.startswith("modified(")], key=modification_number)
+
+class TextureRecord:
+    """
+    One texture record: the file content (hash), its reference state and naming history.
+    modifications keeps the modified(N) names in the order they were recorded.
+    """
+    __slots__ = ("hash", "referenced", "references", "original", "modifications", "paths", "row")
+
+    def __init__(self, hash_value, original, referenced="是", references=0, modifications=None):
+        self.hash = hash_value
+        self.referenced = referenced
+        self.references = references
+        self.original = original
+        self.modifications = modifications if modifications is not None else {}
+        self.paths = []  # scene file paths with this hash, filled by RecordStore.index_references
+        self.row = -1  # position in the RecordStore
+
+    @classmethod
+    def from_dict(cls, item):
+        """Build a record from a record file / JSON dict"""
+        modifications = {key: item[key] for key in item if key.startswith("modified(")}
+        return cls(item["hash"], item.get("original", ""), item.get("referenced", "是"),
+                   item.get("references", 0), modifications)
+
+    def to_dict(self):
+        item = {
+            "hash": self.hash,
+            "referenced": self.referenced,
+            "references": self.references,
+            "original": self.original
+        }
+        item.update(self.modifications)
+        return item
+
+    def modification_keys(self):
+        return modification_keys(self.modifications)
+
+    def same_values(self, other):
+        """True if other holds the same reference state and naming history"""
+        return (self.referenced == other.referenced and self.references == other.references
+                and self.original == other.original and self.modifications == other.modifications)
+
+    def copy_values(self, other):
+        """Take over other's reference state and naming history, keeping this record's place in its store"""
+        self.referenced = other.referenced
+        self.references = other.references
+        self.original = other.original
+        self.modifications = dict(other.modifications)
+
+    @property
+    def current_name(self):
+        """The name from modified(1), which the dialog edits, falling back to the original name"""
+        return self.modifications.get("modified(1)", self.original)
+
+    @current_name.setter
+    def current_name(self, name):
+        self.modifications["modified(1)"] = name
+
+class RecordStore:
+    """
+    Ordered in-memory store of TextureRecords with the indexes the dialog's actions need:
+    - hash -> records (imported record files may repeat a hash)
+    - normalized file path -> record
+    - duplicate hashes -> the distinct files that share the content
+    Rows are the records' positions, so a table row maps straight to its record.
+    """
+    def __init__(self, records=None):
+        self.clear()
+        if records:
+            self.extend(records)
+
+    def clear(self):
+        self._records = []
+        self._by_hash = {}
+        self._by_path = {}
+        self._modification_columns = set()
+        self.duplicates = set()
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __getitem__(self, row):
+        return self._records[row]
+
+    def __contains__(self, hash_value):
+        return hash_value in self._by_hash
+
+    def add(self, record):
+        if isinstance(record, dict):
+            record = TextureRecord.from_dict(record)
+        record.row = len(self._records)
+        self._records.append(record)
+        self._by_hash.setdefault(record.hash, []).append(record)
+        self._modification_columns.update(record.modifications)
+        return record
+
+    def extend(self, records):
+        for record in records:
+            self.add(record)
+
+    def remove(self, records):
+        """Remove records and renumber the rows after them"""
+        removed = {id(record) for record in records}
+        if not removed:
+            return
+        first_row = min(record.row for record in records)
+        self._records = [record for record in self._records if id(record) not in removed]
+        for row in range(first_row, len(self._records)):
+            self._records[row].row = row
+        self._by_hash = {}
+        for record in self._records:
+            self._by_hash.setdefault(record.hash, []).append(record)
+        self._by_path = {key: record for key, record in self._by_path.items() if id(record) not in removed}
+        self.duplicates &= set(self._by_hash)
+
+    def update(self, record, new_values):
+        """Copy a rescanned record's values into the stored record in place"""
+        record.copy_values(new_values)
+        self._modification_columns.update(record.modifications)
+
+    def get(self, hash_value):
+        """First record with the hash, or None"""
+        records = self._by_hash.get(hash_value)
+        return records[0] if records else None
+
+    def records_with_hash(self, hash_value):
+        return self._by_hash.get(hash_value, [])
+
+    def hashes(self):
+        return self._by_hash.keys()
+
+    def index_references(self, references):
+        """Index the scene files behind each record from resolved TextureReferences"""
+        self._by_path = {}
+        for record in self._records:
+            record.paths = []
+        for reference in references:
+            record = self.get(reference.hash)
+            if record is None:
+                continue
+            if reference.key not in self._by_path:
+                self._by_path[reference.key] = record
+                record.paths.append(reference.path)
+
+    def find_by_path(self, file_path, base_dir=None):
+        return self._by_path.get(normalize_texture_path(file_path, base_dir)[1])
+
+    def set_duplicates(self, hash_values):
+        self.duplicates = set(hash_values)
+
+    def is_duplicate(self, hash_value):
+        return hash_value in self.duplicates
+
+    def duplicate_groups(self):
+        """{hash: [records]} for every duplicate hash, in record order"""
+        groups = {}
+        for record in self._records:
+            if record.hash in self.duplicates:
+                groups.setdefault(record.hash, []).append(record)
+        return groups
+
+    def note_modification(self, key):
+        """Register a modified(N) key added to a record after it was stored"""
+        self._modification_columns.add(key)
+
+    def modification_columns(self):
+        """All modified(N) keys used by any record, sorted by N; modified(1) is always present as the editable column"""
+        return modification_keys(self._modification_columns | {"modified(1)"})
+
+    def to_dicts(self):
+        return [record.to_dict() for record in self._records]
+
+class TextureReference:
+    """
+    One bitmap reference in the scene: the adapter's texture handle, its filename and where it is used.
+    material is the owning material's name and slot the map slot path inside it (e.g. "diffuseMap" or "[2]/bumpMap").
+    path/key (resolved path and normalized key) and hash are filled in by the scan.
+    """
+    __slots__ = ("texture", "filename", "material", "slot", "path", "key", "hash")
+
+    def __init__(self, texture, filename, material="", slot=""):
+        self.texture = texture
+        self.filename = filename
+        self.material = material
+        self.slot = slot
+        self.path = None
+        self.key = None
+        self.hash = None
+
+    def describe(self):
+        return f"{self.material} / {self.slot}" if self.slot else self.material
+
+class ReferenceIndex:
+    """
+    Inverted index over every bitmap reference of a scan, in scan order:
+    hash -> [TextureReference] and normalized file path -> [TextureReference].
+    Several bitmaps (in different materials and slots) can point at the same file, so repointing
+    or renaming goes through here to update all of them in one pass.
+    """
+    def __init__(self, base_dir=None):
+        self.base_dir = base_dir
+        self._references = []
+        self._by_hash = {}
+        self._by_path = {}
+
+    def __len__(self):
+        return len(self._references)
+
+    def __iter__(self):
+        return iter(self._references)
+
+    def __contains__(self, hash_value):
+        return hash_value in self._by_hash
+
+    def add(self, reference):
+        if reference.key is None:
+            reference.path, reference.key = normalize_texture_path(reference.filename, self.base_dir)
+        self._references.append(reference)
+        self._by_hash.setdefault(reference.hash, []).append(reference)
+        self._by_path.setdefault(reference.key, []).append(reference)
+
+    def for_hash(self, hash_value):
+        return self._by_hash.get(hash_value, [])
+
+    def for_path(self, file_path):
+        return self._by_path.get(normalize_texture_path(file_path, self.base_dir)[1], [])
+
+    def hashes(self):
+        return self._by_hash.keys()
+
+    def hash_counts(self):
+        """{hash: number of bitmap references}"""
+        return {hash_value: len(references) for hash_value, references in self._by_hash.items()}
+
+    def set_filename(self, adapter, reference, filename):
+        """
+        Point one reference at filename in the scene and move it in the path index.
+        With a SceneTransaction instead of an adapter the change is staged and happens when the transaction is applied.
+        """
+        if isinstance(adapter, SceneTransaction):
+            adapter.stage(self, reference, filename)
+            return
+        adapter.set_texture_filename(reference.texture, filename)
+        self.move_reference(reference, filename)
+
+    def move_reference(self, reference, filename):
+        """Move a reference whose scene texture now points at filename in the path index"""
+        old_references = self._by_path.get(reference.key)
+        if old_references and reference in old_references:
+            old_references.remove(reference)
+            if not old_references:
+                del self._by_path[reference.key]
+        reference.filename = filename
+        reference.path, reference.key = normalize_texture_path(filename, self.base_dir)
+        self._by_path.setdefault(reference.key, []).append(reference)
+
+    def repoint(self, adapter, references, file_path):
+        """Point every given reference at file_path; returns the number of references changed (or staged)"""
+        changed = 0
+        for reference in list(references):
+            if reference.filename != file_path:
+                self.set_filename(adapter, reference, file_path)
+                changed += 1
+        return changed
+
+    def rename(self, adapter, references, file_name):
+        """Rename every given reference to file_name inside its own directory; returns the number changed (or staged)"""
+        changed = 0
+        for reference in list(references):
+            new_path = os.path.join(os.path.dirname(reference.filename), file_name)
+            if reference.filename != new_path:
+                self.set_filename(adapter, reference, new_path)
+                changed += 1
+        return changed
+
+class SceneTransaction:
+    """
+    Collects texture filename changes and applies them to the scene in one batch.
+    Used as a context manager around ReferenceIndex.repoint / rename calls that get the transaction instead of
+    the adapter: the changes are staged while the block runs and applied when it exits without an error,
+    inside adapter.batch() (one undo record, redraws suspended). If applying fails part way, the bitmaps
+    already changed are set back before the error is raised, so the scene and the reference index stay in step.
+    elapsed is the time the apply phase took.
+    """
+    def __init__(self, adapter, name="修改贴图路径"):
+        self.adapter = adapter
+        self.name = name
+        self.changes = []  # (ReferenceIndex, TextureReference, new filename)
+        self.applied = 0
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.apply()
+        else:
+            self.changes = []
+        return False
+
+    def __len__(self):
+        return len(self.changes)
+
+    def stage(self, index, reference, filename):
+        self.changes.append((index, reference, filename))
+
+    def apply(self):
+        """Apply every staged change; returns the number of references changed"""
+        changes, self.changes = self.changes, []
+        if not changes:
+            return 0
+        start = time.perf_counter()
+        try:
+            with self.adapter.batch(self.name):
+                done = []
+                try:
+                    for _, reference, filename in changes:
+                        self.adapter.set_texture_filename(reference.texture, filename)
+                        done.append(reference)
+                except Exception:
+                    # 恢复已修改的贴图路径，引用索引中仍是原来的路径
+                    for reference in reversed(done):
+                        try:
+                            self.adapter.set_texture_filename(reference.texture, reference.filename)
+                        except Exception:
+                            continue
+                    raise
+        finally:
+            self.elapsed = time.perf_counter() - start
+        for index, reference, filename in changes:
+            index.move_reference(reference, filename)
+        self.applied += len(changes)
+        return len(changes)
+
+# 变更计划校验发现的冲突
+CONFLICT_TARGET_EXISTS = "目标文件已存在，引用将指向该文件"
+CONFLICT_TARGET_MISSING = "目标文件不存在"
+CONFLICT_NO_DIRECTORY = "目录不存在"
+CONFLICT_COPY_SOURCE_MISSING = "复制源文件不存在"
+CONFLICT_COPY_TARGET_CLASH = "多个不同的文件复制到同一目标"
+
+class ChangePlan:
+    """
+    The complete change set of one operation (rename, revert, import, dedupe), built as data before anything
+    is touched: every bitmap reference to change with its old and new path, the archive copies the operation
+    needs and the new current name of each affected record.
+    validate() checks the whole plan against one directory listing per folder (exists() answers from the same
+    listings while the plan is built), describe() is the preview shown to the user, and apply() changes every
+    reference in one SceneTransaction. Copies are made by the caller before apply(), e.g. on a worker thread.
+    listing: the DirectoryListing to answer from (the scanner's, shared with scans); a new one by default
+    """
+    def __init__(self, operation, listing=None):
+        self.operation = operation
+        self.listing = listing if listing is not None else DirectoryListing()
+        self.changes = []  # (TextureReference, new path)
+        self.copies = []  # (source, target)
+        self.names = {}  # hash -> (journal event, new current name)
+        self.conflicts = []  # (path, reason)
+        self.archived = None  # ArchiveResult of the copies, set by the caller that made them
+        self._new_files = set()  # hashes renamed to names no file has yet (only the references are renamed)
+
+    def __len__(self):
+        return len(self.changes)
+
+    def rename(self, references, file_name, hash_value, event="rename", new_file=False):
+        """
+        Plan renaming every reference to file_name inside its own directory.
+        new_file: the name is new (the dialog's rename edits references, not files), so an existing file
+        with that name is the conflict; otherwise the renamed files are expected to exist (revert, import).
+        """
+        if new_file:
+            self._new_files.add(hash_value)
+        for reference in references:
+            new_path = os.path.join(os.path.dirname(reference.filename), file_name)
+            if reference.filename != new_path:
+                self.changes.append((reference, new_path))
+        self.names[hash_value] = (event, file_name)
+
+    def repoint(self, references, file_path, hash_value, event="repoint"):
+        """Plan pointing every reference at file_path"""
+        for reference in references:
+            if reference.filename != file_path:
+                self.changes.append((reference, file_path))
+        self.names[hash_value] = (event, os.path.basename(file_path))
+
+    def copy(self, source, target):
+        self.copies.append((source, target))
+
+    @staticmethod
+    def resolved_path(reference, new_path):
+        """
+        Full path of a planned filename for the existence checks: a relative new path (a rename keeps the
+        reference's relative directory) is resolved the way the scan resolved the reference's own filename.
+        """
+        if os.path.isabs(new_path) or not reference.path:
+            return new_path
+        try:
+            relative = os.path.relpath(new_path, os.path.dirname(reference.filename) or os.curdir)
+        except ValueError:
+            return new_path  # 不同驱动器上的相对路径
+        return os.path.normpath(os.path.join(os.path.dirname(reference.path), relative))
+
+    def directory_exists(self, directory):
+        return self.listing.directory_exists(directory)
+
+    def exists(self, file_path):
+        """Existence check from the directory listing; each directory is listed once"""
+        return self.listing.exists(file_path)
+
+    def validate(self):
+        """Check every change and copy against the directory listings; returns the conflicts"""
+        self.conflicts = []
+        created = {}  # normalized target -> normalized source
+        for source, target in self.copies:
+            target_key = os.path.normcase(os.path.abspath(target))
+            source_key = os.path.normcase(os.path.abspath(source))
+            if created.setdefault(target_key, source_key) != source_key:
+                self.conflicts.append((target, CONFLICT_COPY_TARGET_CLASH))
+        for source, target in self.copies:
+            if os.path.normcase(os.path.abspath(source)) not in created and not self.exists(source):
+                self.conflicts.append((source, CONFLICT_COPY_SOURCE_MISSING))
+        checked = set()
+        for reference, new_path in self.changes:
+            # 相对路径按引用自身的解析方式检查（与场景目录相对，而不是当前工作目录）
+            file_path = self.resolved_path(reference, new_path)
+            key = os.path.normcase(os.path.abspath(file_path))
+            if key in checked or key in created:
+                continue
+            checked.add(key)
+            if not self.directory_exists(os.path.dirname(file_path)):
+                self.conflicts.append((new_path, CONFLICT_NO_DIRECTORY))
+            elif reference.hash in self._new_files:
+                # 重命名只修改贴图引用，不重命名文件；目标名称已被其他文件使用时提示
+                if self.exists(file_path):
+                    self.conflicts.append((new_path, CONFLICT_TARGET_EXISTS))
+            elif not self.exists(file_path):
+                self.conflicts.append((new_path, CONFLICT_TARGET_MISSING))
+        return self.conflicts
+
+    def copy_stages(self):
+        """The copies in stages: a copy whose source is the target of another copy runs in a later stage"""
+        key = lambda path: os.path.normcase(os.path.abspath(path))
+        targets = {key(target) for _, target in self.copies}
+        created = set()
+        pending = list(self.copies)
+        stages = []
+        while pending:
+            ready = [copy for copy in pending if key(copy[0]) not in targets or key(copy[0]) in created]
+            if not ready:
+                ready = pending  # 循环复制，无法排序
+            stages.append(ready)
+            created.update(key(target) for _, target in ready)
+            pending = [copy for copy in pending if copy not in ready]
+        return stages
+
+    def files(self):
+        """Distinct new paths of the plan"""
+        return {os.path.normcase(os.path.abspath(new_path)) for _, new_path in self.changes}
+
+    def summary(self):
+        """One paragraph for the confirmation prompt"""
+        lines = [f"{self.operation}: {len(self.names)} 条记录，{len(self.changes)} 个贴图引用，{len(self.files())} 个目标文件"]
+        if self.copies:
+            lines.append(f"需要复制 {len(self.copies)} 个文件")
+        if self.conflicts:
+            lines.append(f"发现 {len(self.conflicts)} 个冲突:")
+            lines.extend(f"  {os.path.basename(path)}: {reason}" for path, reason in self.conflicts[:10])
+            if len(self.conflicts) > 10:
+                lines.append(f"  ... 另有 {len(self.conflicts) - 10} 个")
+        return "\n".join(lines)
+
+    def describe(self):
+        """Full preview: every copy, changed reference (old -> new, material / slot) and conflict"""
+        lines = [f"复制: {source} -> {target}" for source, target in self.copies]
+        lines.extend(f"{reference.describe()}: {reference.filename} -> {new_path}" for reference, new_path in self.changes)
+        lines.extend(f"冲突: {path}: {reason}" for path, reason in self.conflicts)
+        return "\n".join(lines)
+
+    def events(self):
+        """(event, hash, name) journal events of the hashes whose references the plan changes"""
+        changed = {reference.hash for reference, _ in self.changes}
+        return [(event, hash_value, name) for hash_value, (event, name) in self.names.items()
+                if hash_value in changed and not is_hash_error(hash_value)]
+
+    def apply(self, adapter, index):
+        """Apply every planned path change in one SceneTransaction and return it (elapsed is the apply time)"""
+        with SceneTransaction(adapter, self.operation) as transaction:
+            for reference, new_path in self.changes:
+                index.set_filename(transaction, reference, new_path)
+        return transaction
+
+class SceneAdapter:
+    """
+    Interface between the scan core and a scene.
+    Textures are opaque handles owned by the adapter; the core only passes them back.
+    """
+    def get_scene_file(self):
+        """Full path of the scene file, or "" for an unsaved scene"""
+        raise NotImplementedError
+
+    def get_scene_dir(self):
+        """Directory used to resolve relative texture paths, or None"""
+        scene_file = self.get_scene_file()
+        return os.path.dirname(scene_file) if scene_file else None
+
+    def get_project_dir(self):
+        """Project folder shared by several scenes (e.g. for the texture store), or None to use the scene folder"""
+        return None
+
+    def iter_texture_references(self, progress=None):
+        """Yield a TextureReference for every bitmap reference in the scene"""
+        for _, material in self.iter_materials(progress):
+            for reference in self.get_material_references(material):
+                yield reference
+
+    def iter_materials(self, progress=None):
+        """
+        Yield (key, material) for every material, keyed by a handle that stays stable while the scene is open.
+        Adapters that cannot enumerate materials return None; incremental rescans then collect every reference again.
+        """
+        return None
+
+    def get_material_references(self, material):
+        """TextureReferences of one material and its sub-materials / texmaps"""
+        raise NotImplementedError
+
+    def bulk_material_references(self, material):
+        """
+        TextureReferences of a material whose bitmap filenames were already read together with the material list
+        (no further scene access), or None if they have to be read or refreshed from the scene.
+        """
+        return None
+
+    def material_changed(self, key):
+        """
+        True if the material may have changed since the last reset_material_changes().
+        Adapters without change tracking always return True, so the material is traversed again.
+        """
+        return True
+
+    def reset_material_changes(self):
+        """Start tracking material changes from now on"""
+        pass
+
+    def stats_text(self):
+        """Short summary of the scene access cost of the last traversal, or "" if the adapter does not measure it"""
+        return ""
+
+    def get_texture_filename(self, texture):
+        raise NotImplementedError
+
+    def set_texture_filename(self, texture, filename):
+        raise NotImplementedError
+
+    def undo(self):
+        """Context manager grouping scene changes into one undo step"""
+        return contextlib.nullcontext()
+
+    def batch(self, name=""):
+        """
+        Context manager for a batch of scene changes (see SceneTransaction): one undo step named name;
+        adapters may also suspend scene updates until the batch ends, restoring them even if it fails.
+        """
+        return self.undo()
+
+class ManifestSceneAdapter(SceneAdapter):
+    """
+    Scene adapter over an exported JSON scene manifest, for offline batch runs:
+    {"format": "texture_scene_manifest", "version": 1, "scene": "D:/proj/a.max",
+     "textures": [{"filename": "D:/proj/maps/a.png", "material": "Wall", "slot": "diffuseMap"}, ...]}
+    Texture handles are the manifest's texture dicts; filename changes are written back into them.
+
+    path_map: [(prefix, replacement), ...] to remap Windows paths to render-node mounts,
+    e.g. [("//nas/share", "/mnt/share")]. Backslashes are treated as slashes and matching is case-insensitive.
+    """
+    def __init__(self, manifest_path, path_map=None):
+        self.manifest_path = manifest_path
+        self.path_map = [(prefix.replace("\\", "/").lower(), replacement) for prefix, replacement in (path_map or [])]
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if not isinstance(self.manifest, dict) or self.manifest.get("format") != MANIFEST_FORMAT:
+            raise ValueError(f"不是场景清单文件: {manifest_path}")
+
+    def map_path(self, filename):
+        """Apply the path map to a Windows path from the manifest"""
+        if not self.path_map:
+            return filename
+        normalized = filename.replace("\\", "/")
+        for prefix, replacement in self.path_map:
+            if normalized.lower().startswith(prefix):
+                return replacement + normalized[len(prefix):]
+        return filename
+
+    def get_scene_file(self):
+        return self.map_path(self.manifest.get("scene", ""))
+
+    def iter_texture_references(self, progress=None):
+        textures = self.manifest.get("textures", [])
+        for i, texture in enumerate(textures):
+            if progress:
+                progress("正在读取场景清单", i + 1, len(textures))
+            if texture.get("filename"):
+                yield TextureReference(texture, self.map_path(texture["filename"]),
+                                       texture.get("material", ""), texture.get("slot", ""))
+
+    def get_texture_filename(self, texture):
+        return self.map_path(texture.get("filename", ""))
+
+    def set_texture_filename(self, texture, filename):
+        texture["filename"] = filename
+
+    def save(self, file_path=None):
+        """Write the (possibly modified) manifest back to disk"""
+        with open(file_path or self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+
+def write_scene_manifest(adapter, file_path):
+    """Export the adapter's scene as a JSON scene manifest for offline batch runs"""
+    textures = [{"filename": reference.filename, "material": reference.material, "slot": reference.slot}
+                for reference in adapter.iter_texture_references()]
+    manifest = {
+        "format": MANIFEST_FORMAT,
+        "version": MANIFEST_FORMAT_VERSION,
+        "scene": adapter.get_scene_file(),
+        "textures": textures
+    }
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return len(textures)
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# 归档：重复贴图复制到maps文件夹
+ARCHIVE_WORKER_COUNT = 8  # 并行复制的线程数，主要受磁盘和网络带宽限制
+ARCHIVE_HARDLINK = True  # 源文件和目标在同一卷上时创建硬链接，不复制数据
+
+def _copy_data(src, dst, cancel, buffer_size):
+    """
+    Copy the rest of src into dst and return the number of bytes.
+    copy_file_range / sendfile keep the data in the kernel (and let some file systems copy server-side);
+    when neither is available or supported between the two files the data goes through a reused buffer.
+    """
+    copied = 0
+    in_fd, out_fd = src.fileno(), dst.fileno()
+    kernel_copies = []
+    if hasattr(os, "copy_file_range"):
+        kernel_copies.append(lambda: os.copy_file_range(in_fd, out_fd, buffer_size))
+    if hasattr(os, "sendfile"):
+        kernel_copies.append(lambda: os.sendfile(out_fd, in_fd, None, buffer_size))
+    for kernel_copy in kernel_copies:
+        try:
+            while True:
+                if cancel is not None:
+                    cancel.check()
+                sent = kernel_copy()
+                if not sent:
+                    return copied
+                copied += sent
+        except OSError:
+            if copied:
+                raise
+            # 该文件系统不支持这种复制方式，尝试下一种
+
+    buffer = memoryview(bytearray(buffer_size))
+    while True:
+        if cancel is not None:
+            cancel.check()
+        count = src.readinto(buffer)
+        if not count:
+            return copied
+        dst.write(buffer[:count])
+        copied += count
+
+def copy_file(source, target, cancel=None, buffer_size=COPY_BUFFER_SIZE):
+    """
+    Copy a file with its metadata (like shutil.copy2), checking cancel between buffers, and return its size.
+    The data is written to a temporary file next to the target and renamed into place,
+    so a cancelled or failed copy never leaves a partial target behind.
+    """
+    temp_path = target + ".part"
+    try:
+        with open(source, "rb") as src, open(temp_path, "wb") as dst:
+            copied = _copy_data(src, dst, cancel, buffer_size)
+        shutil.copystat(source, temp_path)
+        os.replace(temp_path, target)
+        return copied
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def archive_file(source, target, cancel=None, hardlink=ARCHIVE_HARDLINK):
+    """
+    Put source at target: a hardlink when both are on the same volume (no data moves), otherwise a copy.
+    Returns ("link", 0) or ("copy", bytes copied).
+    """
+    if hardlink:
+        try:
+            os.link(source, target)
+            return "link", 0
+        except OSError:
+            pass  # 不同的卷或文件系统不支持硬链接
+    return "copy", copy_file(source, target, cancel)
+
+class ArchiveResult:
+    """Outcome of archive_files: the targets that were copied, linked or already present, and the throughput"""
+    def __init__(self):
+        self.copied = []  # (source, target)
+        self.linked = []
+        self.skipped = []  # targets that already had the same size and content
+        self.bytes_copied = 0
+        self.elapsed = 0.0
+
+    def merge(self, other):
+        """Add the outcome of another stage"""
+        self.copied.extend(other.copied)
+        self.linked.extend(other.linked)
+        self.skipped.extend(other.skipped)
+        self.bytes_copied += other.bytes_copied
+        self.elapsed += other.elapsed
+        return self
+
+    def summary(self):
+        megabytes = self.bytes_copied / (1024 * 1024)
+        throughput = megabytes / self.elapsed if self.elapsed > 0 else 0.0
+        return (f"归档: 复制 {len(self.copied)} 个，链接 {len(self.linked)} 个，跳过 {len(self.skipped)} 个已存在的文件，"
+                f"{megabytes:.1f} MB，{throughput:.1f} MB/s，{self.elapsed:.2f} 秒")
+
+def _content_digests(file_paths, algorithm, workers, cancel=None):
+    """
+    {path: digest} read from the files themselves, bypassing the hash cache: a copy gets the source's mtime
+    (copystat) and may get a reused inode, so a stale cache entry could match it. Failures map to "Error: ...".
+    """
+    file_paths = list(dict.fromkeys(file_paths))
+    digests = {}
+    if not file_paths:
+        return digests
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(file_paths))) as executor:
+        futures = {executor.submit(hash_file_digests, file_path, (algorithm,), cancel=cancel): file_path
+                   for file_path in file_paths}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                digests[futures[future]] = future.result()[0]
+            except OperationCancelled:
+                raise
+            except Exception as e:
+                digests[futures[future]] = "Error: " + str(e)
+    return digests
+
+def archive_files(copies, algorithm=DEFAULT_HASH_ALGORITHM, workers=ARCHIVE_WORKER_COUNT, listing=None, progress=None,
+                  cancel=None, hardlink=ARCHIVE_HARDLINK):
+    """
+    归档阶段：把(源文件, 目标)复制到归档文件夹
+    1. 目标已存在时，只有大小和哈希值都与源文件相同才跳过；内容不同时不覆盖，抛出FileExistsError
+    2. 在有限的线程池中并行创建硬链接或复制文件
+    3. 并行计算复制出的文件的哈希值，与源文件比较校验（硬链接是同一个文件，不需要校验）
+    第1步和第3步直接读取文件计算哈希值，不使用也不写入哈希缓存
+
+    algorithm: hash algorithm of the comparisons
+    listing: DirectoryListing used for the existence checks, invalidated for every folder written to
+    progress(message, current, total) and cancel as in TextureScanner; cancelling keeps the finished copies
+    hardlink: link instead of copying where the volume allows it
+    Returns an ArchiveResult.
+    """
+    start = time.perf_counter()
+    listing = listing if listing is not None else DirectoryListing()
+    result = ArchiveResult()
+    unique = {}
+    for source, target in copies:
+        kept = unique.setdefault(os.path.normcase(os.path.abspath(target)), (source, target))
+        if os.path.normcase(os.path.abspath(kept[0])) != os.path.normcase(os.path.abspath(source)):
+            raise FileExistsError(f"多个不同的文件归档到同一目标: {target}")
+    copies = list(unique.values())
+    listing.prefetch([path for pair in copies for path in pair], workers)
+
+    # 第一步：检查已存在的目标
+    pending = []
+    same_size = []
+    mismatched = []
+    for source, target in copies:
+        target_stat, _ = listing.stat(target)
+        if target_stat is None:
+            pending.append((source, target))
+            continue
+        source_stat, error = listing.stat(source)
+        if error is not None:
+            raise error
+        if source_stat.st_size == target_stat.st_size:
+            same_size.append((source, target))
+        else:
+            mismatched.append(target)
+    if same_size:
+        digests = _content_digests([path for pair in same_size for path in pair], algorithm, workers, cancel)
+        for source, target in same_size:
+            digest = digests.get(source)
+            if digest and not is_hash_error(digest) and digest == digests.get(target):
+                result.skipped.append(target)
+            else:
+                mismatched.append(target)
+    if mismatched:
+        raise FileExistsError(f"{len(mismatched)} 个归档目标已存在但内容不同，未覆盖: {mismatched[0]}")
+
+    # 第二步：并行链接或复制
+    for directory in {os.path.dirname(target) for _, target in pending}:
+        os.makedirs(directory, exist_ok=True)
+
+    def _archive(source, target):
+        if cancel is not None:
+            cancel.check()
+        return archive_file(source, target, cancel, hardlink)
+
+    if pending:
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+                futures = {executor.submit(_archive, source, target): (source, target) for source, target in pending}
+                try:
+                    for i, future in enumerate(concurrent.futures.as_completed(futures)):
+                        method, size = future.result()
+                        if method == "link":
+                            result.linked.append(futures[future])
+                        else:
+                            result.copied.append(futures[future])
+                            result.bytes_copied += size
+                        if progress:
+                            progress("正在归档贴图", i + 1, len(pending))
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            for _, target in pending:
+                listing.invalidate(target)
+
+    # 第三步：并行校验复制的文件
+    if result.copied:
+        digests = _content_digests([path for pair in result.copied for path in pair], algorithm, workers, cancel)
+        corrupted = [target for source, target in result.copied
+                     if is_hash_error(digests.get(target, "Error")) or digests.get(source) != digests.get(target)]
+        if corrupted:
+            for target in corrupted:
+                with contextlib.suppress(OSError):
+                    os.remove(target)
+                listing.invalidate(target)
+            raise OSError(f"{len(corrupted)} 个归档文件校验失败，已删除: {corrupted[0]}")
+
+    result.elapsed = time.perf_counter() - start
+    return result
+
+def store_manifest_path(scene_file):
+    """<场景名>_texture_store.json next to the scene"""
+    scene_name = os.path.splitext(os.path.basename(scene_file))[0]
+    return os.path.join(os.path.dirname(scene_file), scene_name + "_texture_store.json")
+
+class TextureStore:
+    """
+    Content-addressed texture store: every file is kept once as <root>/ab/cd/<digest><ext>, so identical textures
+    of all scenes share one stored file and different files can never clash on a name.
+    Scenes reference a stored file either by its digest path or through a hardlink with the original name in the
+    scene's maps folder (link_dir); each scene's references are listed in its store manifest
+    (<scene>_texture_store.json). Files are only added through a ChangePlan's copies, so they are archived,
+    skipped when already stored and verified by archive_files.
+    """
+    def __init__(self, root, algorithm=DEFAULT_HASH_ALGORITHM):
+        self.root = root
+        self.algorithm = algorithm
+        self.entries = {}  # hash -> manifest entry of the textures added since construction
+        self._links = {}  # normalized link path -> hash linked there by this store
+
+    def object_path(self, digest, file_name):
+        """Path of the stored file with this digest; the extension of file_name is kept for 3ds Max and image readers"""
+        parts = []
+        offset = 0
+        for width in TEXTURE_STORE_SHARDS:
+            parts.append(digest[offset:offset + width])
+            offset += width
+        return os.path.join(self.root, *parts, digest + os.path.splitext(file_name)[1].lower())
+
+    def add(self, plan, hash_value, source, file_name, link_dir=None):
+        """
+        Plan storing source (whose content hashes to hash_value) and return the path scene references should use:
+        the digest path, or link_dir/file_name hardlinked to it (a copy when the volumes differ)
+        """
+        object_path = self.object_path(hash_value, file_name)
+        plan.copy(source, object_path)
+        scene_path = object_path
+        if link_dir:
+            scene_path = self._link_path(plan, link_dir, file_name, hash_value, source)
+            plan.copy(object_path, scene_path)
+        self.entries[hash_value] = {
+            "hash": hash_value,
+            "name": file_name,
+            "object": os.path.relpath(object_path, self.root).replace("\\", "/"),
+            "path": scene_path
+        }
+        return scene_path
+
+    def _link_path(self, plan, link_dir, file_name, hash_value, source):
+        """
+        link_dir/file_name, or link_dir/<stem>_<hash[:8]><ext> when that name is already used by other content:
+        linked for another hash in this plan, or an existing file of a different size
+        (an existing file of the same size is compared by archive_files, which refuses to overwrite other content)
+        """
+        link_path = os.path.join(link_dir, file_name)
+        key = os.path.normcase(os.path.abspath(link_path))
+        taken = self._links.get(key)
+        if taken is None:
+            existing, _ = plan.listing.stat(link_path)
+            source_stat, _ = plan.listing.stat(source)
+            if existing is not None and source_stat is not None and existing.st_size != source_stat.st_size:
+                taken = ""
+        if taken is not None and taken != hash_value:
+            stem, extension = os.path.splitext(file_name)
+            link_path = os.path.join(link_dir, f"{stem}_{hash_value[:8]}{extension}")
+            key = os.path.normcase(os.path.abspath(link_path))
+        self._links[key] = hash_value
+        return link_path
+
+    def write_manifest(self, manifest_path, scene=""):
+        """Merge the added textures into the scene's store manifest (entries are keyed by hash)"""
+        textures = {}
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if isinstance(manifest, dict) and manifest.get("format") == STORE_MANIFEST_FORMAT \
+                    and manifest.get("algorithm") == self.algorithm:
+                textures = {entry["hash"]: entry for entry in manifest.get("textures", [])}
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"读取贴图库清单失败，将重新生成: {str(e)}")
+        textures.update(self.entries)
+
+        manifest = {
+            "format": STORE_MANIFEST_FORMAT,
+            "version": STORE_MANIFEST_VERSION,
+            "algorithm": self.algorithm,
+            "scene": scene,
+            "store": self.root,
+            "textures": list(textures.values())
+        }
+        temp_path = manifest_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, manifest_path)
+        return len(textures)
+
+class ProjectIndex:
+    """
+    Persistent index of the textures every scene of a project uses, backed by SQLite:
+    digest -> file paths -> scenes. Each scan replaces the rows of its own scene (only the files that
+    changed are written), so "which scenes use this texture" and "which files are byte-identical across
+    the project" are answered from the index without opening any scene.
+    Digests of different algorithms are kept apart; queries only match digests of the same algorithm.
+    The index usually lives in a shared project folder, so it uses the rollback journal (WAL needs shared memory
+    that network file systems do not provide) and writers take the write lock up front, waiting for each other.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            # 多个3ds Max实例和离线审计进程可能同时写入同一个项目索引，忙时最多等待30秒
+            # 项目文件夹可能在网络共享上，不能使用WAL（依赖共享内存），使用回滚日志
+            self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=DELETE")
+            schema_version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if schema_version != PROJECT_INDEX_SCHEMA_VERSION:
+                # 索引可以通过重新扫描场景重建
+                self._conn.execute("DROP TABLE IF EXISTS scene_file")
+                self._conn.execute("DROP TABLE IF EXISTS scene")
+                self._conn.execute(f"PRAGMA user_version = {PROJECT_INDEX_SCHEMA_VERSION}")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS scene ("
+                "key TEXT PRIMARY KEY, path TEXT, algorithm TEXT, updated REAL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS scene_file ("
+                "scene TEXT, path_key TEXT, path TEXT, algorithm TEXT, digest TEXT, size INTEGER, "
+                "PRIMARY KEY (scene, path_key)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_scene_file_digest ON scene_file (algorithm, digest)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_scene_file_path ON scene_file (path_key)")
+        return self._conn
+
+    @staticmethod
+    def scene_key(scene_file):
+        return os.path.normcase(os.path.abspath(scene_file))
+
+    def update_scene(self, scene_file, file_hashes, file_stats, algorithm):
+        """
+        Replace the indexed files of one scene with the result of its latest scan.
+        file_hashes: {resolved path: digest}; files that could not be hashed are left out
+        file_stats: {resolved path: (size, mtime_ns) or None}
+        Returns (files written, files removed).
+        """
+        conn = self._connection()
+        scene = self.scene_key(scene_file)
+        rows = {}
+        for file_path, digest in file_hashes.items():
+            if is_hash_error(digest):
+                continue
+            stat = file_stats.get(file_path)
+            rows[normalize_texture_path(file_path)[1]] = (file_path, algorithm, digest, stat[0] if stat else None)
+
+        with conn:
+            # 先取得写锁再读取：回滚日志模式下两个先读后写的事务会死锁，其中一个立即失败而不是等待
+            conn.execute("BEGIN IMMEDIATE")
+            existing = {row[0]: row[1:] for row in conn.execute(
+                "SELECT path_key, path, algorithm, digest, size FROM scene_file WHERE scene = ?", (scene,))}
+            removed = [(scene, key) for key in existing if key not in rows]
+            written = [(scene, key) + row for key, row in rows.items() if existing.get(key) != row]
+            conn.executemany("DELETE FROM scene_file WHERE scene = ? AND path_key = ?", removed)
+            conn.executemany("INSERT OR REPLACE INTO scene_file VALUES (?, ?, ?, ?, ?, ?)", written)
+            conn.execute("INSERT OR REPLACE INTO scene VALUES (?, ?, ?, ?)",
+                         (scene, scene_file, algorithm, time.time()))
+        return len(written), len(removed)
+
+    def remove_scene(self, scene_file):
+        conn = self._connection()
+        scene = self.scene_key(scene_file)
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM scene_file WHERE scene = ?", (scene,))
+            conn.execute("DELETE FROM scene WHERE key = ?", (scene,))
+
+    def where_used(self, digest, algorithm=DEFAULT_HASH_ALGORITHM):
+        """[(scene path, file path)] of every scene using a file with this digest"""
+        return self._connection().execute(
+            "SELECT scene.path, scene_file.path FROM scene_file JOIN scene ON scene.key = scene_file.scene "
+            "WHERE scene_file.algorithm = ? AND scene_file.digest = ? ORDER BY scene.path, scene_file.path",
+            (algorithm, digest)).fetchall()
+
+    def scenes_using(self, file_path):
+        """Paths of the scenes that reference this file"""
+        return [row[0] for row in self._connection().execute(
+            "SELECT scene.path FROM scene_file JOIN scene ON scene.key = scene_file.scene "
+            "WHERE scene_file.path_key = ? ORDER BY scene.path", (normalize_texture_path(file_path)[1],))]
+
+    def duplicates(self, algorithm=DEFAULT_HASH_ALGORITHM, scene_file=None):
+        """
+        {digest: [file paths]} of content stored in more than one file anywhere in the project;
+        with scene_file, only the digests that scene uses
+        """
+        query = ("SELECT digest, path_key, MIN(path) FROM scene_file WHERE algorithm = ? AND digest IN ("
+                 "SELECT digest FROM scene_file WHERE algorithm = ? {} "
+                 "GROUP BY digest HAVING COUNT(DISTINCT path_key) > 1) "
+                 "GROUP BY digest, path_key ORDER BY digest, path_key")
+        if scene_file:
+            rows = self._connection().execute(
+                query.format("AND digest IN (SELECT digest FROM scene_file WHERE scene = ?)"),
+                (algorithm, algorithm, self.scene_key(scene_file)))
+        else:
+            rows = self._connection().execute(query.format(""), (algorithm, algorithm))
+        groups = {}
+        for digest, _, file_path in rows:
+            groups.setdefault(digest, []).append(file_path)
+        return groups
+
+    def digest_of(self, file_path, algorithm=DEFAULT_HASH_ALGORITHM):
+        """Digest the file had when a scene was last scanned, or None (e.g. the hash of a now missing texture)"""
+        row = self._connection().execute(
+            "SELECT digest FROM scene_file WHERE path_key = ? AND algorithm = ? LIMIT 1",
+            (normalize_texture_path(file_path)[1], algorithm)).fetchone()
+        return row[0] if row else None
+
+    def stats_text(self):
+        scenes, files = self._connection().execute(
+            "SELECT (SELECT COUNT(*) FROM scene), (SELECT COUNT(DISTINCT path_key) FROM scene_file)").fetchone()
+        return f"项目索引 {scenes} 个场景，{files} 个文件"
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+def _list_library_directory(directory):
+    """([(lower-case name, path, size)] of the texture files in directory, [subdirectories]); unreadable folders are empty"""
+    files = []
+    subdirectories = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in LIBRARY_FILE_EXTENSIONS:
+                        files.append((entry.name.lower(), entry.path, entry.stat().st_size))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return files, subdirectories
+
+def _path_distance(path, other):
+    """Number of folder steps between two paths (up from one to the common folder, then down to the other)"""
+    parts = os.path.normcase(os.path.normpath(path)).replace("\\", "/").split("/")
+    other_parts = os.path.normcase(os.path.normpath(other)).replace("\\", "/").split("/")
+    common = 0
+    for part, other_part in zip(parts, other_parts):
+        if part != other_part:
+            break
+        common += 1
+    return len(parts) + len(other_parts) - 2 * common
+
+class TextureResolver:
+    """
+    Finds missing textures in configured library roots.
+    Each root is indexed once (folders are listed in parallel) into a SQLite table keyed by lower-case file
+    name, kept between sessions; a missing texture is then looked up by its name without walking any folder.
+    When a name has several candidates, the candidate whose content matches the texture's known hash wins,
+    then the one nearest to the missing path. Roots older than LIBRARY_INDEX_MAX_AGE_DAYS are indexed again.
+    """
+    def __init__(self, db_path=LIBRARY_INDEX_PATH, workers=LIBRARY_INDEX_WORKERS):
+        self.db_path = db_path
+        self.workers = workers
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            index_dir = os.path.dirname(self.db_path)
+            if index_dir:
+                os.makedirs(index_dir, exist_ok=True)
+            # 索引在后台线程中建立和查询（同一时间只有一个线程访问）
+            self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            schema_version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if schema_version != LIBRARY_INDEX_SCHEMA_VERSION:
+                self._conn.execute("DROP TABLE IF EXISTS library_file")
+                self._conn.execute("DROP TABLE IF EXISTS library_root")
+                self._conn.execute(f"PRAGMA user_version = {LIBRARY_INDEX_SCHEMA_VERSION}")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS library_root (root TEXT PRIMARY KEY, path TEXT, indexed REAL, files INTEGER)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS library_file (path TEXT PRIMARY KEY, root TEXT, name TEXT, size INTEGER)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_library_file_name ON library_file (name)")
+        return self._conn
+
+    @staticmethod
+    def _root_key(root):
+        return os.path.normcase(os.path.abspath(root))
+
+    def roots(self):
+        """[(root path, time indexed or None, file count)] of the configured roots"""
+        return self._connection().execute("SELECT path, indexed, files FROM library_root ORDER BY path").fetchall()
+
+    def add_root(self, root):
+        with self._connection() as conn:
+            conn.execute("INSERT OR IGNORE INTO library_root VALUES (?, ?, NULL, 0)", (self._root_key(root), root))
+
+    def remove_root(self, root):
+        key = self._root_key(root)
+        with self._connection() as conn:
+            conn.execute("DELETE FROM library_file WHERE root = ?", (key,))
+            conn.execute("DELETE FROM library_root WHERE root = ?", (key,))
+
+    def stale_roots(self, max_age_days=LIBRARY_INDEX_MAX_AGE_DAYS):
+        """Roots never indexed or indexed more than max_age_days ago"""
+        cutoff = time.time() - max_age_days * 86400
+        return [path for path, indexed, _ in self.roots() if indexed is None or indexed < cutoff]
+
+    def index_roots(self, roots=None, progress=None, cancel=None):
+        """
+        (Re)build the index of roots (default: every configured root); returns the number of files indexed.
+        Folders are listed by a thread pool, each listed folder submitting its subfolders.
+        """
+        roots = [path for path, _, _ in self.roots()] if roots is None else roots
+        total = 0
+        for root in roots:
+            files = self._walk(root, progress, cancel)
+            key = self._root_key(root)
+            with self._connection() as conn:
+                conn.execute("DELETE FROM library_file WHERE root = ?", (key,))
+                conn.executemany("INSERT OR REPLACE INTO library_file VALUES (?, ?, ?, ?)",
+                                 [(path, key, name, size) for name, path, size in files])
+                conn.execute("INSERT OR REPLACE INTO library_root VALUES (?, ?, ?, ?)", (key, root, time.time(), len(files)))
+            total += len(files)
+        return total
+
+    def _walk(self, root, progress=None, cancel=None):
+        files = []
+        listed = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {executor.submit(_list_library_directory, root)}
+            try:
+                while pending:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        directory_files, subdirectories = future.result()
+                        files.extend(directory_files)
+                        pending.update(executor.submit(_list_library_directory, directory) for directory in subdirectories)
+                        listed += 1
+                    if cancel is not None:
+                        cancel.check()
+                    if progress:
+                        progress(f"正在索引 {root}", listed, listed + len(pending))
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+        return files
+
+    def candidates(self, file_name):
+        """Indexed paths of files named file_name (case-insensitive)"""
+        return [row[0] for row in self._connection().execute(
+            "SELECT path FROM library_file WHERE name = ?", (os.path.basename(file_name).lower(),))]
+
+    def resolve(self, missing_paths, expected_hashes=None, hash_files=None, listing=None):
+        """
+        Find a replacement for every missing path.
+        expected_hashes: {missing path: digest the file had}; with hash_files (callable taking a list of paths and
+        returning {path: digest}) candidates are compared in one parallel batch and only matching content is used
+        listing: DirectoryListing dropping candidates deleted since they were indexed
+        Returns ({missing path: replacement}, [missing paths without a replacement]).
+        """
+        expected_hashes = expected_hashes or {}
+        listing = listing if listing is not None else DirectoryListing()
+        found = {}
+        for missing_path in missing_paths:
+            found[missing_path] = self.candidates(missing_path)
+        listing.prefetch([path for paths in found.values() for path in paths], self.workers)
+        found = {missing_path: [path for path in paths if listing.exists(path)] for missing_path, paths in found.items()}
+
+        to_hash = [path for missing_path, paths in found.items() if paths and hash_files and expected_hashes.get(missing_path)
+                   for path in paths]
+        digests = hash_files(to_hash) if to_hash else {}
+
+        resolved = {}
+        unresolved = []
+        for missing_path, paths in found.items():
+            expected = expected_hashes.get(missing_path)
+            if expected and hash_files:
+                paths = [path for path in paths if digests.get(path) == expected]
+            if not paths:
+                unresolved.append(missing_path)
+                continue
+            resolved[missing_path] = min(paths, key=lambda path: (_path_distance(missing_path, path), len(path), path))
+        return resolved, unresolved
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+class ScanPlan:
+    """
+    Unique-file work plan for a scan.
+    All bitmap references are collected first and collapsed to unique files,
+    so every file is stat'd and hashed exactly once no matter how many maps use it.
+    """
+    def __init__(self, base_dir=None, scene_file=""):
+        self.base_dir = base_dir
+        self.scene_file = scene_file  # the scene the references were collected from
+        self.references = []  # TextureReference, in scan order
+        self.files = {}  # key -> resolved path, in first-seen order
+        self.materials = None  # material key -> [TextureReference], when the adapter enumerates materials
+
+    def add(self, reference):
+        reference.path, reference.key = normalize_texture_path(reference.filename, self.base_dir)
+        reference.path = self.files.setdefault(reference.key, reference.path)
+        self.references.append(reference)
+
+    def unique_paths(self):
+        return list(self.files.values())
+
+    def resolve(self, file_hashes):
+        """Set every reference's hash from the per-file hash results and return them as a ReferenceIndex"""
+        index = ReferenceIndex(self.base_dir)
+        for reference in self.references:
+            reference.hash = file_hashes[reference.path]
+            index.add(reference)
+        return index
+
+class ScanResult:
+    """Everything a scan produced: records in scan order plus the lookups built from them"""
+    def __init__(self):
+        self.records = RecordStore()
+        self.references = ReferenceIndex()  # every bitmap reference, by hash and by file
+        self.snapshot = None  # ScanSnapshot for the next incremental rescan
+        self.scanned_files = []  # unique resolved file paths
+        self.file_hashes = {}  # resolved path -> hash
+        self.file_stats = {}  # resolved path -> (size, mtime_ns)
+        self.migrated_records = None  # existing records re-keyed to the current algorithm, if migrated
+
+class ScanSnapshot:
+    """
+    What a scan saw, kept for the next incremental rescan:
+    the scene file, each material's bitmap references and each file's (size, mtime_ns) and hash.
+    """
+    def __init__(self, algorithm, materials=None, file_stats=None, file_hashes=None, scene_file=""):
+        self.algorithm = algorithm
+        self.scene_file = scene_file
+        self.materials = materials  # material key -> [TextureReference], or None
+        self.file_stats = file_stats or {}  # resolved path -> (size, mtime_ns), None if the file could not be read
+        self.file_hashes = file_hashes or {}  # resolved path -> hash
+
+    def file_unchanged(self, file_path, stat_key):
+        return file_path in self.file_hashes and file_path in self.file_stats and self.file_stats[file_path] == stat_key
+
+class ScanDelta:
+    """Minimal change set between the stored records and a rescan"""
+    def __init__(self):
+        self.added = []  # new TextureRecords
+        self.removed = []  # stored TextureRecords whose file is no longer used
+        self.updated = []  # (stored record, rescanned record) pairs with different values
+        self.rehashed_files = []  # files that were new or whose size/mtime changed
+        self.files_changed = False  # the set of scene files or their contents changed
+        self.elapsed = 0.0
+
+    def is_empty(self):
+        return not (self.added or self.removed or self.updated or self.files_changed)
+
+    def summary(self):
+        return f"新增 {len(self.added)}，移除 {len(self.removed)}，更新 {len(self.updated)}，重新计算哈希 {len(self.rehashed_files)}"
+
+    def apply(self, store):
+        """Apply the delta to a RecordStore (the dialog's table model applies it itself to emit row signals)"""
+        store.remove(self.removed)
+        for record, new_values in self.updated:
+            store.update(record, new_values)
+        store.extend(self.added)
+
+class TextureScanner:
+    """
+    Headless scan engine: collects bitmap references through a SceneAdapter, hashes the unique
+    files in parallel through the persistent hash cache and builds texture records.
+    progress callbacks are called as progress(message, current, total).
+    """
+    def __init__(self, hash_cache=None, hash_algorithm=DEFAULT_HASH_ALGORITHM, hash_workers=HASH_WORKER_COUNT,
+                 listing=None):
+        self.hash_cache = hash_cache if hash_cache is not None else HashCache()
+        self.listing = listing if listing is not None else DirectoryListing()  # 文件状态从目录列表中获取
+        self.hash_algorithm = hash_algorithm  # 当前使用的哈希算法
+        self.hash_workers = hash_workers  # 并行哈希的线程数
+        self.modification_count = 1  # 记录修改次数的计数器
+
+    def hash_files(self, file_paths, progress=None, algorithm=None, extra_algorithms=(), file_stats=None, cancel=None):
+        """
+        并行计算多个贴图文件的哈希值
+        1. 每个目录读取一次列表（并行），从列表中获取所有文件的状态
+        2. 在调用线程中查询哈希缓存（SQLite连接只在一个线程中使用）
+        3. 在线程池中计算未命中缓存的文件哈希值
+
+        algorithm: 使用的哈希算法，默认为当前选择的算法
+        extra_algorithms: 读取文件时同时计算并缓存的其他算法（用于迁移旧记录）
+        file_stats: 传入字典时填入每个文件的 (大小, 修改时间) ，供增量扫描使用
+        cancel: CancelToken，取消时停止提交和读取文件并抛出OperationCancelled（已完成的哈希值仍写入缓存）
+        返回 {文件路径: 哈希值或错误信息} 字典，调用方按自己的顺序合并结果
+        """
+        algorithm = algorithm or self.hash_algorithm
+        algorithms = [algorithm] + [extra for extra in extra_algorithms if extra != algorithm]
+        results = {}
+        file_paths = list(dict.fromkeys(file_paths))  # 去重并保持顺序
+        if not file_paths:
+            return results
+
+        try:
+            self.listing.prefetch(file_paths, self.hash_workers)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.hash_workers) as executor:
+                pending = {}
+                stat_inode = functools.partial(self.listing.stat, inode=True)  # 文件编号是缓存键的一部分
+                for file_path, (stat_result, error) in zip(file_paths, executor.map(stat_inode, file_paths)):
+                    if cancel is not None:
+                        cancel.check()
+                    if file_stats is not None:
+                        file_stats[file_path] = stat_key(stat_result)
+                    if isinstance(error, FileNotFoundError):
+                        results[file_path] = "File not found: " + file_path
+                    elif error is not None:
+                        results[file_path] = "Error: " + str(error)
+                    else:
+                        cached = self.hash_cache.lookup(file_path, stat_result, algorithm)
+                        if cached:
+                            results[file_path] = cached
+                        else:
+                            future = executor.submit(hash_file_digests, file_path, algorithms, cancel=cancel)
+                            pending[future] = (file_path, stat_result)
+
+                try:
+                    for i, future in enumerate(concurrent.futures.as_completed(pending)):
+                        file_path, stat_result = pending[future]
+                        try:
+                            digests = future.result()
+                        except OperationCancelled:
+                            raise
+                        except Exception as e:
+                            results[file_path] = "Error: " + str(e)
+                        else:
+                            # 写入缓存失败不影响哈希值（store不会抛出异常）
+                            for name, digest in zip(algorithms, digests):
+                                self.hash_cache.store(file_path, stat_result, digest, name)
+                            results[file_path] = digests[0]
+                        if progress:
+                            progress("正在计算贴图哈希值", i + 1, len(pending))
+                        if cancel is not None:
+                            cancel.check()
+                except OperationCancelled:
+                    # 取消尚未开始的任务，正在读取的文件会在下一个缓冲区处停止
+                    for future in pending:
+                        future.cancel()
+                    raise
+        finally:
+            self.hash_cache.flush()
+        return results
+
+    def collect(self, adapter, progress=None, snapshot=None):
+        """
+        Collect every bitmap reference of the scene into a unique-file plan, without any file I/O.
+        With a snapshot, materials the adapter reports unchanged reuse their previous references
+        and only have their bitmap filenames re-read instead of walking the material graph again.
+        Materials read in bulk already carry their current filenames and are used as they are.
+        """
+        plan = ScanPlan(adapter.get_scene_dir(), adapter.get_scene_file())
+        materials = adapter.iter_materials(progress)
+        if materials is None:
+            for reference in adapter.iter_texture_references(progress):
+                plan.add(reference)
+            return plan
+
+        previous = snapshot.materials if snapshot is not None and snapshot.materials is not None else {}
+        plan.materials = {}
+        for key, material in materials:
+            references = adapter.bulk_material_references(material)
+            if references is None and key in previous and not adapter.material_changed(key):
+                references = self._refresh_references(adapter, previous[key])
+            if references is None:
+                references = adapter.get_material_references(material)
+            plan.materials[key] = references
+            for reference in references:
+                plan.add(reference)
+        adapter.reset_material_changes()
+        return plan
+
+    def _refresh_references(self, adapter, references):
+        """Re-read the filenames of previously found references; None if a texture is gone and the material must be walked again"""
+        refreshed = []
+        try:
+            for reference in references:
+                filename = adapter.get_texture_filename(reference.texture)
+                if not filename:
+                    return None
+                refreshed.append(TextureReference(reference.texture, filename, reference.material, reference.slot))
+        except Exception:
+            return None
+        return refreshed
+
+    def stat_files(self, file_paths):
+        """{path: (size, mtime_ns) or None}, answered from one listing per directory"""
+        self.listing.prefetch(file_paths, self.hash_workers)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.hash_workers) as executor:
+            return {file_path: stat_key(stat_result)
+                    for file_path, (stat_result, _) in zip(file_paths, executor.map(self.listing.stat, file_paths))}
+
+    def migration_algorithm(self, record_algorithm):
+        """记录使用的算法与当前算法不同时返回需要迁移的算法；算法在当前环境不可用时无法迁移，返回None"""
+        if not record_algorithm or record_algorithm == self.hash_algorithm:
+            return None
+        if record_algorithm not in available_algorithms():
+            print(f"记录使用的哈希算法 {record_algorithm} 不可用，无法迁移记录")
+            return None
+        return record_algorithm
+
+    def migrate_records(self, records, file_paths, file_hashes, record_algorithm, cancel=None):
+        """
+        将使用其他哈希算法的记录迁移到当前算法
+        扫描时已在同一次读取中计算并缓存了旧算法的哈希值，这里只会命中缓存
+        """
+        legacy_hashes = self.hash_files(file_paths, algorithm=record_algorithm, cancel=cancel)
+        return migrate_record_hashes(records, file_hashes, legacy_hashes)
+
+    def scan(self, adapter, existing_records=None, record_algorithm=None, progress=None, cancel=None):
+        """
+        扫描场景中的贴图
+        1. 通过适配器收集所有贴图引用，合并为唯一文件列表
+        2. 并行计算贴图哈希值；现有记录使用其他算法时同时计算旧算法的哈希值并迁移记录
+        3. 按扫描顺序与现有记录合并，生成贴图记录
+        界面在主线程中执行第1和第3步（访问场景），在后台线程中执行第2步（hash_plan）
+        """
+        plan = self.collect(adapter, progress)
+        result = self.hash_plan(plan, existing_records, record_algorithm, progress, cancel)
+        return self.finish_scan(plan, result, existing_records)
+
+    def hash_plan(self, plan, existing_records=None, record_algorithm=None, progress=None, cancel=None):
+        """扫描中只读取文件的部分，不访问场景，可以在后台线程中执行；返回尚未生成记录的ScanResult"""
+        result = ScanResult()
+        result.scanned_files = plan.unique_paths()
+        self.listing.invalidate()  # 每次扫描重新读取目录列表
+
+        migrate_from = self.migration_algorithm(record_algorithm) if existing_records else None
+        result.file_hashes = self.hash_files(result.scanned_files, progress,
+                                             extra_algorithms=(migrate_from,) if migrate_from else (),
+                                             file_stats=result.file_stats, cancel=cancel)
+        if migrate_from:
+            result.migrated_records = self.migrate_records(existing_records, result.scanned_files,
+                                                           result.file_hashes, migrate_from, cancel)
+        return result
+
+    def finish_scan(self, plan, result, existing_records=None):
+        """按扫描顺序与现有记录合并，生成贴图记录和引用索引"""
+        if result.migrated_records is not None:
+            existing_records = result.migrated_records
+        result.references = plan.resolve(result.file_hashes)
+        result.records.extend(self.build_records(result.references, RecordStore(existing_records)))
+        result.records.index_references(result.references)
+        result.snapshot = ScanSnapshot(self.hash_algorithm, plan.materials, result.file_stats, result.file_hashes,
+                                       plan.scene_file)
+        return result
+
+    def can_rescan(self, snapshot, scene_file=None):
+        """
+        An incremental rescan needs a snapshot hashed with the current algorithm and, when scene_file is given,
+        taken from that scene (another scene opened since then must be scanned in full with its own records)
+        """
+        if snapshot is None or snapshot.algorithm != self.hash_algorithm:
+            return False
+        return scene_file is None or os.path.normcase(snapshot.scene_file) == os.path.normcase(scene_file)
+
+    def rescan(self, adapter, snapshot, records, progress=None, cancel=None):
+        """
+        增量扫描：与上次扫描的快照比较，只处理变化的部分
+        1. 未变化的材质只重新读取贴图文件名，不重新遍历材质结构
+        2. 只为新增或大小/修改时间变化的文件重新计算哈希值（rehash_plan，可在后台线程中执行）
+        3. 与现有记录比较，返回 (ScanResult, ScanDelta)；记录本身不修改，由调用方应用差异
+        """
+        start = time.perf_counter()
+        plan = self.collect(adapter, progress, snapshot)
+        result, delta = self.rehash_plan(plan, snapshot, progress, cancel)
+        self.finish_rescan(plan, result, delta, records)
+        delta.elapsed = time.perf_counter() - start
+        return result, delta
+
+    def rehash_plan(self, plan, snapshot, progress=None, cancel=None):
+        """增量扫描中只读取文件的部分：重新获取文件状态，只为变化的文件计算哈希值"""
+        result = ScanResult()
+        delta = ScanDelta()
+        result.scanned_files = plan.unique_paths()
+        self.listing.invalidate()  # 每次扫描重新读取目录列表，才能发现变化的文件
+
+        result.file_stats = self.stat_files(result.scanned_files)
+        file_hashes = {}
+        for file_path in result.scanned_files:
+            if snapshot.file_unchanged(file_path, result.file_stats[file_path]):
+                file_hashes[file_path] = snapshot.file_hashes[file_path]
+            else:
+                delta.rehashed_files.append(file_path)
+        if delta.rehashed_files:
+            file_hashes.update(self.hash_files(delta.rehashed_files, progress,
+                                               file_stats=result.file_stats, cancel=cancel))
+        result.file_hashes = file_hashes
+        delta.files_changed = bool(delta.rehashed_files) or len(file_hashes) != len(snapshot.file_hashes)
+        return result, delta
+
+    def finish_rescan(self, plan, result, delta, records):
+        """与现有记录比较，填入差异中新增、移除和更新的记录"""
+        result.references = plan.resolve(result.file_hashes)
+        rescanned = self.build_records(result.references, records)
+        rescanned_hashes = {record.hash for record in rescanned}
+        delta.removed = [record for record in records if record.hash not in rescanned_hashes]
+        for new_record in rescanned:
+            record = records.get(new_record.hash)
+            if record is None:
+                delta.added.append(new_record)
+            elif not record.same_values(new_record):
+                delta.updated.append((record, new_record))
+        result.snapshot = ScanSnapshot(self.hash_algorithm, plan.materials, result.file_stats, result.file_hashes,
+                                       plan.scene_file)
+
+    def build_records(self, references, existing):
+        """
+        按照扫描顺序合并贴图引用，生成贴图记录，保证记录顺序与串行扫描一致
+        references: 已计算哈希值的ReferenceIndex，existing: 现有记录的RecordStore
+        返回 [TextureRecord]
+        """
+        records = []
+        seen = set()
+
+        for reference in references:
+            hash_value = reference.hash
+            filename = reference.filename
+
+            # 每个哈希值只生成一条记录
+            if hash_value in seen:
+                continue
+            seen.add(hash_value)
+
+            # 检查贴图是否被引用
+            is_referenced = "是" if filename else "否"
+
+            # 获取当前名称
+            current_name = os.path.basename(filename)
+
+            # 检查此贴图是否存在于导入的数据中
+            existing_data = existing.get(hash_value)
+            if existing_data is not None:
+                # 保持原始名称不变，使用先前记录的原始名称
+                original_name = existing_data.original or current_name
+
+                # 获取所有修改历史
+                modification_history = dict(existing_data.modifications)
+
+                # 如果当前名称与最后一次修改的名称不同，增加新的修改记录
+                if modification_history and current_name != list(modification_history.values())[-1]:
+                    self.modification_count += 1
+                    modification_history[f"modified({self.modification_count})"] = current_name
+                elif not modification_history:
+                    # 如果没有修改历史但有原始数据，添加第一个修改记录
+                    modification_history["modified(1)"] = current_name
+            else:
+                # 第一次看到这个贴图，当前名称就是原始名称
+                original_name = current_name
+                modification_history = {"modified(1)": current_name}
+
+            records.append(TextureRecord(hash_value, original_name, is_referenced,
+                                         len(references.for_hash(hash_value)), modification_history))
+        return records
+
+    def find_duplicates(self, records, scanned_files, file_hashes):
+        """
+        Find duplicate textures by hash value
+        1. 场景中内容完全相同的不同文件：按扫描计算的完整哈希值（file_hashes，{路径: 哈希值}）分组，不再读取文件
+        2. 记录中重复出现的哈希值（例如导入的记录）
+        不访问场景，可以在后台线程中执行
+        """
+        if not records:
+            return []
+
+        # Create dictionary to store textures by hash
+        hash_dict = {}
+        duplicates = {}  # ordered set of duplicate hashes
+
+        if scanned_files:
+            paths_by_hash = {}
+            for file_path in dict.fromkeys(scanned_files):
+                hash_value = file_hashes.get(file_path)
+                if hash_value is not None and not is_hash_error(hash_value):
+                    paths_by_hash.setdefault(hash_value, []).append(file_path)
+            for hash_value, paths in paths_by_hash.items():
+                if len(paths) > 1:
+                    duplicates[hash_value] = True
+
+        for record in records:
+            hash_value = record.hash
+            if is_hash_error(hash_value):
+                continue
+
+            if hash_value in hash_dict:
+                # This is a duplicate
+                duplicates[hash_value] = True
+            else:
+                hash_dict[hash_value] = True
+
+        return list(duplicates)
@@ -0,0 +1,490 @@
+"""
+贴图文件哈希工具
+不依赖Qt和pymxs，既可以在3ds Max中由texture_manager使用，也可以在独立的Python环境中运行（例如哈希性能测试）。
+"""
+import os
+import errno
+import mmap
+import hashlib
+import sqlite3
+import threading
+import functools
+import concurrent.futures
+import time
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# 可用的哈希算法，xxh3和blake3只有在安装了对应模块时才可用
+HASH_ALGORITHMS = {
+    "md5": hashlib.md5,
+    "blake2b": lambda: hashlib.blake2b(digest_size=32),
+}
+if xxhash is not None:
+    HASH_ALGORITHMS["xxh3"] = xxhash.xxh3_128
+if blake3 is not None:
+    HASH_ALGORITHMS["blake3"] = blake3.blake3
+
+DEFAULT_HASH_ALGORITHM = "md5"  # 默认保持与旧版记录兼容，可在界面中切换为更快的算法
+LEGACY_HASH_ALGORITHM = "md5"  # 旧版记录文件（没有文件头）使用的算法
+
+# 哈希缓存配置
+HASH_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".texture_manager", "hash_cache.sqlite")
+HASH_CACHE_MAX_AGE_DAYS = 90  # 超过该天数未使用的缓存条目将被清除
+HASH_CACHE_MAX_ENTRIES = 200000  # 缓存条目上限，超出时清除最久未使用的条目
+HASH_CACHE_SCHEMA_VERSION = 2  # 缓存表结构版本，版本不同时重建缓存
+HASH_CACHE_COMMIT_ROWS = 256  # 新的缓存条目每积累这么多条在一个短事务中写入，不长时间占用写锁
+
+# 并行哈希的线程数 (hashlib在计算时会释放GIL，I/O与计算可以重叠)
+HASH_WORKER_COUNT = min(32, (os.cpu_count() or 1) + 4)
+
+# 按存储类型设置的读取缓冲区大小，网络存储使用更大的缓冲区以减少往返次数
+HASH_BUFFER_SIZES = {
+    "local": 1024 * 1024,
+    "network": 4 * 1024 * 1024,
+}
+HASH_MMAP_THRESHOLD = 64 * 1024 * 1024  # 本地文件超过该大小时使用mmap
+HASH_READAHEAD = True  # 在支持的系统上提示操作系统进行顺序预读
+
+# 目录列表缓存：每个目录只执行一次os.scandir，之后在该时间（秒）内的存在/大小/修改时间查询都从列表中回答
+LISTING_CACHE_MAX_AGE = 30.0
+
+# 哈希策略："auto"根据存储类型和文件大小自动选择
+HASH_STRATEGIES = ("auto", "readinto", "mmap", "file_digest", "chunked")
+
+class OperationCancelled(Exception):
+    """Raised by file operations when their CancelToken is cancelled"""
+    def __init__(self, message="操作已取消"):
+        super(OperationCancelled, self).__init__(message)
+
+class CancelToken:
+    """Thread-safe cancellation flag shared between the UI thread and file workers"""
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        """Raise OperationCancelled if cancellation was requested"""
+        if self._event.is_set():
+            raise OperationCancelled()
+
+def available_algorithms():
+    """Names of the hash algorithms usable in this interpreter"""
+    return list(HASH_ALGORITHMS)
+
+def get_hasher(algorithm):
+    """Create a new hash object for the named algorithm"""
+    try:
+        return HASH_ALGORITHMS[algorithm]()
+    except KeyError:
+        raise ValueError(f"不支持的哈希算法: {algorithm}")
+
+def is_hash_error(hash_value):
+    """True for the placeholder strings stored instead of a digest when a file can't be hashed"""
+    return hash_value.startswith("File not found") or hash_value.startswith("Error")
+
+def normalize_texture_path(file_path, base_dir=None):
+    """
+    Resolve a texture filename to (absolute path, grouping key).
+    Relative paths are resolved against base_dir. The key is separator-normalized and
+    case-folded on Windows, so every spelling of one file (including UNC paths) shares one key.
+    """
+    path = file_path.strip().strip('"')
+    if not os.path.isabs(path) and base_dir:
+        path = os.path.join(base_dir, path)
+    path = os.path.normpath(os.path.abspath(path))
+    return path, os.path.normcase(path)
+
+@functools.lru_cache(maxsize=None)
+def _drive_is_remote(drive):
+    """Windows only: True if the drive letter is a mapped network drive"""
+    try:
+        import ctypes
+        return ctypes.windll.kernel32.GetDriveTypeW(drive + "\\") == 4  # DRIVE_REMOTE
+    except Exception:
+        return False
+
+def storage_class(file_path):
+    """Classify the storage a file lives on as "network" or "local" to pick a read buffer size"""
+    if file_path.startswith("\\\\") or file_path.startswith("//"):
+        return "network"
+    if os.name == "nt":
+        drive = os.path.splitdrive(file_path)[0]
+        if drive and _drive_is_remote(drive.upper()):
+            return "network"
+    return "local"
+
+_thread_buffers = threading.local()
+
+def _get_read_buffer(size):
+    """Reusable per-thread read buffer, so hashing allocates no new bytes objects per chunk"""
+    buffers = getattr(_thread_buffers, "buffers", None)
+    if buffers is None:
+        buffers = _thread_buffers.buffers = {}
+    if size not in buffers:
+        buffers[size] = bytearray(size)
+    return buffers[size]
+
+def _advise_sequential(f):
+    """Hint the OS that the file will be read sequentially, where supported"""
+    if HASH_READAHEAD and hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+def choose_hash_strategy(file_path, size, algorithm_count):
+    """Pick the cheapest strategy for a file: mmap for large local files, file_digest or readinto otherwise"""
+    storage = storage_class(file_path)
+    if storage == "local" and size >= HASH_MMAP_THRESHOLD:
+        return "mmap"
+    if storage == "local" and algorithm_count == 1 and hasattr(hashlib, "file_digest"):
+        return "file_digest"
+    return "readinto"
+
+def _update_readinto(f, hashers, buffer_size, cancel=None):
+    buffer = _get_read_buffer(buffer_size)
+    view = memoryview(buffer)
+    while True:
+        if cancel is not None:
+            cancel.check()
+        count = f.readinto(buffer)
+        if not count:
+            break
+        for hasher in hashers:
+            hasher.update(view[:count])
+
+def _update_mmap(f, hashers):
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for hasher in hashers:
+            hasher.update(mapped)
+
+def _update_chunked(f, hashers, cancel=None):
+    # 旧版实现：每4KB创建一个新的bytes对象，仅保留用于性能对比
+    for chunk in iter(lambda: f.read(4096), b""):
+        if cancel is not None:
+            cancel.check()
+        for hasher in hashers:
+            hasher.update(chunk)
+
+def hash_file_digests(file_path, algorithms, strategy="auto", buffer_size=None, cancel=None):
+    """
+    Calculate several hex digests of a file in a single read. Safe to call from worker threads.
+    strategy: one of HASH_STRATEGIES; buffer_size overrides the per-storage buffer size.
+    cancel: CancelToken checked between buffers (mmap and file_digest hash a file in one call and are only checked before it).
+    """
+    if cancel is not None:
+        cancel.check()
+    algorithms = list(algorithms)
+    with open(file_path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if strategy == "auto":
+            strategy = choose_hash_strategy(file_path, size, len(algorithms))
+        if size == 0 and strategy == "mmap":
+            strategy = "readinto"  # 空文件无法映射
+        if strategy == "file_digest":
+            if len(algorithms) == 1 and hasattr(hashlib, "file_digest"):
+                return [hashlib.file_digest(f, lambda: get_hasher(algorithms[0])).hexdigest()]
+            strategy = "readinto"
+
+        hashers = [get_hasher(algorithm) for algorithm in algorithms]
+        if strategy == "mmap":
+            _update_mmap(f, hashers)
+        elif strategy == "chunked":
+            _update_chunked(f, hashers, cancel)
+        else:
+            _advise_sequential(f)
+            _update_readinto(f, hashers, buffer_size or HASH_BUFFER_SIZES[storage_class(file_path)], cancel)
+    return [hasher.hexdigest() for hasher in hashers]
+
+def hash_file(file_path, algorithm=DEFAULT_HASH_ALGORITHM, strategy="auto"):
+    """Calculate the hex digest of a file. Safe to call from worker threads."""
+    return hash_file_digests(file_path, (algorithm,), strategy)[0]
+
+def stat_file(file_path):
+    """Return (stat_result, error) without raising, for use in worker threads"""
+    try:
+        return os.stat(file_path), None
+    except Exception as e:
+        return None, e
+
+def stat_key(stat_result):
+    """(size, mtime_ns) used to tell whether a file changed, or None when it could not be stat'd"""
+    if stat_result is None:
+        return None
+    return stat_result.st_size, stat_result.st_mtime_ns
+
+class DirectoryListing:
+    """
+    Cache of directory listings answering existence, size and mtime queries.
+    Each distinct directory is read with a single os.scandir and every file in it is answered from that
+    listing, instead of one os.stat / os.path.exists per file (each one a round trip on SMB shares).
+    On Windows names match case-insensitively (an exact match wins), elsewhere only exactly; listings
+    older than max_age seconds are read again, and the caller invalidates a directory after writing to it.
+    Safe to use from worker threads.
+
+    On Windows the stat of a directory entry comes with the listing and has st_ino 0; elsewhere it is
+    fetched on first use and then kept by the entry. stat(inode=True) reads the file's full stat when the
+    listing has no inode, for keys that must tell a replaced file from the original (the hash cache).
+    """
+    def __init__(self, max_age=LISTING_CACHE_MAX_AGE):
+        self.max_age = max_age
+        self.scans = 0  # os.scandir calls, for the status bar and benchmarks
+        self._listings = {}  # normcase(abspath(directory)) -> (time read, {name: DirEntry}, {lower name: DirEntry}) or (time, None, error)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(directory):
+        return os.path.normcase(os.path.abspath(directory))
+
+    def _listing(self, directory):
+        key = self._key(directory)
+        with self._lock:
+            listing = self._listings.get(key)
+        if listing is not None and time.monotonic() - listing[0] <= self.max_age:
+            return listing
+
+        try:
+            with os.scandir(directory or ".") as entries:
+                exact = {entry.name: entry for entry in entries}
+            folded = {}
+            if os.name == "nt":
+                # 只有Windows的文件名不区分大小写；Linux渲染节点上a.PNG和a.png是不同的文件
+                for name, entry in exact.items():
+                    folded.setdefault(name.lower(), entry)
+            listing = (time.monotonic(), exact, folded)
+        except OSError as e:
+            listing = (time.monotonic(), None, e)
+        with self._lock:
+            self.scans += 1
+            self._listings[key] = listing
+        return listing
+
+    def _entry(self, file_path):
+        """Return (DirEntry, error) for a path; error is set when it is missing or its folder cannot be listed"""
+        directory, name = os.path.split(os.path.abspath(file_path))
+        _, exact, folded = self._listing(directory)
+        if exact is None:
+            error = folded
+            if isinstance(error, (FileNotFoundError, NotADirectoryError)):
+                error = FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), file_path)
+            return None, error
+        entry = exact.get(name)
+        if entry is None and folded:
+            entry = folded.get(name.lower())
+        if entry is None:
+            return None, FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), file_path)
+        return entry, None
+
+    def prefetch(self, file_paths, workers=HASH_WORKER_COUNT):
+        """List the folders of file_paths in parallel, so the lookups that follow never touch the disk"""
+        directories = list(dict.fromkeys(os.path.dirname(os.path.abspath(path)) for path in file_paths))
+        if len(directories) > 1 and workers > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(directories))) as executor:
+                list(executor.map(self._listing, directories))
+        else:
+            for directory in directories:
+                self._listing(directory)
+
+    def stat(self, file_path, inode=False):
+        """Return (stat_result, error) like stat_file, answered from the folder's listing"""
+        entry, error = self._entry(file_path)
+        if error is not None:
+            return None, error
+        try:
+            stat_result = entry.stat()
+            if inode and stat_result.st_ino == 0:
+                stat_result = os.stat(entry.path)  # Windows: 目录项的stat没有文件编号
+            return stat_result, None
+        except OSError as e:
+            return None, e
+
+    def exists(self, file_path):
+        return self._entry(file_path)[0] is not None
+
+    def isfile(self, file_path):
+        entry, _ = self._entry(file_path)
+        try:
+            return entry is not None and entry.is_file()
+        except OSError:
+            return False
+
+    def directory_exists(self, directory):
+        return self._listing(directory)[1] is not None
+
+    def names(self, directory):
+        """Names in directory, or None when it cannot be listed"""
+        exact = self._listing(directory)[1]
+        return None if exact is None else list(exact)
+
+    def invalidate(self, path=None):
+        """Forget the listing of path's folder (and of path itself if it is a folder), or every listing"""
+        with self._lock:
+            if path is None:
+                self._listings.clear()
+                return
+            path = os.path.abspath(path)
+            self._listings.pop(self._key(path), None)
+            self._listings.pop(self._key(os.path.dirname(path)), None)
+
+class HashCache:
+    """
+    Persistent file hash cache backed by a SQLite sidecar.
+    An entry is only reused when the file's normalized path, size, mtime_ns and inode
+    all match, so the file never has to be read again while it is unchanged.
+    Digests of different algorithms are cached side by side.
+
+    New entries are buffered and written in short transactions of HASH_CACHE_COMMIT_ROWS rows, so processes
+    sharing the cache never hold its write lock for a whole scan. A failed write (e.g. the database stayed
+    locked) is reported and the entries are dropped; it never turns a computed digest into an error.
+    With read_only=True nothing is written: take_pending() hands the new entries to another process
+    (e.g. the parent of worker processes), which writes them with merge().
+    """
+    def __init__(self, db_path=HASH_CACHE_PATH, max_age_days=HASH_CACHE_MAX_AGE_DAYS,
+                 max_entries=HASH_CACHE_MAX_ENTRIES, read_only=False):
+        self.db_path = db_path
+        self.max_age_days = max_age_days
+        self.max_entries = max_entries
+        self.read_only = read_only
+        self.verify = False  # 校验模式：忽略缓存并强制重新计算哈希
+        self.hits = 0
+        self.misses = 0
+        self.write_errors = 0
+        self._touched = []
+        self._pending = []  # rows not written yet
+        self._conn = None
+
+    @staticmethod
+    def normalize_path(file_path):
+        """Normalize a path so different spellings of the same file share one entry"""
+        return normalize_texture_path(file_path)[1]
+
+    def _connection(self):
+        if self._conn is None:
+            cache_dir = os.path.dirname(self.db_path)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            # 离线批处理会在多个进程中共享同一个缓存，使用WAL并等待其他进程的写锁
+            # 界面在后台线程中扫描，连接可能在不同线程中使用（同一时间只有一个线程访问）
+            self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            schema_version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if schema_version != HASH_CACHE_SCHEMA_VERSION:
+                # 旧版缓存只是可以重建的数据，直接丢弃
+                self._conn.execute("DROP TABLE IF EXISTS file_hash")
+                self._conn.execute(f"PRAGMA user_version = {HASH_CACHE_SCHEMA_VERSION}")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS file_hash ("
+                "path TEXT, algorithm TEXT, size INTEGER, mtime_ns INTEGER, "
+                "inode INTEGER, digest TEXT, last_used REAL, PRIMARY KEY (path, algorithm))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON file_hash (last_used)")
+        return self._conn
+
+    def open(self):
+        """Create or upgrade the database now, before other processes start reading it"""
+        self._connection()
+        return self
+
+    def lookup(self, file_path, stat_result, algorithm=DEFAULT_HASH_ALGORITHM):
+        """Return the cached digest for an unchanged file, or None"""
+        if self.verify:
+            self.misses += 1
+            return None
+        key = self.normalize_path(file_path)
+        row = self._connection().execute(
+            "SELECT size, mtime_ns, inode, digest FROM file_hash WHERE path = ? AND algorithm = ?",
+            (key, algorithm)
+        ).fetchone()
+        if row and row[:3] == (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino):
+            self.hits += 1
+            self._touched.append((key, algorithm))
+            return row[3]
+        self.misses += 1
+        return None
+
+    def store(self, file_path, stat_result, digest, algorithm=DEFAULT_HASH_ALGORITHM):
+        """Remember the digest of a file for its current stat signature; never raises"""
+        self._pending.append((self.normalize_path(file_path), algorithm, stat_result.st_size, stat_result.st_mtime_ns,
+                              stat_result.st_ino, digest, time.time()))
+        if len(self._pending) >= HASH_CACHE_COMMIT_ROWS and not self.read_only:
+            self._write(evict=False)
+
+    def take_pending(self):
+        """Return and forget (new rows, touched keys) not written yet, to merge() them in another process"""
+        pending, touched = self._pending, self._touched
+        self._pending, self._touched = [], []
+        return pending, touched
+
+    def merge(self, pending, touched=()):
+        """Write rows and last-used updates collected by a read-only cache"""
+        self._pending.extend(pending)
+        self._touched.extend(touched)
+        self.flush()
+
+    def _write(self, evict=True):
+        pending, touched = self._pending, self._touched
+        self._pending, self._touched = [], []
+        now = time.time()
+        try:
+            conn = self._connection()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO file_hash VALUES (?, ?, ?, ?, ?, ?, ?)", pending)
+                conn.executemany(
+                    "UPDATE file_hash SET last_used = ? WHERE path = ? AND algorithm = ?",
+                    [(now, key, algorithm) for key, algorithm in touched]
+                )
+                if evict:
+                    self.evict(now)
+        except (sqlite3.Error, OSError) as e:
+            self.write_errors += 1
+            print(f"写入哈希缓存失败，{len(pending)} 个条目未保存: {str(e)}")
+
+    def flush(self):
+        """Commit pending writes and evict stale entries (a read-only cache keeps them for take_pending)"""
+        if self.read_only or (self._conn is None and not self._pending):
+            return
+        self._write()
+
+    def evict(self, now=None):
+        """Drop entries by age, then trim the oldest entries above the size limit"""
+        conn = self._connection()
+        now = now or time.time()
+        if self.max_age_days:
+            conn.execute("DELETE FROM file_hash WHERE last_used < ?",
+                         (now - self.max_age_days * 86400,))
+        if self.max_entries:
+            count = conn.execute("SELECT COUNT(*) FROM file_hash").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM file_hash WHERE rowid IN "
+                    "(SELECT rowid FROM file_hash ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def stats_text(self):
+        """Short hit/miss summary for the status bar"""
+        return f"哈希缓存 命中 {self.hits} / 未命中 {self.misses}"
+
+    def close(self):
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
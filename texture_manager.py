@@ -1,11 +1,27 @@
 import os
+import sys
 import json
-import hashlib
-import shutil
 from PySide2 import QtWidgets, QtCore, QtGui
 import pymxs
 import time
 
+# 确保可以导入同目录下的模块（在3ds Max中通过python.ExecuteFile运行时脚本目录不在sys.path中）
+if "__file__" in globals():
+    _script_dir = os.path.dirname(os.path.abspath(__file__))
+    if _script_dir not in sys.path:
+        sys.path.insert(0, _script_dir)
+
+from texture_hashing import (
+    HashCache, CancelToken, OperationCancelled, DEFAULT_HASH_ALGORITHM, available_algorithms, is_hash_error,
+    normalize_texture_path
+)
+from texture_core import (
+    TextureScanner, RecordStore, ReferenceIndex, RecordJournal, ChangePlan, TextureStore, archive_files, parse_record_file,
+    write_record_file, find_existing_record, scene_record_path, store_manifest_path, ProjectIndex, TextureResolver,
+    TEXTURE_STORE_DIR_NAME, PROJECT_INDEX_NAME
+)
+from texture_pymxs import PymxsSceneAdapter
+
 # Get the MaxPlus module
 rt = pymxs.runtime
 
@@ -20,6 +36,12 @@ BUTTON_HOVER = "#666666"
 BUTTON_PRESSED = "#444444"
 WARNING_COLOR = "#F5A623"  # Warning color for duplicate items
 
+# 归档方式：场景的maps文件夹，或项目的贴图库（引用指向哈希值路径 / maps文件夹中指向贴图库的硬链接）
+ARCHIVE_MODES = ("maps文件夹", "贴图库", "贴图库 (maps中的硬链接)")
+
+# 后台任务的进度更新间隔（秒），进度事件合并后约每秒更新10次
+PROGRESS_INTERVAL = 0.1
+
 class StyleHelper:
     @staticmethod
     def get_main_style():
@@ -29,17 +51,17 @@ class StyleHelper:
                 color: {TEXT_COLOR};
                 border: 1px solid {LIGHT_GRAY};
             }}
-            QTableWidget {{
+            QTableView {{
                 background-color: {MID_GRAY};
                 color: {TEXT_COLOR};
                 gridline-color: {LIGHT_GRAY};
                 border: none;
             }}
-            QTableWidget::item {{
+            QTableView::item {{
                 padding: 5px;
                 border-bottom: 1px solid {LIGHT_GRAY};
             }}
-            QTableWidget::item:selected {{
+            QTableView::item:selected {{
                 background-color: {HIGHLIGHT};
             }}
             QHeaderView::section {{
@@ -88,8 +110,20 @@ class StyleHelper:
             }}
         """
 
+class ProgressThrottle:
+    """Lets one progress event through every PROGRESS_INTERVAL seconds, plus the last step of each stage"""
+    def __init__(self):
+        self._last_progress = 0.0
+    
+    def due(self, current, total):
+        now = time.monotonic()
+        if current >= total or now - self._last_progress >= PROGRESS_INTERVAL:
+            self._last_progress = now
+            return True
+        return False
+
 class ProgressDialog(QtWidgets.QDialog):
-    """Custom progress dialog for longer operations"""
+    """Custom progress dialog for longer operations, with a cancel button while background work runs"""
     def __init__(self, parent=None, title="处理中...", max_value=100):
         super(ProgressDialog, self).__init__(parent)
         self.setWindowTitle(title)
@@ -110,16 +144,253 @@ class ProgressDialog(QtWidgets.QDialog):
         self.progress_bar.setValue(0)
         self.progress_bar.setTextVisible(True)
         layout.addWidget(self.progress_bar)
+        
+        self.cancel_button = QtWidgets.QPushButton("取消")
+        self.cancel_button.setVisible(False)
+        self.cancel_button.clicked.connect(self._on_cancel)
+        layout.addWidget(self.cancel_button)
+        self._cancel_callback = None
+        self._throttle = ProgressThrottle()
+    
+    def set_cancel_callback(self, callback):
+        """Show the cancel button while callback is set; clicking it calls callback once"""
+        self._cancel_callback = callback
+        self.cancel_button.setEnabled(True)
+        self.cancel_button.setVisible(callback is not None)
+        self.setFixedSize(350, 160 if callback is not None else 120)
+    
+    def _on_cancel(self):
+        if self._cancel_callback is not None:
+            self.cancel_button.setEnabled(False)
+            self.label.setText("正在取消...")
+            self._cancel_callback()
     
     def set_value(self, value):
         """Update the progress bar value"""
         self.progress_bar.setValue(value)
         QtWidgets.QApplication.processEvents()
     
+    def set_maximum(self, max_value):
+        """Reset the progress bar for a new stage with the given number of steps"""
+        self.progress_bar.setRange(0, max_value)
+        self.progress_bar.setValue(0)
+        QtWidgets.QApplication.processEvents()
+    
     def set_label(self, text):
         """Update the label text"""
         self.label.setText(text)
         QtWidgets.QApplication.processEvents()
+    
+    def show_progress(self, message, current, total):
+        """Show a progress event; connected to background tasks, which run inside an event loop already"""
+        if self.cancel_button.isVisible() and not self.cancel_button.isEnabled():
+            return  # 取消中，保留"正在取消"的提示
+        if self.progress_bar.maximum() != total:
+            self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(current)
+        self.label.setText(f"{message} {current} / {total}")
+    
+    def report(self, message, current, total):
+        """
+        Progress callback for the scan core on the main thread: progress(message, current, total).
+        Coalesced like background progress, so a per-material report does not process events for every item.
+        """
+        if self._throttle.due(current, total):
+            self.show_progress(message, current, total)
+            QtWidgets.QApplication.processEvents()
+
+class TaskSignals(QtCore.QObject):
+    """Signals of a BackgroundTask; created on the main thread so they are delivered there as queued events"""
+    progress = QtCore.Signal(str, int, int)
+    finished = QtCore.Signal()
+
+class BackgroundTask(QtCore.QRunnable):
+    """
+    Runs work(progress, cancel) on a QThreadPool thread.
+    Progress events are coalesced to one every PROGRESS_INTERVAL seconds (plus the last step of each stage),
+    so fast hashing of many small files does not flood the UI thread.
+    """
+    def __init__(self, work, cancel):
+        super(BackgroundTask, self).__init__()
+        self.setAutoDelete(False)
+        self.work = work
+        self.cancel = cancel
+        self.signals = TaskSignals()
+        self.result = None
+        self.error = None
+        self._throttle = ProgressThrottle()
+    
+    def report(self, message, current, total):
+        if self._throttle.due(current, total):
+            self.signals.progress.emit(message, current, total)
+    
+    def run(self):
+        try:
+            self.result = self.work(self.report, self.cancel)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.signals.finished.emit()
+
+class TextureTableModel(QtCore.QAbstractTableModel):
+    """
+    Table model reading straight from the RecordStore.
+    Cells are produced on demand for the visible rows only; callers report changed records
+    with refresh_records so only those rows are repainted. The modified(N) columns come from the store.
+    """
+    BASE_HEADERS = ["哈希值", "贴图是否引用", "引用次数", "原始贴图名称"]
+    EDIT_COLUMN = 4  # modified(1), the editable name column
+    
+    name_edited = QtCore.Signal(int, str)  # row, new name
+    
+    def __init__(self, parent=None):
+        super(TextureTableModel, self).__init__(parent)
+        self.store = RecordStore()
+        self.modification_columns = self.store.modification_columns()
+        self.warning_color = QtGui.QColor(WARNING_COLOR)
+        self._row_count = None  # row count told to the view while apply_delta is signalling removals
+    
+    def set_store(self, store):
+        """Show a new record store"""
+        self.beginResetModel()
+        self.store = store
+        self.modification_columns = store.modification_columns()
+        self.endResetModel()
+    
+    def refresh_records(self, records=None):
+        """Repaint the rows of the given records (all rows if None); columns are rebuilt only if new modified(N) keys appeared"""
+        columns = self.store.modification_columns()
+        if columns != self.modification_columns:
+            self.set_store(self.store)
+            return
+        if not len(self.store):
+            return
+        last_column = self.columnCount() - 1
+        if records is None:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.store) - 1, last_column))
+            return
+        # Emit one dataChanged per run of consecutive rows
+        rows = sorted({record.row for record in records})
+        start = previous = None
+        for row in rows + [None]:
+            if row is not None and previous is not None and row == previous + 1:
+                previous = row
+                continue
+            if start is not None:
+                self.dataChanged.emit(self.index(start, 0), self.index(previous, last_column))
+            start = previous = row
+    
+    def apply_delta(self, delta):
+        """Apply an incremental rescan's ScanDelta to the store with row remove/insert signals"""
+        # The store removes every row in one call (its indexes are rebuilt once), then one signal is sent
+        # per run of adjacent rows from the top down, shifting each run by the rows signalled before it;
+        # meanwhile rowCount reports the rows the view has been told about
+        rows = sorted(record.row for record in delta.removed)
+        runs = []
+        for row in rows:
+            if runs and runs[-1][1] == row - 1:
+                runs[-1][1] = row
+            else:
+                runs.append([row, row])
+        if runs:
+            self._row_count = len(self.store)
+            self.store.remove(delta.removed)
+            removed = 0
+            for start, end in runs:
+                self.beginRemoveRows(QtCore.QModelIndex(), start - removed, end - removed)
+                self._row_count -= end - start + 1
+                removed += end - start + 1
+                self.endRemoveRows()
+            self._row_count = None
+        
+        for record, new_values in delta.updated:
+            self.store.update(record, new_values)
+        
+        if delta.added:
+            first = len(self.store)
+            self.beginInsertRows(QtCore.QModelIndex(), first, first + len(delta.added) - 1)
+            self.store.extend(delta.added)
+            self.endInsertRows()
+        
+        if delta.updated:
+            self.refresh_records([record for record, _ in delta.updated])
+        elif self.store.modification_columns() != self.modification_columns:
+            self.set_store(self.store)
+    
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.store) if self._row_count is None else self._row_count
+    
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.BASE_HEADERS) + len(self.modification_columns)
+    
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            if section < len(self.BASE_HEADERS):
+                return self.BASE_HEADERS[section]
+            return self.modification_columns[section - len(self.BASE_HEADERS)]
+        return None
+    
+    def _text(self, record, column):
+        if column == 0:
+            return record.hash
+        if column == 1:
+            return record.referenced
+        if column == 2:
+            return str(record.references)
+        if column == 3:
+            return record.original
+        return record.modifications.get(self.modification_columns[column - len(self.BASE_HEADERS)], "")
+    
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.store):
+            return None
+        record = self.store[index.row()]
+        column = index.column()
+        
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            return self._text(record, column)
+        if role == QtCore.Qt.ToolTipRole:
+            if column == 0:
+                # Add tooltip for long hash values
+                return record.hash + " - 重复贴图" if self.store.is_duplicate(record.hash) else record.hash
+            if column == 1:
+                return "贴图是否被引用" if record.referenced == "是" else "贴图未被引用"
+            if column == 2:
+                return "场景中引用此贴图文件的贴图数量"
+            if column == 3:
+                return record.original
+            return "双击编辑名称" if column == self.EDIT_COLUMN else self._text(record, column)
+        if role == QtCore.Qt.TextAlignmentRole:
+            if column in (1, 2):
+                return int(QtCore.Qt.AlignCenter)
+            return None
+        if role == QtCore.Qt.BackgroundRole:
+            if column == 0 and self.store.is_duplicate(record.hash):
+                return self.warning_color
+            return None
+        if role == QtCore.Qt.ForegroundRole:
+            if column >= 3 and self.store.is_duplicate(record.hash):
+                return self.warning_color
+            return None
+        return None
+    
+    def flags(self, index):
+        flags = super(TextureTableModel, self).flags(index)
+        if index.isValid() and index.column() == self.EDIT_COLUMN:
+            flags |= QtCore.Qt.ItemIsEditable
+        return flags
+    
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        """Edits are not written into the record here; the dialog renames the scene references and refreshes the row"""
+        if role != QtCore.Qt.EditRole or index.column() != self.EDIT_COLUMN:
+            return False
+        new_name = str(value).strip()
+        if not new_name or new_name == self._text(self.store[index.row()], index.column()):
+            return False
+        self.name_edited.emit(index.row(), new_name)
+        return True
 
 class TextureManager(QtWidgets.QDialog):
     def __init__(self, parent=None):
@@ -130,12 +401,21 @@ class TextureManager(QtWidgets.QDialog):
         self.setStyleSheet(StyleHelper.get_main_style())
         # 使用标准对话框窗口，但不设置模态或全局置顶
         self.setWindowFlags(QtCore.Qt.Window | QtCore.Qt.WindowTitleHint | QtCore.Qt.WindowCloseButtonHint | QtCore.Qt.CustomizeWindowHint)
+        self.hash_cache = HashCache()
+        self.scanner = TextureScanner(self.hash_cache)  # 扫描核心，不依赖Qt
+        self.scene = PymxsSceneAdapter()  # 通过适配器访问3ds Max场景
         self.initUI()
-        self.texture_data = []
-        self.texture_map_objects = {}  # Store texture objects by hash for later use
-        self.duplicate_textures = []  # Store hash values of duplicate textures
+        self.records = RecordStore()  # 贴图记录及其哈希、路径和重复贴图索引，表格的行与记录一一对应
+        self.references = ReferenceIndex()  # 场景中的所有贴图引用（按哈希值和文件路径索引，包含所属材质和贴图槽）
+        self.scanned_files = []  # 上次扫描到的唯一贴图文件路径，用于检测重复文件
+        self.file_hashes = {}  # 上次扫描计算的文件哈希值（路径 -> 哈希值），检测重复文件时不再读取文件
+        self.scan_snapshot = None  # 上次扫描的快照（材质、贴图文件名、文件大小和修改时间），用于增量扫描
         self.auto_run = False  # 记录是否是自动运行模式
-        self.modification_count = 1  # 记录修改次数的计数器
+        self.record_path = None  # 从场景目录中获取到的记录文件
+        self.record_algorithm = None  # 记录文件使用的哈希算法
+        self.journal = None  # 记录文件旁边的修改日志（重命名、重新指向和撤回事件）
+        self.project_index = None  # 项目中所有场景使用的贴图，每次扫描时更新
+        self.resolver = None  # 搜索目录中按文件名建立的索引，用于查找丢失的贴图
     
     def initUI(self):
         # Main layout
@@ -160,21 +440,25 @@ class TextureManager(QtWidgets.QDialog):
         left_container.setStyleSheet(f"background-color: {MID_GRAY}; border-radius: 5px;")
         left_layout = QtWidgets.QVBoxLayout(left_container)
         
-        # Create table for texture information
-        self.table = QtWidgets.QTableWidget()
-        self.table.setColumnCount(4)  # 初始列数：哈希值、是否引用、原始名称、修改后名称(1)
-        self.table.setHorizontalHeaderLabels(["哈希值", "贴图是否引用", "原始贴图名称", "修改后名称(1)"])
+        # Create table for texture information, backed directly by the record store
+        self.table_model = TextureTableModel(self)
+        # Queued so message boxes are not opened from inside the editor commit
+        self.table_model.name_edited.connect(self.on_name_edited, QtCore.Qt.QueuedConnection)
+        self.table = QtWidgets.QTableView()
+        self.table.setModel(self.table_model)
         self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
         self.table.setEditTriggers(QtWidgets.QAbstractItemView.DoubleClicked)  # Allow editing on double click
         self.table.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
         self.table.setShowGrid(True)
         self.table.setAlternatingRowColors(True)
         self.table.setStyleSheet(
-            f"QTableWidget {{ alternate-background-color: {DARK_GRAY}; }}"
-            f"QTableWidget::item {{ border-bottom: 1px solid {LIGHT_GRAY}; }}"
+            f"QTableView {{ alternate-background-color: {DARK_GRAY}; }}"
+            f"QTableView::item {{ border-bottom: 1px solid {LIGHT_GRAY}; }}"
         )
-        self.table.cellChanged.connect(self.on_cell_changed)
         self.table.verticalHeader().setVisible(False)  # Hide vertical header
+        # Fixed row heights let the view skip measuring rows it does not show
+        self.table.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(self.table.fontMetrics().height() + 10)
         left_layout.addWidget(self.table)
         
         content_layout.addWidget(left_container, 3)
@@ -196,6 +480,27 @@ class TextureManager(QtWidgets.QDialog):
         self.record_btn = self.create_button("记录", "查找场景中的所有贴图并记录")
         right_layout.addWidget(self.record_btn)
         
+        # Verify checkbox - force rehash instead of trusting the hash cache
+        self.verify_checkbox = QtWidgets.QCheckBox("校验哈希")
+        self.verify_checkbox.setToolTip("忽略哈希缓存，重新读取并计算所有贴图的哈希值")
+        right_layout.addWidget(self.verify_checkbox)
+        
+        # Incremental checkbox - rescan only what changed since the last scan
+        self.incremental_checkbox = QtWidgets.QCheckBox("增量扫描")
+        self.incremental_checkbox.setChecked(True)
+        self.incremental_checkbox.setToolTip("再次记录时只重新遍历变化的材质，只为变化的文件重新计算哈希值")
+        right_layout.addWidget(self.incremental_checkbox)
+        
+        # Hash algorithm selector
+        algorithm_layout = QtWidgets.QHBoxLayout()
+        algorithm_layout.addWidget(QtWidgets.QLabel("哈希算法"))
+        self.algorithm_combo = QtWidgets.QComboBox()
+        self.algorithm_combo.addItems(available_algorithms())
+        self.algorithm_combo.setCurrentText(DEFAULT_HASH_ALGORITHM)
+        self.algorithm_combo.setToolTip("计算贴图哈希值使用的算法，MD5用于兼容旧版记录")
+        algorithm_layout.addWidget(self.algorithm_combo)
+        right_layout.addLayout(algorithm_layout)
+        
         # Revert buttons
         right_layout.addSpacing(10)
         revert_label = QtWidgets.QLabel("撤回操作")
@@ -219,10 +524,49 @@ class TextureManager(QtWidgets.QDialog):
         self.archive_checkbox.setToolTip("在处理重复贴图时将贴图复制到maps文件夹")
         right_layout.addWidget(self.archive_checkbox)
         
+        # Archive destination: the scene's maps folder, or the project's content-addressed texture store
+        archive_layout = QtWidgets.QHBoxLayout()
+        archive_layout.addWidget(QtWidgets.QLabel("归档到"))
+        self.archive_combo = QtWidgets.QComboBox()
+        self.archive_combo.addItems(ARCHIVE_MODES)
+        self.archive_combo.setToolTip("maps文件夹: 按原名复制到场景的maps文件夹\n"
+                                      "贴图库: 按哈希值存入项目的texture_store，项目中每个贴图只存储一次，"
+                                      "引用指向哈希值路径或maps文件夹中指向贴图库的硬链接")
+        archive_layout.addWidget(self.archive_combo)
+        right_layout.addLayout(archive_layout)
+        
         # Handle duplicates button
         self.handle_duplicates_btn = self.create_button("处理重复贴图", "检测和处理场景中的重复贴图")
         right_layout.addWidget(self.handle_duplicates_btn)
         
+        # Project index section
+        right_layout.addSpacing(10)
+        project_label = QtWidgets.QLabel("项目索引")
+        project_label.setStyleSheet("font-weight: bold; padding-bottom: 5px; border-bottom: 1px solid #777;")
+        right_layout.addWidget(project_label)
+        
+        project_layout = QtWidgets.QHBoxLayout()
+        project_layout.setSpacing(10)
+        self.where_used_btn = self.create_button("使用位置", "查询项目中使用选中贴图的所有场景")
+        self.project_duplicates_btn = self.create_button("项目重复贴图", "查询整个项目中内容相同的不同文件")
+        project_layout.addWidget(self.where_used_btn)
+        project_layout.addWidget(self.project_duplicates_btn)
+        right_layout.addLayout(project_layout)
+        
+        # Missing texture section
+        right_layout.addSpacing(10)
+        missing_label = QtWidgets.QLabel("丢失贴图")
+        missing_label.setStyleSheet("font-weight: bold; padding-bottom: 5px; border-bottom: 1px solid #777;")
+        right_layout.addWidget(missing_label)
+        
+        missing_layout = QtWidgets.QHBoxLayout()
+        missing_layout.setSpacing(10)
+        self.add_search_root_btn = self.create_button("添加搜索目录", "添加并索引查找丢失贴图的目录（贴图库）")
+        self.relink_missing_btn = self.create_button("重新链接丢失贴图", "在搜索目录中查找所有丢失的贴图并一次重新链接")
+        missing_layout.addWidget(self.add_search_root_btn)
+        missing_layout.addWidget(self.relink_missing_btn)
+        right_layout.addLayout(missing_layout)
+        
         # Import/Export section
         right_layout.addSpacing(10)
         import_export_label = QtWidgets.QLabel("导入/导出")
@@ -255,9 +599,64 @@ class TextureManager(QtWidgets.QDialog):
         self.import_btn.clicked.connect(self.import_records)
         self.export_btn.clicked.connect(self.export_records)
         self.handle_duplicates_btn.clicked.connect(self.handle_duplicate_textures)
-        
-        # Flag to prevent recursive calls in cell changed event
-        self.is_updating_table = False
+        self.where_used_btn.clicked.connect(self.show_where_used)
+        self.project_duplicates_btn.clicked.connect(self.show_project_duplicates)
+        self.add_search_root_btn.clicked.connect(self.add_search_root)
+        self.relink_missing_btn.clicked.connect(self.relink_missing_textures)
+        
+        # Widgets disabled while a background task runs
+        self._busy = False
+        self._busy_widgets = [self.record_btn, self.revert_selected_btn, self.revert_all_btn, self.import_btn,
+                              self.export_btn, self.handle_duplicates_btn, self.algorithm_combo, self.archive_combo,
+                              self.where_used_btn, self.project_duplicates_btn, self.add_search_root_btn,
+                              self.relink_missing_btn, self.verify_checkbox, self.incremental_checkbox, self.table]
+    
+    def closeEvent(self, event):
+        """Persist the hash cache when the dialog closes"""
+        if self._busy:
+            # 后台任务仍在使用哈希缓存，先取消任务
+            self.status_bar.setText("请先取消正在进行的操作")
+            event.ignore()
+            return
+        try:
+            self.scene.stop_change_tracking()
+            self.hash_cache.close()
+            if self.project_index is not None:
+                self.project_index.close()
+            if self.resolver is not None:
+                self.resolver.close()
+        except Exception as e:
+            print(f"保存哈希缓存时出错: {str(e)}")
+        super(TextureManager, self).closeEvent(event)
+    
+    def _set_busy(self, busy):
+        self._busy = busy
+        for widget in self._busy_widgets:
+            widget.setEnabled(not busy)
+    
+    def _run_in_background(self, progress, work):
+        """
+        Run work(progress, cancel) on the Qt thread pool and return its result.
+        A local event loop keeps 3ds Max and the dialog responsive meanwhile; the progress dialog shows
+        the coalesced progress events and a cancel button. Raises OperationCancelled if cancelled,
+        or the work's exception. work must not touch the scene (pymxs is only safe on the main thread).
+        """
+        cancel = CancelToken()
+        task = BackgroundTask(work, cancel)
+        loop = QtCore.QEventLoop()
+        task.signals.progress.connect(progress.show_progress)
+        task.signals.finished.connect(loop.quit)
+        progress.set_cancel_callback(cancel.cancel)
+        self._set_busy(True)
+        try:
+            QtCore.QThreadPool.globalInstance().start(task)
+            loop.exec_()
+        finally:
+            progress.set_cancel_callback(None)
+            self._set_busy(False)
+        if task.error is not None:
+            raise task.error
+        return task.result
     
     def create_button(self, text, tooltip=""):
         """Create a styled button with optional tooltip"""
@@ -267,85 +666,57 @@ class TextureManager(QtWidgets.QDialog):
         button.setCursor(QtCore.Qt.PointingHandCursor)
         return button
     
-    def on_cell_changed(self, row, column):
-        """Handle cell edits"""
-        if self.is_updating_table or column != 3:  # Only handle modified name column
-            return
-            
-        self.is_updating_table = True
+    def on_name_edited(self, row, new_name):
+        """Handle edits of the modified name column"""
+        # Get the record behind the row
+        texture_info = self.records[row]
+        hash_value = texture_info.hash
         try:
-            # Get the hash value and original texture info
-            hash_value = self.table.item(row, 0).text()
-            new_name = self.table.item(row, 3).text().strip()
+            plan = ChangePlan("重命名贴图", self.scanner.listing)
             
-            # Find the texture in our data
-            texture_info = next((item for item in self.texture_data if item["hash"] == hash_value), None)
+            # All bitmap references to this file, in every material and slot
+            references = [reference for reference in self.references.for_hash(hash_value)
+                          if plan.directory_exists(os.path.dirname(reference.path or reference.filename))]
             
-            if texture_info and hash_value in self.texture_map_objects:
-                texture = self.texture_map_objects[hash_value]
-                
-                if texture and hasattr(texture, 'filename'):
-                    # Update the data
-                    texture_info["modified(1)"] = new_name
-                    
-                    # Get current path
-                    current_path = texture.filename
-                    dir_path = os.path.dirname(current_path)
-                    
-                    # Create the new path
-                    new_path = os.path.join(dir_path, new_name)
-                    
-                    # Update the texture in 3ds Max if the file exists or user confirms
-                    if os.path.exists(dir_path):
-                        # Check if this would overwrite an existing file
-                        if os.path.exists(new_path) and new_path != current_path:
-                            reply = QtWidgets.QMessageBox.question(
-                                self, "确认覆盖", 
-                                f"文件 {new_name} 已存在，确定要覆盖吗？\n这将重命名贴图引用但不会重命名文件。",
-                                QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No
-                            )
-                            
-                            if reply == QtWidgets.QMessageBox.Yes:
-                                with rt.undo(True):
-                                    texture.filename = new_path
-                            else:
-                                # Reset to original value
-                                self.table.item(row, 3).setText(texture_info["modified(1)"])
-                        else:
-                            # No conflict, update directly
-                            with rt.undo(True):
-                                texture.filename = new_path
+            if references:
+                # Plan the renames; if a file with the new name already exists, confirm once with the plan summary
+                # (this renames the bitmap references but not the files)
+                plan.rename(references, new_name, hash_value, new_file=True)
+                if not plan.validate() or self._confirm_plan(plan, "确认覆盖"):
+                    transaction = self._apply_plan(plan)
+                    self.status_bar.setText(f"已重命名 {transaction.applied} 个贴图引用: {new_name} ({transaction.elapsed:.2f} 秒)")
         except Exception as e:
             rt.messageBox("更新贴图名称失败: {}".format(str(e)))
         finally:
-            self.is_updating_table = False
-        
-    def find_duplicate_textures(self):
-        """Find duplicate textures by hash value"""
-        if not self.texture_data:
-            return []
-            
-        # Create dictionary to store textures by hash
-        hash_dict = {}
-        duplicates = []
+            self.table_model.refresh_records(self.records.records_with_hash(hash_value))
         
-        for item in self.texture_data:
-            hash_value = item["hash"]
-            if hash_value.startswith("File not found") or hash_value.startswith("Error"):
-                continue
-                
-            if hash_value in hash_dict:
-                # This is a duplicate
-                if hash_value not in duplicates:
-                    duplicates.append(hash_value)
-            else:
-                hash_dict[hash_value] = True
-                
-        return duplicates
+    def find_duplicate_textures(self, progress):
+        """
+        Find duplicate textures by hash value (scanned file hashes plus repeated record hashes) in the background
+        and index them in the record store; returns the hashes whose duplicate state changed
+        """
+        records = list(self.records)
+        scanned_files = list(self.scanned_files)
+        file_hashes = dict(self.file_hashes)
+        duplicates = self._run_in_background(
+            progress, lambda report, cancel: self.scanner.find_duplicates(records, scanned_files, file_hashes))
+        previous_duplicates = set(self.records.duplicates)
+        self.records.set_duplicates(duplicates)
+        return previous_duplicates ^ self.records.duplicates
+    
+    def _find_duplicates_after_scan(self, progress):
+        """
+        Duplicate detection as the last stage of a scan or import: cancelling it keeps the result that is
+        already applied and only skips this stage. Returns the changed hashes, or None if it was cancelled.
+        """
+        try:
+            return self.find_duplicate_textures(progress)
+        except OperationCancelled:
+            return None
     
     def handle_duplicate_textures(self):
         """Handle duplicate textures - detect and offer options to resolve"""
-        if not self.texture_data:
+        if not self.records:
             self.status_bar.setText("没有贴图记录，请先使用记录功能")
             rt.messageBox("请先使用记录功能扫描场景中的贴图.")
             return
@@ -354,106 +725,104 @@ class TextureManager(QtWidgets.QDialog):
         self.status_bar.setText("正在检测重复贴图...")
         
         # Find duplicates with same hash values
-        self.duplicate_textures = self.find_duplicate_textures()
+        progress = ProgressDialog(self, "检测重复贴图")
+        progress.show()
+        try:
+            # Rows whose duplicate highlight changed
+            self._refresh_hashes(self.find_duplicate_textures(progress))
+        except OperationCancelled:
+            self.status_bar.setText("已取消检测重复贴图")
+            return
+        finally:
+            progress.close()
+        duplicate_groups = self.records.duplicate_groups()
         
-        if not self.duplicate_textures:
+        if not duplicate_groups:
             self.status_bar.setText("没有发现重复贴图")
             rt.messageBox("没有发现重复贴图.")
             return
             
-        # Found duplicates, ask user what to do
-        duplicate_count = len(self.duplicate_textures)
-        affected_textures = sum(1 for item in self.texture_data if item["hash"] in self.duplicate_textures)
-        
-        reply = QtWidgets.QMessageBox.question(
-            self, "发现重复贴图", 
-            f"发现 {duplicate_count} 个重复贴图，涉及 {affected_textures} 个贴图引用。\n\n"
-            "是否要处理这些重复贴图？这将使所有贴图引用指向同一个文件。",
-            QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No
-        )
+        # Plan the repointing of every duplicate group and the archive copies, validate it and confirm once
+        duplicate_count = len(duplicate_groups)
+        affected_textures = sum(len(group) for group in duplicate_groups.values())
+        plan = ChangePlan("处理重复贴图", self.scanner.listing)
+        
+        # Check if we need to archive textures into the maps folder or the texture store
+        scene_dir = self.scene.get_scene_dir()
+        maps_folder = os.path.join(scene_dir, "maps") if self.archive_checkbox.isChecked() and scene_dir else None
+        archived = set()
+        store = None
+        if maps_folder and self.archive_combo.currentIndex() != 0:
+            store_root = os.path.join(self._project_root(), TEXTURE_STORE_DIR_NAME)
+            store = TextureStore(store_root, self.scanner.hash_algorithm)
+        
+        for hash_value, textures_with_hash in duplicate_groups.items():
+            # All bitmap references to files with this content
+            references = self.references.for_hash(hash_value)
+            if not textures_with_hash or not references:
+                continue
+            
+            # Use the first texture as the reference, preferring a file that still has the original name
+            reference_name = textures_with_hash[0].original
+            chosen = next((reference for reference in references
+                           if os.path.basename(reference.filename) == reference_name), references[0])
+            reference_path = chosen.filename
+            source_path = chosen.path or chosen.filename  # 相对路径已按场景目录解析
+            
+            # If archiving into the store, the content decides the stored name; a maps link whose name is taken
+            # by other content gets the hash appended
+            if store is not None:
+                if plan.exists(source_path):
+                    link_dir = maps_folder if self.archive_combo.currentIndex() == 2 else None
+                    reference_path = store.add(plan, hash_value, source_path, reference_name, link_dir)
+            # If archiving, copy the texture to the maps folder (once per target name, unless it is already there)
+            elif maps_folder:
+                new_path = os.path.join(maps_folder, reference_name)
+                target_key = os.path.normcase(new_path)
+                if (os.path.normcase(source_path) != target_key and target_key not in archived
+                        and plan.exists(source_path)):
+                    # An existing target is only reused when it has the same content (checked by the archive stage)
+                    archived.add(target_key)
+                    plan.copy(source_path, new_path)
+                    reference_path = new_path
+            
+            # Update all references with this hash to use the reference path
+            plan.repoint(references, reference_path, hash_value)
         
-        if reply != QtWidgets.QMessageBox.Yes:
+        plan.validate()
+        if not self._confirm_plan(plan, "发现重复贴图",
+                                  f"发现 {duplicate_count} 个重复贴图，涉及 {affected_textures} 个贴图引用。\n"
+                                  "处理后所有贴图引用将指向同一个文件。"):
             self.status_bar.setText("取消处理重复贴图")
             return
             
         # Process duplicates
         self.status_bar.setText("正在处理重复贴图...")
-        progress = ProgressDialog(self, "处理重复贴图", len(self.duplicate_textures))
+        progress = ProgressDialog(self, "处理重复贴图", duplicate_count)
         progress.show()
         
         try:
-            # Check if we need to archive textures
-            should_archive = self.archive_checkbox.isChecked()
-            maps_folder = None
-            
-            if should_archive:
-                # Create maps folder if it doesn't exist
-                scene_file = rt.maxFilePath
-                if scene_file:
-                    scene_dir = os.path.dirname(scene_file)
-                    maps_folder = os.path.join(scene_dir, "maps")
-                    if not os.path.exists(maps_folder):
-                        os.makedirs(maps_folder)
-            
-            # Process each duplicate hash
-            for i, hash_value in enumerate(self.duplicate_textures):
-                progress.set_value(i+1)
-                progress.set_label(f"正在处理重复贴图 {i+1} / {len(self.duplicate_textures)}")
-                
-                # Get all textures with this hash
-                textures_with_hash = [item for item in self.texture_data if item["hash"] == hash_value]
-                
-                if textures_with_hash:
-                    # Use the first texture as the reference
-                    reference_texture = textures_with_hash[0]
-                    reference_name = reference_texture["original"]
-                    
-                    # Get the texture object
-                    if hash_value in self.texture_map_objects:
-                        reference_texture_obj = self.texture_map_objects[hash_value]
-                        reference_path = reference_texture_obj.filename
-                        reference_dir = os.path.dirname(reference_path)
-                        
-                        # If archiving, copy the texture to the maps folder
-                        if should_archive and maps_folder:
-                            new_path = os.path.join(maps_folder, reference_name)
-                            if reference_path != new_path and os.path.exists(reference_path):
-                                # Copy file if it doesn't already exist
-                                if not os.path.exists(new_path):
-                                    shutil.copy2(reference_path, new_path)
-                                reference_path = new_path
-                                reference_dir = maps_folder
-                        
-                        # Update all textures with this hash to use the reference path
-                        with rt.undo(True):
-                            for texture_info in textures_with_hash:
-                                texture_hash = texture_info["hash"]
-                                if texture_hash in self.texture_map_objects:
-                                    texture_obj = self.texture_map_objects[texture_hash]
-                                    if texture_obj and hasattr(texture_obj, 'filename'):
-                                        texture_obj.filename = reference_path
-                                        
-                                # Update the data
-                                texture_info["modified(1)"] = reference_name
+            # Archive copies run in the background; cancelling leaves the scene untouched
+            progress.set_label("正在更新贴图引用...")
+            transaction = self._apply_plan(plan, progress)
+            if store is not None and store.entries:
+                scene_file = self.scene.get_scene_file()
+                store.write_manifest(store_manifest_path(scene_file), os.path.splitext(os.path.basename(scene_file))[0])
             
             # Update the table
-            self.is_updating_table = True
-            try:
-                self.table.setRowCount(0)
-                for item in self.texture_data:
-                    self._add_row_to_table(
-                        item["hash"],
-                        item["referenced"],
-                        item["original"],
-                        item["modified(1)"],
-                        item["hash"] in self.duplicate_textures  # Mark duplicate textures
-                    )
-            finally:
-                self.is_updating_table = False
-                
-            self.status_bar.setText(f"已处理 {len(self.duplicate_textures)} 个重复贴图")
-            rt.messageBox(f"已成功处理 {len(self.duplicate_textures)} 个重复贴图.")
+            self._refresh_hashes(duplicate_groups)
                 
+            status_msg = f"已处理 {duplicate_count} 个重复贴图，更新了 {transaction.applied} 个贴图引用 ({transaction.elapsed:.2f} 秒)"
+            message = f"已成功处理 {duplicate_count} 个重复贴图."
+            if plan.archived is not None:
+                # Throughput and bytes moved by the archive stage
+                status_msg += f"，{plan.archived.summary()}"
+                message += "\n" + plan.archived.summary()
+            self.status_bar.setText(status_msg)
+            rt.messageBox(message)
+        
+        except OperationCancelled:
+            self.status_bar.setText("已取消处理重复贴图，场景未修改")
         except Exception as e:
             error_msg = str(e)
             self.status_bar.setText(f"处理重复贴图失败: {error_msg}")
@@ -461,6 +830,45 @@ class TextureManager(QtWidgets.QDialog):
         finally:
             progress.close()
     
+    def _confirm_plan(self, plan, title, message=""):
+        """显示变更计划的摘要并确认一次，详细信息中列出每个复制、贴图引用的新旧路径和冲突"""
+        msg = QtWidgets.QMessageBox(self)
+        msg.setWindowTitle(title)
+        msg.setIcon(QtWidgets.QMessageBox.Warning if plan.conflicts else QtWidgets.QMessageBox.Question)
+        msg.setText((message + "\n\n" if message else "") + plan.summary() + "\n\n确定要执行吗？")
+        msg.setDetailedText(plan.describe())
+        msg.setStandardButtons(QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No)
+        return msg.exec_() == QtWidgets.QMessageBox.Yes
+    
+    def _apply_plan(self, plan, progress=None):
+        """
+        执行变更计划：先在后台复制文件（可取消，取消时场景未修改），再在一个事务中修改所有贴图引用，
+        然后更新记录、修改日志和表格；返回事务（applied为修改的引用数量，elapsed为应用耗时）
+        """
+        if plan.copies:
+            stages = plan.copy_stages()
+            plan.archived = self._run_in_background(progress, lambda report, cancel: self._archive_files(stages, report, cancel))
+        transaction = plan.apply(self.scene, self.references)
+        for hash_value, (_, name) in plan.names.items():
+            for record in self.records.records_with_hash(hash_value):
+                record.current_name = name
+        self._log_events(plan.events())
+        if self.table_model.store is self.records:
+            self._refresh_hashes(plan.names)
+        return transaction
+    
+    def _archive_files(self, stages, progress, cancel):
+        """
+        Archive the (source, target) pairs of each stage in parallel, comparing and verifying the file contents;
+        a stage starts once the files it links or copies from exist. Runs on a background thread.
+        """
+        result = None
+        for copies in stages:
+            stage_result = archive_files(copies, self.scanner.hash_algorithm, listing=self.scanner.listing,
+                                         progress=progress, cancel=cancel)
+            result = stage_result if result is None else result.merge(stage_result)
+        return result
+    
     def record_textures(self, auto_run=False):
         """
         扫描场景中的贴图并记录到表格中
@@ -476,24 +884,37 @@ class TextureManager(QtWidgets.QDialog):
         self.auto_run = auto_run  # 记录是否是自动运行模式
         
         try:
+            self._apply_scan_options()
+            
+            # 已有同一场景上次扫描的结果时只处理变化的部分（校验哈希时总是完整扫描）
+            # 打开了其他场景时完整扫描，重新读取该场景的记录文件和修改日志
+            if (self.incremental_checkbox.isChecked() and not self.verify_checkbox.isChecked()
+                    and self.records and self.scanner.can_rescan(self.scan_snapshot, self.scene.get_scene_file())):
+                self._incremental_rescan()
+                return
+            
             # 清除现有数据
-            self.texture_data = []
-            self.texture_map_objects = {}
-            self.duplicate_textures = []
-            self.table.setRowCount(0)
+            self.records.clear()
+            self.references = ReferenceIndex()
+            self.scanned_files = []
+            self.file_hashes = {}
+            self.scan_snapshot = None
+            self.table_model.set_store(self.records)
             
             # 更新状态
             self.status_bar.setText("正在扫描贴图...")
             
             # 第一步：尝试从场景文件根目录中获取JSON文件
             json_data = self._find_existing_json_record()
-            existing_textures_dict = {}
+            self._open_journal()
+            journal_replayed = False
+            if json_data and self.journal is not None:
+                # 将本场景修改日志中记录文件之后的事件应用到记录上（也应用到作为初始数据的其他场景的记录上）
+                self.journal.replay(json_data)
+                journal_replayed = True
             
             if json_data:
                 self.status_bar.setText("找到现有记录，正在应用...")
-                # 创建查找字典
-                for item in json_data:
-                    existing_textures_dict[item["hash"]] = item
                 
                 # 只在非自动运行模式下显示确认对话框
                 if not self.auto_run:
@@ -505,125 +926,120 @@ class TextureManager(QtWidgets.QDialog):
                     msg.setWindowFlags(QtCore.Qt.WindowStaysOnTopHint)
                     msg.exec_()
             
-            # 第二步：获取场景中的材质和贴图
-            self.status_bar.setText("正在获取场景中的材质...")
-            materials = self._get_scene_materials()
-            
-            if not materials:
-                self.status_bar.setText("未找到材质，无法继续扫描贴图")
-                if not self.auto_run:  # 只在非自动运行模式下显示消息框
-                    rt.messageBox("场景中未找到材质，无法扫描贴图。")
-                return
-                
-            self.status_bar.setText(f"找到 {len(materials)} 个材质，正在扫描贴图...")
-            
-            # 创建进度对话框
-            progress = ProgressDialog(self, "扫描贴图", len(materials))
+            # 第二步至第四步：由扫描核心获取场景中的贴图、并行计算哈希值并与现有记录合并
+            self.status_bar.setText("正在扫描场景中的材质和贴图...")
+            progress = ProgressDialog(self, "扫描贴图")
             progress.show()
             
-            texture_count = 0
             try:
-                # 第三步：处理每个材质以查找贴图
-                for i, material in enumerate(materials):
-                    progress.set_value(i+1)
-                    progress.set_label(f"正在扫描材质 {i+1} / {len(materials)}")
-                    
-                    try:
-                        textures = self._get_material_textures(material)
-                        
-                        # 第四步：计算贴图哈希值并记录信息
-                        for texture in textures:
-                            try:
-                                if texture and hasattr(texture, 'filename') and texture.filename:
-                                    # 计算贴图文件的哈希值
-                                    hash_value = self._calculate_file_hash(texture.filename)
-                                    
-                                    # 检查贴图是否被引用
-                                    is_referenced = "是" if texture.filename else "否"
-                                    
-                                    # 获取当前名称
-                                    current_name = os.path.basename(texture.filename)
-                                    
-                                    # 检查此贴图是否存在于导入的数据中
-                                    if hash_value in existing_textures_dict:
-                                        existing_data = existing_textures_dict[hash_value]
-                                        # 保持原始名称不变，使用先前记录的原始名称
-                                        original_name = existing_data.get("original", current_name)
-                                        
-                                        # 获取所有修改历史
-                                        modification_history = {}
-                                        for key, value in existing_data.items():
-                                            if key.startswith("modified("):
-                                                modification_history[key] = value
-                                        
-                                        # 如果当前名称与最后一次修改的名称不同，增加新的修改记录
-                                        if modification_history and current_name != list(modification_history.values())[-1]:
-                                            self.modification_count += 1
-                                            modification_history[f"modified({self.modification_count})"] = current_name
-                                        elif not modification_history:
-                                            # 如果没有修改历史但有原始数据，添加第一个修改记录
-                                            modification_history[f"modified(1)"] = current_name
-                                    else:
-                                        # 第一次看到这个贴图，当前名称就是原始名称
-                                        original_name = current_name
-                                        modification_history = {f"modified(1)": current_name}
-                                    
-                                    # 存储贴图对象引用以供以后使用
-                                    self.texture_map_objects[hash_value] = texture
-                                    
-                                    # 添加到贴图数据中（如果尚未存在）
-                                    if not any(item["hash"] == hash_value for item in self.texture_data):
-                                        texture_info = {
-                                            "hash": hash_value,
-                                            "referenced": is_referenced,
-                                            "original": original_name
-                                        }
-                                        # 添加所有修改历史
-                                        texture_info.update(modification_history)
-                                        self.texture_data.append(texture_info)
-                                        texture_count += 1
-                            except Exception as tex_err:
-                                print(f"处理贴图时出错: {str(tex_err)}")
-                                continue
-                    except Exception as mat_err:
-                        print(f"处理材质时出错: {str(mat_err)}")
-                        continue
+                # 场景访问留在主线程，哈希计算在后台线程中进行，界面保持响应并可以取消
+                plan = self.scanner.collect(self.scene, progress.report)
+                record_algorithm = self.record_algorithm
+                result = self._run_in_background(
+                    progress, lambda report, cancel: self.scanner.hash_plan(plan, json_data, record_algorithm, report, cancel))
+                self.scanner.finish_scan(plan, result, json_data)
+                
+                # 记录文件总是写入本场景的<场景名>_textures.json，通过目录查找到的其他场景的记录只是初始数据，不覆盖
+                # 旧记录使用其他算法时写入转换为当前算法哈希值的记录；本场景还没有记录文件时创建快照
+                snapshot = result.migrated_records
+                if snapshot is None and len(result.records) > 0 and not self._is_scene_record(self.record_path):
+                    snapshot = result.records.to_dicts()
+                record_written = None
+                if snapshot is not None and self.journal is not None:
+                    self._write_record_file(self.journal.record_path, snapshot)
+                    self.record_path = self.journal.record_path
+                    self.record_algorithm = self.scanner.hash_algorithm
+                    if journal_replayed:
+                        self.journal.clear()  # 新的记录已包含日志中的事件
+                    record_written = os.path.basename(self.journal.record_path)
+                
+                self.records = result.records
+                self.references = result.references
+                self.scanned_files = result.scanned_files
+                self.file_hashes = result.file_hashes
+                self.scan_snapshot = result.snapshot
+                self._update_project_index(result)
+                
+                # 查找重复贴图（取消时保留扫描结果，只跳过重复检测）
+                self.status_bar.setText("正在检查重复贴图...")
+                duplicates_skipped = self._find_duplicates_after_scan(progress) is None
             finally:
                 progress.close()
             
-            # 查找重复贴图
-            self.status_bar.setText("正在检查重复贴图...")
-            self.duplicate_textures = self.find_duplicate_textures()
-            
-            # 更新表格列
-            self._update_table_columns()
-            
             # 第五步：将获取到的信息显示在表格中
             self.status_bar.setText("正在更新表格显示...")
-            self.is_updating_table = True
-            try:
-                for item in self.texture_data:
-                    self._add_row_to_table(item)
-            finally:
-                self.is_updating_table = False
+            self.table_model.set_store(self.records)
             
             # 显示消息
-            if len(self.texture_data) > 0:
-                duplicate_msg = f"，其中包含 {len(self.duplicate_textures)} 个重复贴图" if self.duplicate_textures else ""
-                status_msg = f"已找到 {len(self.texture_data)} 个贴图{duplicate_msg}"
+            if len(self.records) > 0:
+                duplicate_msg = f"，其中包含 {len(self.records.duplicates)} 个重复贴图" if self.records.duplicates else ""
+                if duplicates_skipped:
+                    duplicate_msg = "，已取消重复贴图检测"
+                if record_written:
+                    duplicate_msg += f"，已写入记录文件 {record_written}"
+                status_msg = f"已找到 {len(self.records)} 个贴图{duplicate_msg} ({self._stats_text()})"
                 self.status_bar.setText(status_msg)
                 if not self.auto_run:  # 只在非自动运行模式下显示消息框
-                    rt.messageBox(f"共找到 {len(self.texture_data)} 个贴图{duplicate_msg}.")
+                    rt.messageBox(f"共找到 {len(self.records)} 个贴图{duplicate_msg}.")
             else:
                 self.status_bar.setText("未找到贴图")
                 if not self.auto_run:  # 只在非自动运行模式下显示消息框
                     rt.messageBox("场景中未找到贴图.")
+        except OperationCancelled:
+            self.table_model.set_store(self.records)
+            self.status_bar.setText("已取消扫描")
         except Exception as main_err:
             error_msg = str(main_err)
             self.status_bar.setText(f"执行记录操作时出错: {error_msg}")
             if not self.auto_run:  # 只在非自动运行模式下显示消息框
                 rt.messageBox(f"执行记录操作时出错: {error_msg}")
     
+    def _incremental_rescan(self):
+        """
+        增量扫描
+        与上次扫描的快照比较，只把新增、移除和变化的记录应用到记录库和表格中
+        """
+        self.status_bar.setText("正在增量扫描贴图...")
+        progress = ProgressDialog(self, "增量扫描贴图")
+        progress.show()
+        start_time = time.perf_counter()
+        try:
+            # 场景访问留在主线程，变化文件的哈希在后台线程中计算；取消时记录库和快照保持不变
+            snapshot = self.scan_snapshot
+            plan = self.scanner.collect(self.scene, progress.report, snapshot)
+            result, delta = self._run_in_background(
+                progress, lambda report, cancel: self.scanner.rehash_plan(plan, snapshot, report, cancel))
+            self.scanner.finish_rescan(plan, result, delta, self.records)
+            
+            self.table_model.apply_delta(delta)
+            self.references = result.references
+            self.records.index_references(self.references)
+            self.scanned_files = result.scanned_files
+            self.file_hashes = result.file_hashes
+            self.scan_snapshot = result.snapshot
+            
+            # 文件有变化时重新检测重复贴图并更新项目索引（取消时保留已应用的变化，只跳过重复检测）
+            duplicates_skipped = False
+            if delta.files_changed:
+                self._update_project_index(result)
+                changed_hashes = self._find_duplicates_after_scan(progress)
+                duplicates_skipped = changed_hashes is None
+                if not duplicates_skipped:
+                    self._refresh_hashes(changed_hashes)
+        except OperationCancelled:
+            self.status_bar.setText("已取消增量扫描")
+            return
+        finally:
+            progress.close()
+        delta.elapsed = time.perf_counter() - start_time
+        
+        if delta.is_empty():
+            self.status_bar.setText(f"增量扫描完成，没有变化 ({delta.elapsed:.2f} 秒)")
+        else:
+            skipped_msg = "，已取消重复贴图检测" if duplicates_skipped else ""
+            self.status_bar.setText(f"增量扫描完成: {delta.summary()}{skipped_msg} "
+                                    f"({delta.elapsed:.2f} 秒，{self._stats_text()})")
+    
     def revert_to_selected(self):
         """
         撤回到选中名称
@@ -640,40 +1056,30 @@ class TextureManager(QtWidgets.QDialog):
         # Get the row of the first selected item
         selected_row = selected_rows[0].row()
         
-        # Get hash value from the selected row
-        hash_value = self.table.item(selected_row, 0).text()
-        original_name = self.table.item(selected_row, 2).text()
+        # Get the record behind the selected row
+        selected_record = self.records[selected_row]
+        hash_value = selected_record.hash
+        original_name = selected_record.original
         
         # Update status
         self.status_bar.setText(f"正在撤回贴图: {original_name}...")
         
-        # Find the texture in our data
-        if hash_value in self.texture_map_objects:
-            texture = self.texture_map_objects[hash_value]
+        # Find every bitmap reference to this file
+        if hash_value in self.references:
+            references = self.references.for_hash(hash_value)
             
-            if texture and hasattr(texture, 'filename'):
-                # Get the directory of the current filename
-                current_dir = os.path.dirname(texture.filename)
-                new_path = os.path.join(current_dir, original_name)
-                
-                # Update the texture filename in 3ds Max
+            if all(reference.filename for reference in references):
+                # Update the texture filenames in 3ds Max, keeping each reference's directory;
+                # confirm only if the original file is missing
                 try:
-                    with rt.undo(True):
-                        texture.filename = new_path
-                    
-                    # Update the table and data
-                    self.is_updating_table = True
-                    try:
-                        for item in self.texture_data:
-                            if item["hash"] == hash_value:
-                                item["modified(1)"] = original_name
-                        
-                        is_duplicate = hash_value in self.duplicate_textures
-                        self.table.item(selected_row, 3).setText(original_name)
-                    finally:
-                        self.is_updating_table = False
+                    plan = ChangePlan("撤回贴图名称", self.scanner.listing)
+                    plan.rename(references, original_name, hash_value, event="revert")
+                    if plan.validate() and not self._confirm_plan(plan, "确认撤回"):
+                        self.status_bar.setText("取消撤回")
+                        return
+                    transaction = self._apply_plan(plan)
                     
-                    self.status_bar.setText(f"已撤回到原始名称: {original_name}")
+                    self.status_bar.setText(f"已撤回到原始名称: {original_name} ({transaction.elapsed:.2f} 秒)")
                     rt.messageBox("已撤回到原始名称: {}".format(original_name))
                 except Exception as e:
                     error_msg = str(e)
@@ -692,75 +1098,39 @@ class TextureManager(QtWidgets.QDialog):
         按照流程图实现:
         1. 将场景中的全部贴图根据列表中的反向顺序进行回退命名
         """
-        if not self.texture_data or not self.texture_map_objects:
+        if not self.records or not self.references:
             self.status_bar.setText("没有贴图记录可以撤回")
             rt.messageBox("没有贴图记录可以撤回.")
             return
         
-        reply = QtWidgets.QMessageBox.question(
-            self, "确认撤回", 
-            "确定要将所有贴图撤回到原始名称吗？",
-            QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No
-        )
-        
-        if reply != QtWidgets.QMessageBox.Yes:
+        # 根据列表中的反向顺序进行回退 - 这里使用reversed()来实现反向处理
+        # 按照列表中的顺序反向处理，这样可以确保按照表中显示的相反顺序进行回退
+        hash_values = list(self.references.hashes())
+        hash_values.reverse()
+        
+        # Plan every rename back to the original names, validate it and confirm once
+        plan = ChangePlan("全部撤回到原始名称", self.scanner.listing)
+        for hash_value in hash_values:
+            # Find the texture data
+            texture_info = self.records.get(hash_value)
+            if texture_info:
+                plan.rename(self.references.for_hash(hash_value), texture_info.original, hash_value, event="revert")
+        plan.validate()
+        if not self._confirm_plan(plan, "确认撤回", "确定要将所有贴图撤回到原始名称吗？"):
             return
         
         self.status_bar.setText("正在撤回所有贴图...")
-            
-        # Create progress dialog
-        progress = ProgressDialog(self, "撤回贴图", len(self.texture_map_objects))
-        progress.show()
-        
         try:
-            # 根据列表中的反向顺序进行回退 - 这里使用reversed()来实现反向处理
-            texture_items = list(self.texture_map_objects.items())
-            # 按照列表中的顺序反向处理，这样可以确保按照表中显示的相反顺序进行回退
-            texture_items.reverse()
-            
-            with rt.undo(True):
-                for i, (hash_value, texture) in enumerate(texture_items):
-                    progress.set_value(i+1)
-                    progress.set_label(f"正在处理贴图 {i+1} / {len(self.texture_map_objects)}")
-                    
-                    # Find the texture data
-                    texture_info = next((item for item in self.texture_data if item["hash"] == hash_value), None)
-                    
-                    if texture_info and texture and hasattr(texture, 'filename'):
-                        original_name = texture_info["original"]
-                        current_dir = os.path.dirname(texture.filename)
-                        new_path = os.path.join(current_dir, original_name)
-                        
-                        # Update the texture filename in 3ds Max
-                        texture.filename = new_path
-                        
-                        # Update the data
-                        texture_info["modified(1)"] = original_name
+            # Update every bitmap reference in 3ds Max in one transaction, then the data
+            transaction = self._apply_plan(plan)
         except Exception as e:
             error_msg = str(e)
             self.status_bar.setText(f"全部撤回失败: {error_msg}")
             rt.messageBox("全部撤回失败: {}".format(error_msg))
             return
-        finally:
-            progress.close()
         
-        # Update the table
-        self.is_updating_table = True
-        try:
-            self.table.setRowCount(0)
-            for item in self.texture_data:
-                is_duplicate = item["hash"] in self.duplicate_textures
-                self._add_row_to_table(
-                    item["hash"],
-                    item["referenced"],
-                    item["original"],
-                    item["modified(1)"],
-                    is_duplicate
-                )
-        finally:
-            self.is_updating_table = False
-            
-        self.status_bar.setText("已全部撤回到原始名称")
+        # _apply_plan has already repainted the changed rows, keeping the selection and scroll position
+        self.status_bar.setText(f"已全部撤回到原始名称 ({transaction.elapsed:.2f} 秒)")
         rt.messageBox("已全部撤回到原始名称.")
     
     def import_records(self):
@@ -772,8 +1142,7 @@ class TextureManager(QtWidgets.QDialog):
         3. 如果有则使用相应值
         4. 将数据显示在列表中
         """
-        scene_file = rt.maxFilePath
-        default_dir = os.path.dirname(scene_file) if scene_file else ""
+        default_dir = self.scene.get_scene_dir()
         
         self.status_bar.setText("选择记录文件...")
         
@@ -788,11 +1157,9 @@ class TextureManager(QtWidgets.QDialog):
                 # 1. 检验JSON数据格式
                 try:
                     with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
+                        record_algorithm, data = parse_record_file(json.load(f))
                     
                     # 验证JSON格式
-                    if not isinstance(data, list):
-                        raise ValueError("JSON格式错误：应为列表")
                     
                     for item in data:
                         if not isinstance(item, dict):
@@ -804,14 +1171,6 @@ class TextureManager(QtWidgets.QDialog):
                 except Exception as json_err:
                     raise ValueError(f"JSON数据格式错误: {str(json_err)}")
                 
-                # Clear existing data
-                self.texture_data = []
-                self.table.setRowCount(0)
-                
-                # Add imported data
-                for item in data:
-                    self.texture_data.append(item)
-                
                 # 2. 对比导入的数据贴图是否存在于场景中使用
                 progress = ProgressDialog(self, "导入贴图记录", 2)
                 progress.show()
@@ -820,75 +1179,78 @@ class TextureManager(QtWidgets.QDialog):
                     progress.set_label("正在重新扫描场景贴图...")
                     progress.set_value(1)
                     
-                    # Re-create the texture objects dictionary
-                    self.texture_map_objects = {}
-                    materials = self._get_scene_materials()
-                    scene_textures = []
+                    # Re-create the bitmap reference index
+                    self._apply_scan_options()
+                    migrate_from = self.scanner.migration_algorithm(record_algorithm)
+                    plan = self.scanner.collect(self.scene)
+                    scanned_files = plan.unique_paths()
+                    
+                    def hash_and_migrate(report, cancel):
+                        # 在后台线程中计算哈希，导入的记录使用其他算法时转换为当前算法的哈希值
+                        # （不修改导入的文件，导出时使用新格式）
+                        file_hashes = self.scanner.hash_files(
+                            scanned_files, report, extra_algorithms=(migrate_from,) if migrate_from else (),
+                            cancel=cancel)
+                        records = data
+                        if migrate_from:
+                            records = self.scanner.migrate_records(data, scanned_files, file_hashes, migrate_from, cancel)
+                        return file_hashes, records
                     
-                    for material in materials:
-                        textures = self._get_material_textures(material)
-                        
-                        for texture in textures:
-                            if texture and hasattr(texture, 'filename') and texture.filename:
-                                hash_value = self._calculate_file_hash(texture.filename)
-                                self.texture_map_objects[hash_value] = texture
-                                scene_textures.append(hash_value)
+                    file_hashes, data = self._run_in_background(progress, hash_and_migrate)
+                    progress.set_maximum(2)
+                    records = RecordStore(data)
+                    references = plan.resolve(file_hashes)
+                    records.index_references(references)
+                    scene_textures = references.hash_counts()
                     
                     # 记录匹配情况
-                    total_records = len(self.texture_data)
-                    matched_records = sum(1 for item in self.texture_data if item["hash"] in scene_textures)
+                    total_records = len(records)
+                    matched_records = sum(1 for item in records if item.hash in scene_textures)
+                    
+                    # 3. 如果有则使用相应值：先生成全部重命名的变更计划，校验后确认一次
+                    change_plan = ChangePlan("导入贴图名称", self.scanner.listing)
+                    for item in records:
+                        # Get new filename
+                        modified_name = item.modifications.get("modified(1)", "")
+                        if modified_name and item.hash in scene_textures:
+                            # Rename every bitmap reference to this file, keeping each reference's directory
+                            change_plan.rename(references.for_hash(item.hash), modified_name, item.hash)
+                    change_plan.validate()
+                    if change_plan and not self._confirm_plan(
+                            change_plan, "导入贴图记录", f"导入的记录与场景中的 {matched_records}/{total_records} 个贴图匹配。"):
+                        raise OperationCancelled()
+                    
+                    self.scanned_files = scanned_files
+                    self.file_hashes = file_hashes
+                    self.records = records
+                    self.references = references
+                    self.scan_snapshot = None  # 导入的记录不是扫描结果，下次记录时完整扫描
                     
                     progress.set_label("正在应用导入的贴图名称...")
                     progress.set_value(2)
+                    self._apply_plan(change_plan)
                     
-                    # 3. 如果有则使用相应值
-                    with rt.undo(True):
-                        for item in self.texture_data:
-                            hash_value = item["hash"]
-                            if hash_value in self.texture_map_objects:
-                                texture = self.texture_map_objects[hash_value]
-                                if texture and hasattr(texture, 'filename'):
-                                    # Get current directory
-                                    current_dir = os.path.dirname(texture.filename)
-                                    # Get new filename
-                                    modified_name = item.get("modified(1)", "")
-                                    if modified_name:
-                                        new_path = os.path.join(current_dir, modified_name)
-                                        texture.filename = new_path
+                    # Find duplicate textures (cancelling keeps the applied import and only skips this stage)
+                    duplicates_skipped = self._find_duplicates_after_scan(progress) is None
                 finally:
                     progress.close()
                 
-                # Find duplicate textures
-                self.duplicate_textures = self.find_duplicate_textures()
-                
                 # 4. 将数据显示在列表中
-                self.is_updating_table = True
-                try:
-                    self.table.setRowCount(0)
-                    for item in self.texture_data:
-                        is_duplicate = item["hash"] in self.duplicate_textures
-                        is_in_scene = item["hash"] in scene_textures
-                        # 更新引用状态
-                        if is_in_scene:
-                            item["referenced"] = "是"
-                        else:
-                            item["referenced"] = "否"
-                            
-                        self._add_row_to_table(
-                            item.get("hash", ""),
-                            item.get("referenced", ""),
-                            item.get("original", ""),
-                            item.get("modified(1)", ""),
-                            is_duplicate
-                        )
-                finally:
-                    self.is_updating_table = False
+                for item in self.records:
+                    # 更新引用状态
+                    item.referenced = "是" if item.hash in scene_textures else "否"
+                    item.references = scene_textures.get(item.hash, 0)
+                self.table_model.set_store(self.records)
                 
                 # 提供匹配统计
                 match_info = f"(匹配: {matched_records}/{total_records})" if total_records > 0 else ""
-                duplicate_msg = f"，其中包含 {len(self.duplicate_textures)} 个重复贴图" if self.duplicate_textures else ""
-                self.status_bar.setText(f"成功导入 {len(data)} 条记录{match_info}{duplicate_msg}")
+                duplicate_msg = f"，其中包含 {len(self.records.duplicates)} 个重复贴图" if self.records.duplicates else ""
+                if duplicates_skipped:
+                    duplicate_msg = "，已取消重复贴图检测"
+                self.status_bar.setText(f"成功导入 {len(data)} 条记录{match_info}{duplicate_msg} ({self._stats_text()})")
                 rt.messageBox(f"成功导入 {len(data)} 条记录{match_info}{duplicate_msg}")
+            except OperationCancelled:
+                self.status_bar.setText("已取消导入，场景未修改")
             except Exception as e:
                 error_msg = str(e)
                 self.status_bar.setText(f"导入失败: {error_msg}")
@@ -903,14 +1265,14 @@ class TextureManager(QtWidgets.QDialog):
         1. 将列表中的记录的数据导出为JSON文件
         2. 默认保存在场景文件根目录下
         """
-        if not self.texture_data:
+        if not self.records:
             self.status_bar.setText("没有贴图记录可以导出")
             rt.messageBox("没有贴图记录可以导出.")
             return
             
         # 获取场景文件根目录
-        scene_file = rt.maxFilePath
-        default_dir = os.path.dirname(scene_file) if scene_file else ""
+        scene_file = self.scene.get_scene_file()
+        default_dir = self.scene.get_scene_dir()
         default_name = os.path.splitext(os.path.basename(scene_file))[0] + "_textures.json" if scene_file else "texture_records.json"
         
         self.status_bar.setText("选择保存位置...")
@@ -927,20 +1289,22 @@ class TextureManager(QtWidgets.QDialog):
                 
                 # 准备导出数据 - 符合所需格式
                 export_data = []
-                for item in self.texture_data:
+                for item in self.records:
                     export_item = {
-                        "hash": item["hash"],
-                        "referenced": item["referenced"],
-                        "original": item["original"],
-                        "modified(1)": item["modified(1)"]
+                        "hash": item.hash,
+                        "referenced": item.referenced,
+                        "original": item.original,
+                        "modified(1)": item.current_name
                     }
                     # 添加是否为重复贴图的标记
-                    export_item["is_duplicate"] = item["hash"] in self.duplicate_textures
+                    export_item["is_duplicate"] = self.records.is_duplicate(item.hash)
                     export_data.append(export_item)
                 
-                # 生成标准格式的JSON
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(export_data, f, ensure_ascii=False, indent=2)
+                # 生成带文件头的标准格式JSON，记录使用的哈希算法
+                self._write_record_file(file_path, export_data)
+                if self.journal is not None and os.path.normcase(os.path.abspath(file_path)) == \
+                        os.path.normcase(os.path.abspath(self.journal.record_path)):
+                    self.journal.clear()  # 导出的记录已包含日志中的事件
                 
                 # 显示成功消息，包含文件路径
                 self.status_bar.setText(f"成功导出记录到 {os.path.basename(file_path)}")
@@ -952,6 +1316,49 @@ class TextureManager(QtWidgets.QDialog):
         else:
             self.status_bar.setText("取消导出")
     
+    def _apply_scan_options(self):
+        """将界面中的扫描选项（校验哈希、哈希算法）应用到扫描核心，并重置缓存统计"""
+        self.hash_cache.verify = self.verify_checkbox.isChecked()
+        self.hash_cache.reset_stats()
+        self.scanner.hash_algorithm = self.algorithm_combo.currentText()
+    
+    def _write_record_file(self, file_path, records):
+        """以带文件头的格式写入记录文件，并记录所属的场景名"""
+        scene_file = self.scene.get_scene_file()
+        scene_name = os.path.splitext(os.path.basename(scene_file))[0] if scene_file else ""
+        write_record_file(file_path, records, self.scanner.hash_algorithm, scene_name)
+        self.scanner.listing.invalidate(file_path)
+    
+    def _is_scene_record(self, record_path):
+        """True if record_path is the current scene's own <场景名>_textures.json"""
+        own_path = scene_record_path(self.scene.get_scene_file())
+        return bool(record_path and own_path) and \
+            os.path.normcase(os.path.abspath(record_path)) == os.path.normcase(os.path.abspath(own_path))
+    
+    def _open_journal(self):
+        """
+        打开本场景记录文件<场景名>_textures.json旁边的修改日志，未保存的场景不记录
+        （从目录中找到的其他场景的记录只作为初始数据，修改日志和快照总是写入本场景的记录文件）
+        """
+        record_path = scene_record_path(self.scene.get_scene_file())
+        self.journal = RecordJournal(record_path) if record_path else None
+    
+    def _log_events(self, events):
+        """
+        将重命名、重新指向和撤回事件追加到修改日志，保存的开销与修改数量成正比
+        日志过长时重写本场景的记录文件作为新的快照并清空日志；还没有记录文件时只追加日志，
+        记录文件只由"记录"和导出创建
+        """
+        if self.journal is None or not events:
+            return
+        try:
+            self.journal.append(events)
+            if self.journal.needs_compaction() and self.scanner.listing.isfile(self.journal.record_path):
+                self._write_record_file(self.journal.record_path, self.records.to_dicts())
+                self.journal.clear()
+        except Exception as e:
+            self.status_bar.setText(f"写入修改日志失败: {str(e)}")
+    
     def _find_existing_json_record(self):
         """
         从场景文件根目录中尝试获取JSON文件
@@ -959,299 +1366,235 @@ class TextureManager(QtWidgets.QDialog):
         1. 从场景文件根目录中尝试获取json文件
         2. 如果获取成功，则使用JSON文件中的贴图信息值
         3. 如果未获取到JSON文件，则使用标准方式获取贴图信息
+        
+        返回记录列表，记录文件路径和使用的哈希算法保存在self.record_path和self.record_algorithm中
+        """
+        data, self.record_path, self.record_algorithm, message = find_existing_record(self.scene.get_scene_file())
+        self.status_bar.setText(message)
+        return data
+    
+    def _project_root(self):
         """
-        scene_file = rt.maxFilePath
-        if not scene_file:
-            self.status_bar.setText("未找到场景文件，无法获取JSON记录")
+        贴图库和项目索引所在的文件夹：明确设置了项目文件夹且场景位于其中时使用项目文件夹，否则使用场景目录；
+        未保存的场景返回None
+        """
+        scene_dir = self.scene.get_scene_dir()
+        if not scene_dir:
             return None
-        
-        scene_dir = os.path.dirname(scene_file)
-        scene_name = os.path.splitext(os.path.basename(scene_file))[0]
-        
-        # 首先检查与场景文件同名的JSON记录
-        json_path = os.path.join(scene_dir, scene_name + "_textures.json")
-        
-        if os.path.exists(json_path):
-            try:
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                self.status_bar.setText(f"成功获取JSON记录: {os.path.basename(json_path)}")
-                return data
-            except Exception as e:
-                self.status_bar.setText(f"读取JSON记录失败: {str(e)}")
-                pass
-        
-        # 如果未找到同名文件，检查目录中的任何JSON文件
-        found_files = []
-        for file in os.listdir(scene_dir):
-            if file.endswith(".json"):
-                json_path = os.path.join(scene_dir, file)
-                try:
-                    with open(json_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        # 检查是否是我们的格式
-                        if isinstance(data, list) and len(data) > 0 and "hash" in data[0]:
-                            found_files.append((json_path, data))
-                except:
-                    continue
-        
-        # 如果找到多个文件，使用最新的一个
-        if found_files:
-            found_files.sort(key=lambda x: os.path.getmtime(x[0]), reverse=True)
-            newest_file, data = found_files[0]
-            self.status_bar.setText(f"成功获取最新JSON记录: {os.path.basename(newest_file)}")
-            return data
-        
-        self.status_bar.setText("未找到JSON记录，将使用标准方式获取贴图信息")
-        return None
+        project_dir = self.scene.get_project_dir()
+        if project_dir:
+            project_key = os.path.normcase(os.path.abspath(project_dir)).rstrip(os.sep) + os.sep
+            if (os.path.normcase(os.path.abspath(scene_dir)) + os.sep).startswith(project_key):
+                return project_dir
+        return scene_dir
     
-    def _add_row_to_table(self, hash_value, is_referenced, original_name, modified_name, is_duplicate=False):
-        """Add a row to the table with the given texture information"""
-        row = self.table.rowCount()
-        self.table.insertRow(row)
-        
-        # Add items to row
-        hash_item = QtWidgets.QTableWidgetItem(hash_value)
-        hash_item.setFlags(hash_item.flags() & ~QtCore.Qt.ItemIsEditable)  # Make non-editable
-        hash_item.setToolTip(hash_value)  # Add tooltip for long hash values
-        if is_duplicate:
-            hash_item.setBackground(QtGui.QColor(WARNING_COLOR))
-            hash_item.setToolTip(hash_value + " - 重复贴图")
-        self.table.setItem(row, 0, hash_item)
-        
-        # Referenced indicator with icon
-        ref_item = QtWidgets.QTableWidgetItem(is_referenced)
-        ref_item.setFlags(ref_item.flags() & ~QtCore.Qt.ItemIsEditable)  # Make non-editable
-        ref_item.setTextAlignment(QtCore.Qt.AlignCenter)  # Center align text
-        ref_item.setToolTip("贴图是否被引用" if is_referenced == "是" else "贴图未被引用")
-        self.table.setItem(row, 1, ref_item)
-        
-        # Original name with tooltip
-        orig_item = QtWidgets.QTableWidgetItem(original_name)
-        orig_item.setFlags(orig_item.flags() & ~QtCore.Qt.ItemIsEditable)  # Make non-editable
-        orig_item.setToolTip(original_name)
-        if is_duplicate:
-            orig_item.setForeground(QtGui.QColor(WARNING_COLOR))
-        self.table.setItem(row, 2, orig_item)
-        
-        # Modified name - editable
-        mod_item = QtWidgets.QTableWidgetItem(modified_name)
-        mod_item.setToolTip("双击编辑名称")
-        if is_duplicate:
-            mod_item.setForeground(QtGui.QColor(WARNING_COLOR))
-        self.table.setItem(row, 3, mod_item)
+    def _project_index(self):
+        """项目索引与贴图库位于同一个文件夹中（见_project_root）；未保存的场景返回None"""
+        project_root = self._project_root()
+        if not project_root:
+            return None
+        db_path = os.path.join(project_root, PROJECT_INDEX_NAME)
+        if self.project_index is None or self.project_index.db_path != db_path:
+            if self.project_index is not None:
+                self.project_index.close()
+            self.project_index = ProjectIndex(db_path)
+        return self.project_index
     
-    def _get_scene_materials(self):
-        """Get all materials in the scene"""
-        materials = []
-        
-        # Get all scene nodes
-        for obj in rt.objects:
-            if hasattr(obj, 'material') and obj.material:
-                materials.append(obj.material)
-        
-        # Also check the material library
+    def _update_project_index(self, result):
+        """用扫描到的文件及其哈希值替换项目索引中当前场景的条目，只写入变化的文件"""
         try:
-            # 在3ds Max中材质编辑器通常有24个槽位，但需要安全访问
-            # 检查meditMaterials是否存在和是否有count属性
-            if hasattr(rt, 'meditMaterials'):
-                material_count = 24  # 默认材质槽数量
-                
-                # 尝试获取实际槽位数量
-                if hasattr(rt.meditMaterials, 'count'):
-                    try:
-                        material_count = int(rt.meditMaterials.count)
-                    except:
-                        pass  # 使用默认值
-                
-                # 安全地遍历材质槽
-                for i in range(1, material_count + 1):
-                    try:
-                        material = rt.meditMaterials[i]
-                        if material:
-                            materials.append(material)
-                    except:
-                        # 忽略索引错误，继续处理
-                        continue
-        except:
-            # 如果访问meditMaterials时出错，忽略并继续
-            pass
-        
-        return materials
+            index = self._project_index()
+            if index is not None:
+                index.update_scene(self.scene.get_scene_file(), result.file_hashes, result.file_stats,
+                                   self.scanner.hash_algorithm)
+        except Exception as e:
+            print(f"更新项目索引失败: {str(e)}")
+    
+    def show_where_used(self):
+        """列出项目中使用选中贴图（相同内容）的所有场景和文件"""
+        selected_rows = self.table.selectedIndexes()
+        if not selected_rows:
+            self.status_bar.setText("请先选择要查询的贴图")
+            return
+        index = self._project_index()
+        if index is None:
+            rt.messageBox("请先保存场景，项目索引按场景记录贴图.")
+            return
+        record = self.records[selected_rows[0].row()]
+        start_time = time.perf_counter()
+        try:
+            rows = index.where_used(record.hash, self.scanner.hash_algorithm)
+        except Exception as e:
+            self.status_bar.setText(f"查询项目索引失败: {str(e)}")
+            return
+        elapsed = time.perf_counter() - start_time
+        scenes = sorted({scene for scene, _ in rows})
+        
+        msg = QtWidgets.QMessageBox(self)
+        msg.setWindowTitle("使用位置")
+        msg.setIcon(QtWidgets.QMessageBox.Information)
+        msg.setText(f"{record.current_name}\n项目中有 {len(scenes)} 个场景使用该贴图，共 {len(rows)} 个文件 "
+                    f"({elapsed * 1000:.1f} 毫秒)\n\n" + "\n".join(os.path.basename(scene) for scene in scenes[:20]))
+        msg.setDetailedText("\n".join(f"{scene}: {file_path}" for scene, file_path in rows))
+        msg.exec_()
+    
+    def show_project_duplicates(self):
+        """列出整个项目中内容相同的不同文件，当前场景使用的排在前面"""
+        index = self._project_index()
+        if index is None:
+            rt.messageBox("请先保存场景，项目索引按场景记录贴图.")
+            return
+        start_time = time.perf_counter()
+        try:
+            groups = index.duplicates(self.scanner.hash_algorithm)
+            scene_groups = index.duplicates(self.scanner.hash_algorithm, self.scene.get_scene_file())
+            stats = index.stats_text()
+        except Exception as e:
+            self.status_bar.setText(f"查询项目索引失败: {str(e)}")
+            return
+        elapsed = time.perf_counter() - start_time
+        
+        ordered = list(scene_groups) + [digest for digest in groups if digest not in scene_groups]
+        lines = []
+        for digest in ordered:
+            lines.append(f"{digest}{' (当前场景)' if digest in scene_groups else ''}:")
+            lines.extend(f"  {file_path}" for file_path in groups[digest])
+        msg = QtWidgets.QMessageBox(self)
+        msg.setWindowTitle("项目重复贴图")
+        msg.setIcon(QtWidgets.QMessageBox.Information)
+        msg.setText(f"{stats}\n发现 {len(groups)} 组内容相同的文件，其中 {len(scene_groups)} 组被当前场景使用 "
+                    f"({elapsed * 1000:.1f} 毫秒)")
+        msg.setDetailedText("\n".join(lines))
+        msg.exec_()
     
-    def _get_material_textures(self, material):
-        """Get all textures from a material recursively"""
-        textures = []
+    def _resolver(self):
+        if self.resolver is None:
+            self.resolver = TextureResolver()
+        return self.resolver
+    
+    def add_search_root(self):
+        """添加查找丢失贴图的搜索目录，并在后台建立该目录的文件名索引"""
+        directory = QtWidgets.QFileDialog.getExistingDirectory(self, "添加贴图搜索目录")
+        if not directory:
+            return
+        resolver = self._resolver()
+        progress = ProgressDialog(self, "索引搜索目录")
+        progress.show()
+        try:
+            resolver.add_root(directory)
+            count = self._run_in_background(progress, lambda report, cancel: resolver.index_roots([directory], report, cancel))
+            self.status_bar.setText(f"已索引搜索目录 {directory}: {count} 个贴图文件")
+        except OperationCancelled:
+            self.status_bar.setText("已取消索引搜索目录，查找丢失贴图前会重新索引")
+        except Exception as e:
+            self.status_bar.setText(f"索引搜索目录失败: {str(e)}")
+        finally:
+            progress.close()
+    
+    def relink_missing_textures(self):
+        """
+        重新链接丢失贴图
+        1. 收集场景中文件不存在的贴图引用，按文件分组
+        2. 在搜索目录的文件名索引中查找（过期的索引先重新建立）；有多个同名文件时，优先使用内容与项目索引中记录的
+           哈希值相同的文件，其次使用与丢失路径最近的文件
+        3. 生成变更计划，确认一次后在一个事务中重新链接所有找到的贴图，然后重新扫描以计算哈希值
+        """
+        if not self.records:
+            self.status_bar.setText("没有贴图记录，请先使用记录功能")
+            rt.messageBox("请先使用记录功能扫描场景中的贴图.")
+            return
         
-        if not material:
-            return textures
-            
+        listing = self.scanner.listing
+        missing = {}  # resolved missing path -> [TextureReference]
+        for reference in self.references:
+            if is_hash_error(reference.hash):
+                file_path = normalize_texture_path(reference.filename, self.references.base_dir)[0]
+                if not listing.exists(file_path):
+                    missing.setdefault(file_path, []).append(reference)
+        if not missing:
+            self.status_bar.setText("场景中没有丢失的贴图")
+            rt.messageBox("场景中没有丢失的贴图.")
+            return
+        
+        resolver = self._resolver()
+        if not resolver.roots():
+            self.status_bar.setText("请先添加贴图搜索目录")
+            rt.messageBox("请先添加贴图搜索目录.")
+            return
+        
+        # Hashes the missing files had when a scene was last scanned decide between files with the same name
+        expected_hashes = {}
+        project_index = self._project_index()
+        if project_index is not None:
+            for file_path in missing:
+                digest = project_index.digest_of(file_path, self.scanner.hash_algorithm)
+                if digest:
+                    expected_hashes[file_path] = digest
+        
+        self.status_bar.setText(f"正在查找 {len(missing)} 个丢失的贴图...")
+        progress = ProgressDialog(self, "查找丢失贴图")
+        progress.show()
         try:
-            material_class = str(rt.classOf(material))
-            
-            # Check if it's a standard material
-            if rt.classOf(material) == rt.StandardMaterial:
-                # Check common map slots
-                map_slots = ['diffuseMap', 'specularMap', 'glossinessMap', 'bumpMap', 
-                            'reflectionMap', 'refractionMap', 'displacementMap', 
-                            'selfIllumMap', 'opacityMap', 'filterMap']
-                            
-                for slot in map_slots:
-                    try:
-                        if hasattr(material, slot):
-                            tex_map = getattr(material, slot)
-                            if tex_map:
-                                textures.append(tex_map)
-                    except:
-                        continue
-            
-            # Check for VRay materials
-            elif "VRay" in material_class:
-                # VRay material properties vary, we'll check common ones
-                vray_slots = ['texmap_diffuse', 'texmap_reflect', 'texmap_bump', 'texmap_opacity']
-                for slot in vray_slots:
-                    try:
-                        if hasattr(material, slot) and getattr(material, slot):
-                            textures.append(getattr(material, slot))
-                    except:
-                        continue
-            
-            # Check if it's a multi/sub-material
-            elif rt.classOf(material) == rt.MultiMaterial:
-                try:
-                    num_subs = material.numSubs
-                    for i in range(1, num_subs + 1):
-                        try:
-                            sub_mat = material[i]
-                            if sub_mat:
-                                sub_textures = self._get_material_textures(sub_mat)
-                                textures.extend(sub_textures)
-                        except:
-                            continue
-                except:
-                    pass
+            stale_roots = resolver.stale_roots()
             
-            # For bitmap textures, add them directly
-            elif rt.classOf(material) == rt.Bitmaptexture:
-                textures.append(material)
+            def work(report, cancel):
+                if stale_roots:
+                    resolver.index_roots(stale_roots, report, cancel)
+                hash_files = lambda file_paths: self.scanner.hash_files(file_paths, report, cancel=cancel)
+                return resolver.resolve(list(missing), expected_hashes, hash_files, listing)
             
-            # Handle map layers (composite maps)
-            elif rt.classOf(material) == rt.CompositeTexturemap:
-                try:
-                    # Get number of subtextures in the composite
-                    num_maps = rt.getNumSubTexmaps(material)
-                    for i in range(1, num_maps + 1):
-                        try:
-                            sub_tex = rt.getSubTexmap(material, i)
-                            if sub_tex:
-                                sub_textures = self._get_material_textures(sub_tex)
-                                textures.extend(sub_textures)
-                        except:
-                            continue
-                except:
-                    pass
-            
-            # 尝试处理其他类型的材质
-            else:
-                # 通用方法：尝试获取所有可能的贴图属性
-                try:
-                    # 尝试使用getNumSubTexmaps/getSubTexmap方法
-                    if hasattr(rt, 'getNumSubTexmaps') and hasattr(rt, 'getSubTexmap'):
-                        try:
-                            num_maps = rt.getNumSubTexmaps(material)
-                            for i in range(1, num_maps + 1):
-                                try:
-                                    sub_tex = rt.getSubTexmap(material, i)
-                                    if sub_tex:
-                                        sub_textures = self._get_material_textures(sub_tex)
-                                        textures.extend(sub_textures)
-                                except:
-                                    continue
-                        except:
-                            pass
-                except:
-                    pass
-                
+            resolved, unresolved = self._run_in_background(progress, work)
+        except OperationCancelled:
+            self.status_bar.setText("已取消查找丢失贴图")
+            return
         except Exception as e:
-            print(f"处理材质 {material} 时出错: {str(e)}")
-            # 出错时继续，返回已找到的贴图
-            
-        return textures
-    
-    def _calculate_file_hash(self, file_path):
-        """Calculate MD5 hash for a file"""
+            self.status_bar.setText(f"查找丢失贴图失败: {str(e)}")
+            return
+        finally:
+            progress.close()
+        
+        if not resolved:
+            self.status_bar.setText(f"在搜索目录中没有找到 {len(unresolved)} 个丢失的贴图")
+            rt.messageBox(f"在搜索目录中没有找到 {len(unresolved)} 个丢失的贴图.")
+            return
+        
+        plan = ChangePlan("重新链接丢失贴图", listing)
+        for file_path, new_path in resolved.items():
+            references = missing[file_path]
+            plan.repoint(references, new_path, references[0].hash)
+        plan.validate()
+        message = f"找到 {len(resolved)} 个丢失的贴图，{len(unresolved)} 个未找到。"
+        if unresolved:
+            message += "\n未找到: " + ", ".join(os.path.basename(file_path) for file_path in unresolved[:5])
+            if len(unresolved) > 5:
+                message += " ..."
+        if not self._confirm_plan(plan, "重新链接丢失贴图", message):
+            self.status_bar.setText("取消重新链接丢失贴图")
+            return
+        
         try:
-            if os.path.exists(file_path):
-                md5_hash = hashlib.md5()
-                with open(file_path, "rb") as f:
-                    # Read file in chunks to avoid memory issues with large files
-                    for chunk in iter(lambda: f.read(4096), b""):
-                        md5_hash.update(chunk)
-                return md5_hash.hexdigest()
-            else:
-                return "File not found: " + file_path
+            transaction = self._apply_plan(plan)
         except Exception as e:
-            return "Error: " + str(e)
-
-    def _update_table_columns(self):
-        """更新表格列以显示所有修改历史"""
-        # 获取所有可能的修改列
-        modification_columns = set()
-        for item in self.texture_data:
-            for key in item.keys():
-                if key.startswith("modified("):
-                    modification_columns.add(key)
-        
-        # 按修改序号排序
-        modification_columns = sorted(list(modification_columns), 
-                                    key=lambda x: int(x.split("(")[1].split(")")[0]))
-        
-        # 设置新的列数
-        new_column_count = 3 + len(modification_columns)  # 3个基础列 + 修改历史列
-        self.table.setColumnCount(new_column_count)
-        
-        # 设置表头
-        headers = ["哈希值", "贴图是否引用", "原始贴图名称"]
-        headers.extend(modification_columns)
-        self.table.setHorizontalHeaderLabels(headers)
-
-    def _add_row_to_table(self, item):
-        """Add a row to the table with the given texture information"""
-        row = self.table.rowCount()
-        self.table.insertRow(row)
-        
-        # Add items to row
-        hash_item = QtWidgets.QTableWidgetItem(item["hash"])
-        hash_item.setFlags(hash_item.flags() & ~QtCore.Qt.ItemIsEditable)  # Make non-editable
-        hash_item.setToolTip(item["hash"])  # Add tooltip for long hash values
-        if item["hash"] in self.duplicate_textures:
-            hash_item.setBackground(QtGui.QColor(WARNING_COLOR))
-            hash_item.setToolTip(item["hash"] + " - 重复贴图")
-        self.table.setItem(row, 0, hash_item)
-        
-        # Referenced indicator with icon
-        ref_item = QtWidgets.QTableWidgetItem(item["referenced"])
-        ref_item.setFlags(ref_item.flags() & ~QtCore.Qt.ItemIsEditable)  # Make non-editable
-        ref_item.setTextAlignment(QtCore.Qt.AlignCenter)  # Center align text
-        ref_item.setToolTip("贴图是否被引用" if item["referenced"] == "是" else "贴图未被引用")
-        self.table.setItem(row, 1, ref_item)
-        
-        # Original name with tooltip
-        orig_item = QtWidgets.QTableWidgetItem(item["original"])
-        orig_item.setFlags(orig_item.flags() & ~QtCore.Qt.ItemIsEditable)  # Make non-editable
-        orig_item.setToolTip(item["original"])
-        if item["hash"] in self.duplicate_textures:
-            orig_item.setForeground(QtGui.QColor(WARNING_COLOR))
-        self.table.setItem(row, 2, orig_item)
-        
-        # Add modification history columns
-        for i, mod_key in enumerate(sorted([k for k in item.keys() if k.startswith("modified(")], 
-                                         key=lambda x: int(x.split("(")[1].split(")")[0]))):
-            mod_item = QtWidgets.QTableWidgetItem(item[mod_key])
-            mod_item.setToolTip("双击编辑名称")
-            if item["hash"] in self.duplicate_textures:
-                mod_item.setForeground(QtGui.QColor(WARNING_COLOR))
-            self.table.setItem(row, 3 + i, mod_item)
+            self.status_bar.setText(f"重新链接丢失贴图失败: {str(e)}")
+            rt.messageBox(f"重新链接丢失贴图失败: {str(e)}")
+            return
+        
+        # Rescan so the relinked files are hashed and merged into the records
+        self.record_textures(auto_run=True)
+        self.status_bar.setText(f"已重新链接 {len(resolved)} 个丢失的贴图（{transaction.applied} 个贴图引用），"
+                                f"{len(unresolved)} 个未找到")
+    
+    def _stats_text(self):
+        """Hash cache and scene traversal statistics of the last scan, for the status bar"""
+        return "，".join(text for text in (self.hash_cache.stats_text(), self.scene.stats_text()) if text)
+    
+    def _refresh_hashes(self, hash_values):
+        """Repaint the table rows of the records with the given hashes"""
+        records = []
+        for hash_value in hash_values:
+            records.extend(self.records.records_with_hash(hash_value))
+        if records:
+            self.table_model.refresh_records(records)
 
 def run():
     """
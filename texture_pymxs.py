@@ -0,0 +1,566 @@
+"""
+3ds Max场景适配器
+通过pymxs读取场景中的材质和贴图，并修改贴图路径。供texture_manager的界面使用，扫描逻辑本身在texture_core中。
+"""
+import os
+import contextlib
+
+import pymxs
+
+from texture_core import SceneAdapter, TextureReference
+
+rt = pymxs.runtime
+
+# 材质类型注册表（类名小写）-> (直接读取的贴图槽属性, 是否遍历子材质)
+# 每个类的属性在本次会话中首次遇到时用getPropNames检查一次并缓存，当前版本中不存在的属性会被忽略；
+# 注册的贴图槽之外的贴图（其他版本或插件新增的槽）仍通过getSubTexmap遍历找到；
+# 未注册的类在首次遇到时自动发现，通过getSubMtl/getSubTexmap遍历
+MATERIAL_SLOT_REGISTRY = {
+    "standardmaterial": (('diffuseMap', 'specularMap', 'glossinessMap', 'bumpMap',
+                          'reflectionMap', 'refractionMap', 'displacementMap',
+                          'selfIllumMap', 'opacityMap', 'filterMap'), False),
+    "multimaterial": ((), True),
+    "physicalmaterial": (('base_weight_map', 'base_color_map', 'reflectivity_map', 'refl_color_map',
+                          'roughness_map', 'metalness_map', 'diff_rough_map', 'anisotropy_map',
+                          'aniso_angle_map', 'transparency_map', 'trans_color_map', 'trans_rough_map',
+                          'trans_ior_map', 'scattering_map', 'sss_color_map', 'sss_scale_map',
+                          'emission_map', 'emit_color_map', 'coat_map', 'coat_color_map',
+                          'coat_rough_map', 'bump_map', 'coat_bump_map', 'displacement_map',
+                          'cutout_map'), False),
+    "vraymtl": (('texmap_diffuse', 'texmap_reflection', 'texmap_reflectionGlossiness',
+                 'texmap_refraction', 'texmap_refractionGlossiness', 'texmap_bump',
+                 'texmap_displacement', 'texmap_opacity', 'texmap_self_illumination',
+                 'texmap_metalness', 'texmap_roughness', 'texmap_reflect'), False),
+    "coronalegacymtl": (('texmapDiffuse', 'texmapReflect', 'texmapReflectGlossiness', 'texmapRefract',
+                         'texmapRefractGlossiness', 'texmapOpacity', 'texmapBump', 'texmapDisplace',
+                         'texmapSelfIllum', 'texmapTranslucency'), False),
+    "coronaphysicalmtl": (('baseTexmap', 'baseRoughnessTexmap', 'baseBumpTexmap', 'metalnessTexmap',
+                           'refractionAmountTexmap', 'opacityTexmap', 'displacementTexmap',
+                           'selfIllumTexmap', 'clearcoatAmountTexmap', 'translucencyFractionTexmap'), False),
+    "ai_standard_surface": (('base_color_shader', 'specular_color_shader', 'specular_roughness_shader',
+                             'metalness_shader', 'normal_shader', 'opacity_shader', 'emission_color_shader',
+                             'transmission_color_shader', 'coat_color_shader'), False),
+}
+
+# 带有文件名的贴图类型（类名小写）-> 文件名属性；其他贴图类型首次遇到时检查是否有FILENAME_PROPERTIES中的属性
+FILE_TEXMAP_REGISTRY = {
+    "bitmaptexture": "filename",
+    "vraybitmap": "HDRIMapName",
+    "vrayhdri": "HDRIMapName",
+    "coronabitmap": "filename",
+    "ai_bitmap": "filename",
+    "oslmap": "filename",  # OSL Bitmap Lookup等读取文件的OSL着色器
+}
+FILENAME_PROPERTIES = ("filename", "HDRIMapName")
+
+# 同一个类的不同实例属性不同的类型（OSL贴图的属性取决于着色器），每个实例单独检查
+PER_INSTANCE_CLASSES = {"oslmap"}
+
+# 在3ds Max内部一次性遍历所有材质图的MAXScript，结果以一个字符串返回，避免逐个属性跨越pymxs边界
+# 每行以制表符分隔：
+#   M  材质句柄  是否赋予了物体(1/0)  材质名称
+#   T  贴图句柄  槽位路径  文件名        （属于上一个M行的材质）
+BULK_SCAN_SCRIPT = r"""
+struct TextureManagerBulkScan
+(
+    out = stringStream "",
+    fn clean value =
+    (
+        local text = if value == undefined then "" else value as string
+        text = substituteString text "\t" " "
+        text = substituteString text "\r" " "
+        substituteString text "\n" " "
+    ),
+    fn joinSlot slotPath slotName =
+    (
+        if slotPath == "" then slotName else slotPath + "/" + slotName
+    ),
+    filenameProperties = #(FILENAME_PROPERTY_NAMES),
+    fn fileOf m =
+    (
+        local result = undefined
+        if superClassOf m == textureMap do
+            for p in filenameProperties where result == undefined and isProperty m p do
+                result = getProperty m p
+        if classOf result == String then result else undefined
+    ),
+    fn walk m slotPath path =
+    (
+        if m != undefined and (findItem path m) == 0 do
+        (
+            append path m
+            local fileName = fileOf m
+            if fileName != undefined do
+                format "T\t%\t%\t%\n" (getHandleByAnim m) (clean slotPath) (clean fileName) to:out
+            if superClassOf m == material do
+                for i = 1 to getNumSubMtls m do
+                    walk (getSubMtl m i) (joinSlot slotPath ("[" + i as string + "]")) path
+            for i = 1 to getNumSubTexmaps m do
+                walk (getSubTexmap m i) (joinSlot slotPath (getSubTexmapSlotName m i)) path
+            deleteItem path path.count
+        )
+    ),
+    fn run =
+    (
+        local seen = #{}
+        local onNodes = #{}
+        local materials = #()
+        for o in objects where o.material != undefined do
+        (
+            local h = getHandleByAnim o.material
+            if not seen[h] do (seen[h] = true; append materials o.material)
+            onNodes[h] = true
+        )
+        for i = 1 to meditMaterials.count do
+        (
+            local m = meditMaterials[i]
+            if m != undefined and not seen[getHandleByAnim m] do (seen[getHandleByAnim m] = true; append materials m)
+        )
+        for m in materials do
+        (
+            local h = getHandleByAnim m
+            format "M\t%\t%\t%\n" h (if onNodes[h] then 1 else 0) (clean m.name) to:out
+            walk m "" #()
+        )
+        out as string
+    )
+)
+(TextureManagerBulkScan()).run()
+""".replace("FILENAME_PROPERTY_NAMES", ", ".join("#" + name for name in FILENAME_PROPERTIES))
+
+class _BulkMaterial:
+    """A material as returned by BULK_SCAN_SCRIPT: its name and (texture handle, slot, filename) rows"""
+    __slots__ = ("name", "textures")
+    
+    def __init__(self, name):
+        self.name = name
+        self.textures = []
+
+class PymxsSceneAdapter(SceneAdapter):
+    """
+    SceneAdapter backed by the running 3ds Max scene.
+    Materials are keyed by their anim handle. After the first scan a NodeEventCallback marks the
+    materials of nodes whose material structure or parameters change, so incremental rescans only
+    walk those again; material editor slots not assigned to any node are always walked again.
+    
+    Within one traversal every material and texmap is resolved once: the (texture, slot, filename) list of each
+    anim handle is memoized, so an instanced material or a shared sub-map is walked a single time, and
+    handles already on the current path are skipped to break reference cycles. pymxs_calls counts the
+    runtime calls of the last traversal.
+    
+    With bulk=True (the default) the material graphs are walked inside 3ds Max by BULK_SCAN_SCRIPT in a
+    single pymxs call and bitmaps are referenced by anim handle; the Python walker above is the fallback
+    if the script fails, and is used directly with bulk=False.
+    """
+    def __init__(self, bulk=True):
+        self.bulk = bulk
+        self._bulk_node_keys = None  # keys of materials assigned to nodes, from the last bulk traversal
+        self._event_callback = None  # NodeEventCallback, kept alive while tracking
+        self._dirty_materials = set()
+        self._node_material_keys = set()
+        self._resolved = {}  # anim handle -> [(texture, slot relative to that handle, filename)] of the current traversal
+        self._visiting = set()  # anim handles on the current traversal path
+        self._class_entries = {}  # class name -> (map slot properties or None, walk sub-materials, filename properties)
+        self.pymxs_calls = 0
+        self.memo_hits = 0
+    
+    def get_scene_file(self):
+        # maxFilePath只是场景所在目录，需要与maxFileName组合成完整路径
+        if not rt.maxFileName:
+            return ""
+        return os.path.join(rt.maxFilePath, rt.maxFileName)
+    
+    def get_project_dir(self):
+        # 3ds Max当前项目文件夹；默认的用户项目（我的文档下的"3ds Max 20xx"）不是明确设置的项目，返回None
+        project_dir = rt.pathConfig.getCurrentProjectFolder()
+        if not project_dir or not os.path.isdir(project_dir):
+            return None
+        documents = os.path.normcase(os.path.join(os.path.expanduser("~"), "Documents"))
+        parent, name = os.path.split(os.path.normcase(os.path.abspath(project_dir)))
+        if parent == documents and name.replace(" ", "").startswith("3dsmax"):
+            return None
+        return project_dir
+    
+    def iter_materials(self, progress=None):
+        """遍历场景材质（同一材质被多个物体使用时只返回一次），只访问场景，不读取文件"""
+        self._resolved = {}
+        self._visiting = set()
+        self.pymxs_calls = 0
+        self.memo_hits = 0
+        self._bulk_node_keys = None
+        materials = None
+        if self.bulk:
+            try:
+                materials = self._get_bulk_materials()
+            except Exception as e:
+                print(f"批量读取场景材质失败，改为逐个遍历: {str(e)}")
+        if materials is None:
+            materials = self._get_scene_materials()
+        for i, (key, material) in enumerate(materials):
+            if progress:
+                progress("正在扫描材质", i + 1, len(materials))
+            yield key, material
+    
+    def get_material_references(self, material):
+        """收集一个材质中的所有贴图引用"""
+        if isinstance(material, _BulkMaterial):
+            return [TextureReference(handle, filename, material.name, slot)
+                    for handle, slot, filename in material.textures if filename]
+        references = []
+        try:
+            material_name = self._get_material_name(material)
+            for texture, slot, filename in self._get_material_textures(material):
+                if filename:
+                    references.append(TextureReference(texture, filename, material_name, slot))
+        except Exception as mat_err:
+            print(f"处理材质时出错: {str(mat_err)}")
+        return references
+    
+    def bulk_material_references(self, material):
+        # 批量脚本的结果已包含当前的文件名，不需要再逐个读取
+        if isinstance(material, _BulkMaterial):
+            return self.get_material_references(material)
+        return None
+    
+    def material_changed(self, key):
+        if self._event_callback is None:
+            return True
+        return key in self._dirty_materials or key not in self._node_material_keys
+    
+    def reset_material_changes(self):
+        self._dirty_materials.clear()
+        if self._bulk_node_keys is not None:
+            self._node_material_keys = set(self._bulk_node_keys)
+            if self._event_callback is None:
+                self.start_change_tracking()
+            return
+        self._node_material_keys = set()
+        for obj in rt.objects:
+            try:
+                if obj.material:
+                    self._node_material_keys.add(self._material_key(obj.material))
+            except Exception:
+                continue
+        if self._event_callback is None:
+            self.start_change_tracking()
+    
+    def start_change_tracking(self):
+        """注册节点事件回调，记录材质发生变化的节点"""
+        try:
+            self._event_callback = rt.NodeEventCallback(
+                materialStructured=self._on_material_event,
+                materialOtherEvent=self._on_material_event
+            )
+        except Exception as e:
+            print(f"无法注册材质变化回调，增量扫描将重新遍历所有材质: {str(e)}")
+            self._event_callback = None
+    
+    def stop_change_tracking(self):
+        """释放节点事件回调（MAXScript中回调对象被回收后停止）"""
+        if self._event_callback is not None:
+            self._event_callback = None
+            rt.gc(light=True)
+    
+    def _on_material_event(self, event, node_handles):
+        for handle in node_handles:
+            try:
+                node = rt.getAnimByHandle(handle)
+                if node is not None and node.material:
+                    self._dirty_materials.add(self._material_key(node.material))
+            except Exception:
+                continue
+    
+    def stats_text(self):
+        return f"pymxs调用 {self.pymxs_calls} 次，复用 {self.memo_hits} 个已解析的材质/贴图"
+    
+    def _material_key(self, material):
+        self.pymxs_calls += 1
+        try:
+            return int(rt.getHandleByAnim(material))
+        except Exception:
+            return id(material)
+    
+    def get_texture_filename(self, texture):
+        texture = self._texture_anim(texture)
+        if not texture:
+            return None
+        for name in self._filename_properties(texture):
+            value = getattr(texture, name, None)
+            if isinstance(value, str):
+                return value
+        return None
+    
+    def set_texture_filename(self, texture, filename):
+        texture = self._texture_anim(texture)
+        properties = self._filename_properties(texture)
+        setattr(texture, properties[0] if properties else 'filename', filename)
+    
+    def _texture_anim(self, texture):
+        """Bulk traversals reference bitmaps by anim handle"""
+        if isinstance(texture, int):
+            return rt.getAnimByHandle(texture)
+        return texture
+    
+    @contextlib.contextmanager
+    def undo(self):
+        with pymxs.undo(True):
+            yield
+    
+    @contextlib.contextmanager
+    def batch(self, name=""):
+        """
+        一次撤销记录中修改大量贴图：期间暂停视口重绘和命令面板更新，并关闭打开的材质编辑器，
+        避免每次修改贴图路径都触发刷新；结束或出错时恢复
+        """
+        reopen_editors = []
+        for editor in ("MatEditor", "sme"):
+            try:
+                if getattr(rt, editor).isOpen():
+                    getattr(rt, editor).Close()
+                    reopen_editors.append(editor)
+            except Exception:
+                continue
+        rt.disableSceneRedraw()
+        editing_suspended = False
+        try:
+            rt.suspendEditing()
+            editing_suspended = True
+        except Exception:
+            pass
+        try:
+            with pymxs.undo(True, name or "修改贴图路径"):
+                yield
+        finally:
+            if editing_suspended:
+                try:
+                    rt.resumeEditing()
+                except Exception:
+                    pass
+            rt.enableSceneRedraw()
+            for editor in reopen_editors:
+                try:
+                    getattr(rt, editor).Open()
+                except Exception:
+                    continue
+            rt.redrawViews()
+    
+    def _get_bulk_materials(self):
+        """Get all (key, _BulkMaterial) pairs from one evaluation of BULK_SCAN_SCRIPT"""
+        self.pymxs_calls += 1
+        output = str(rt.execute(BULK_SCAN_SCRIPT))
+        materials = []
+        node_keys = set()
+        material = None
+        for line in output.splitlines():
+            fields = line.split("\t")
+            if fields[0] == "M" and len(fields) == 4:
+                key = int(fields[1])
+                material = _BulkMaterial(fields[3])
+                materials.append((key, material))
+                if fields[2] == "1":
+                    node_keys.add(key)
+            elif fields[0] == "T" and len(fields) == 4 and material is not None:
+                material.textures.append((int(fields[1]), fields[2], fields[3]))
+        self._bulk_node_keys = node_keys
+        return materials
+    
+    def _get_scene_materials(self):
+        """Get all (key, material) pairs in the scene, each material once even if it is instanced on many nodes"""
+        materials = []
+        seen = set()
+        
+        def add(material):
+            key = self._material_key(material)
+            if key not in seen:
+                seen.add(key)
+                materials.append((key, material))
+        
+        # Get all scene nodes
+        for obj in rt.objects:
+            self.pymxs_calls += 1
+            material = getattr(obj, 'material', None)
+            if material:
+                add(material)
+        
+        # Also check the material library
+        try:
+            # 在3ds Max中材质编辑器通常有24个槽位，但需要安全访问
+            # 检查meditMaterials是否存在和是否有count属性
+            if hasattr(rt, 'meditMaterials'):
+                material_count = 24  # 默认材质槽数量
+                
+                # 尝试获取实际槽位数量
+                if hasattr(rt.meditMaterials, 'count'):
+                    try:
+                        material_count = int(rt.meditMaterials.count)
+                    except:
+                        pass  # 使用默认值
+                
+                # 安全地遍历材质槽
+                for i in range(1, material_count + 1):
+                    try:
+                        self.pymxs_calls += 1
+                        material = rt.meditMaterials[i]
+                        if material:
+                            add(material)
+                    except:
+                        # 忽略索引错误，继续处理
+                        continue
+        except:
+            # 如果访问meditMaterials时出错，忽略并继续
+            pass
+        
+        return materials
+    
+    def _get_material_name(self, material):
+        try:
+            return str(material.name)
+        except Exception:
+            return str(material)
+    
+    def _get_material_textures(self, material, slot_path=""):
+        """
+        Get all (texture, slot, filename) triples from a material or texmap recursively; slot is the map slot path inside the top material.
+        Each anim handle is resolved once per traversal and reused wherever it is referenced again.
+        """
+        if not material:
+            return []
+        
+        key = self._material_key(material)
+        resolved = self._resolved.get(key)
+        if resolved is not None:
+            self.memo_hits += 1
+        elif key in self._visiting:
+            # 引用循环：该材质/贴图已在当前路径上，由外层继续处理
+            return []
+        else:
+            self._visiting.add(key)
+            try:
+                resolved = self._resolve_textures(material)
+            finally:
+                self._visiting.discard(key)
+            self._resolved[key] = resolved
+        
+        return [(texture, self._join_slot(slot_path, slot), filename) for texture, slot, filename in resolved]
+    
+    def _join_slot(self, slot_path, name):
+        if slot_path and name:
+            return f"{slot_path}/{name}"
+        return slot_path or name
+    
+    def _class_entry(self, material, material_class):
+        """
+        (map slot properties or None, walk sub-materials, filename properties) of the material's class.
+        Registered classes are checked against the class's actual properties, other classes are discovered;
+        both happen once per class and session. None map slots means walking the generic sub-texmap interface;
+        with registered slots the sub-texmap walk only adds the maps that are not in one of them.
+        """
+        class_name = material_class.lower()
+        entry = self._class_entries.get(class_name)
+        if entry is not None:
+            return entry
+        
+        try:
+            self.pymxs_calls += 1
+            properties = {str(name).lstrip('#').lower(): str(name).lstrip('#') for name in rt.getPropNames(material)}
+        except Exception:
+            properties = {}
+        
+        def existing(names):
+            return tuple(properties[name.lower()] for name in names if name.lower() in properties)
+        
+        if class_name in MATERIAL_SLOT_REGISTRY:
+            slots, sub_materials = MATERIAL_SLOT_REGISTRY[class_name]
+            entry = (existing(slots), sub_materials, ())
+        elif class_name in FILE_TEXMAP_REGISTRY:
+            entry = (None, False, existing((FILE_TEXMAP_REGISTRY[class_name],)))
+        else:
+            entry = (None, True, existing(FILENAME_PROPERTIES))
+        if class_name not in PER_INSTANCE_CLASSES:
+            self._class_entries[class_name] = entry
+        return entry
+    
+    def _filename_properties(self, texture):
+        self.pymxs_calls += 1
+        return self._class_entry(texture, str(rt.classOf(texture)))[2]
+    
+    def _sub_texmap_slot(self, material, index):
+        try:
+            self.pymxs_calls += 1
+            return str(rt.getSubTexmapSlotName(material, index)) or f"map{index}"
+        except Exception:
+            return f"map{index}"
+    
+    def _resolve_textures(self, material):
+        """(texture, slot relative to material, filename) triples of one material or texmap, without memoization"""
+        textures = []
+        
+        try:
+            self.pymxs_calls += 1
+            material_class = str(rt.classOf(material))
+            slots, sub_materials, filename_properties = self._class_entry(material, material_class)
+            
+            # Texmaps that reference a file (Bitmaptexture, VRayBitmap, CoronaBitmap, ai_bitmap, OSL bitmaps...)
+            for name in filename_properties:
+                try:
+                    self.pymxs_calls += 1
+                    filename = getattr(material, name)
+                    if isinstance(filename, str):
+                        textures.append((material, "", filename))
+                        break
+                except:
+                    continue
+            
+            # Registered map slots are read directly
+            slot_maps = set()
+            for slot in slots or ():
+                try:
+                    self.pymxs_calls += 1
+                    tex_map = getattr(material, slot)
+                    if tex_map:
+                        slot_maps.add(self._material_key(tex_map))
+                        textures.extend(self._get_material_textures(tex_map, slot))
+                except:
+                    continue
+            
+            # Sub-materials (multi/sub-material, blend materials...)
+            if sub_materials:
+                try:
+                    self.pymxs_calls += 1
+                    num_subs = rt.getNumSubMtls(material)
+                    for i in range(1, num_subs + 1):
+                        try:
+                            self.pymxs_calls += 1
+                            sub_mat = rt.getSubMtl(material, i)
+                            if sub_mat:
+                                textures.extend(self._get_material_textures(sub_mat, f"[{i}]"))
+                        except:
+                            continue
+                except:
+                    pass
+            
+            # Walk all sub texmaps: every map of other types (composite maps, unregistered materials),
+            # and the maps of registered materials that are not in a registered slot (partial slot list, newer versions)
+            try:
+                self.pymxs_calls += 1
+                num_maps = rt.getNumSubTexmaps(material)
+                for i in range(1, num_maps + 1):
+                    try:
+                        self.pymxs_calls += 1
+                        sub_tex = rt.getSubTexmap(material, i)
+                        if not sub_tex:
+                            continue
+                        if slots is None:
+                            textures.extend(self._get_material_textures(sub_tex, f"map{i}"))
+                        elif self._material_key(sub_tex) not in slot_maps:
+                            textures.extend(self._get_material_textures(sub_tex, self._sub_texmap_slot(material, i)))
+                    except:
+                        continue
+            except:
+                pass
+                
+        except Exception as e:
+            print(f"处理材质 {material} 时出错: {str(e)}")
+            # 出错时继续，返回已找到的贴图
+            
+        return textures
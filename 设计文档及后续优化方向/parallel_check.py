@@ -1,24 +1,173 @@
-import concurrent.futures
+"""
+并行贴图检查
+逐行读取材质记录（JSONL），并行检查每个材质所有贴图槽中的文件是否存在，可选检查文件大小和哈希值，
+每个材质检查完成后立即输出一行JSON结果（按完成顺序），任意大小的场景都不会受命令行长度限制。
+
+输入（文件或标准输入）每行一个材质:
+    {"material": "Wall", "maps": {"diffuseMap": "D:/maps/wall.png", "bumpMap": "D:/maps/wall_n.png"}}
+没有"maps"时，除material/name/id/handle外的每个非空字符串字段都视为一个贴图槽:
+    {"material": "Wall", "diffuseMap": "D:/maps/wall.png", "bumpMap": "D:/maps/wall_n.png"}
+
+输出每行一个材质（默认只输出有丢失贴图的材质，--all 输出全部）:
+    {"line": 1, "material": "Wall", "missing": ["bumpMap"],
+     "maps": {"diffuseMap": {"filename": "D:/maps/wall.png", "exists": true, "size": 1024, "hash": "..."}, ...}}
+无法解析的输入行输出 {"line": N, "error": "..."}（退出码为1）；结束时在标准错误输出统计信息。
+
+用法:
+    python parallel_check.py materials.jsonl
+    python parallel_check.py --workers 32 --size --hash md5 -o result.jsonl materials.jsonl
+    type materials.jsonl | python parallel_check.py -
+
+在MAXScript中把材质记录写入临时文件，然后调用:
+    HiddenDOSCommand ("python parallel_check.py --all \"" + inputFile + "\" -o \"" + outputFile + "\"")
+"""
 import os
+import sys
 import json
+import hashlib
+import argparse
+import functools
+import concurrent.futures
+
+# 不是贴图槽的材质字段
+MATERIAL_FIELDS = ("material", "name", "id", "handle")
+
+# 同时提交的材质数量为线程数的倍数，输入很大时也只保留有限的待处理材质
+PENDING_PER_WORKER = 4
+
+HASH_ALGORITHMS = ("md5", "sha1", "sha256", "blake2b")
+HASH_BUFFER_SIZE = 1024 * 1024
+
+def material_maps(record):
+    """{slot: filename} of a material record"""
+    maps = record.get("maps")
+    if isinstance(maps, dict):
+        return {slot: filename for slot, filename in maps.items() if isinstance(filename, str) and filename}
+    return {key: value for key, value in record.items()
+            if key not in MATERIAL_FIELDS and isinstance(value, str) and value}
+
+@functools.lru_cache(maxsize=None)
+def check_file(filename, size=False, algorithm=None):
+    """
+    Check one texture file; cached so a file shared by many materials is only checked once.
+    Returns {"exists": bool, "size": int, "hash": str} (size/hash only when requested and the file exists).
+    """
+    result = {"exists": False}
+    try:
+        stat_result = os.stat(filename)
+    except OSError:
+        return result
+    result["exists"] = True
+    if size:
+        result["size"] = stat_result.st_size
+    if algorithm:
+        try:
+            hasher = hashlib.new(algorithm)
+            with open(filename, "rb") as f:
+                for chunk in iter(lambda: f.read(HASH_BUFFER_SIZE), b""):
+                    hasher.update(chunk)
+            result["hash"] = hasher.hexdigest()
+        except OSError as e:
+            result["hash_error"] = str(e)
+    return result
+
+def check_material(line_number, record, options):
+    """Check every map slot of one material record"""
+    maps = {}
+    missing = []
+    for slot, filename in material_maps(record).items():
+        maps[slot] = dict(filename=filename, **check_file(filename, options["size"], options["algorithm"]))
+        if not maps[slot]["exists"]:
+            missing.append(slot)
+    return {
+        "line": line_number,
+        "material": record.get("material", record.get("name", "")),
+        "missing": missing,
+        "maps": maps
+    }
+
+def read_records(stream):
+    """Yield (line number, record or None, error) for each non-empty input line"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("材质记录必须是JSON对象")
+            yield line_number, record, None
+        except ValueError as e:
+            yield line_number, None, str(e)
+
+def run(stream, out, options):
+    """
+    Check the records of stream on a bounded thread pool and write each result as soon as it completes.
+    Returns (materials checked, materials with missing maps, bad input lines).
+    """
+    checked = 0
+    with_missing = 0
+    errors = 0
+
+    def write(result):
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+
+    def finish(done):
+        nonlocal checked, with_missing
+        for future in done:
+            result = future.result()
+            checked += 1
+            if result["missing"]:
+                with_missing += 1
+            if result["missing"] or options["all"]:
+                write(result)
+
+    max_pending = options["workers"] * PENDING_PER_WORKER
+    with concurrent.futures.ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+        pending = set()
+        for line_number, record, error in read_records(stream):
+            if error is not None:
+                errors += 1
+                write({"line": line_number, "error": error})
+                continue
+            pending.add(executor.submit(check_material, line_number, record, options))
+            if len(pending) >= max_pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                finish(done)
+        for future in concurrent.futures.as_completed(pending):
+            finish([future])
+    return checked, with_missing, errors
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="并行检查材质记录（JSONL）中所有贴图槽的文件")
+    parser.add_argument("input", nargs="?", default="-", help="材质记录JSONL文件，- 表示标准输入（默认）")
+    parser.add_argument("--workers", type=int, default=min(32, (os.cpu_count() or 1) + 4),
+                        help="检查文件的线程数（默认: CPU核心数+4，最多32）")
+    parser.add_argument("--size", action="store_true", help="输出存在的贴图文件大小")
+    parser.add_argument("--hash", dest="algorithm", choices=HASH_ALGORITHMS,
+                        help="计算存在的贴图文件的哈希值，例如 md5")
+    parser.add_argument("--all", action="store_true", help="输出所有材质，而不只是有丢失贴图的材质")
+    parser.add_argument("-o", "--output", help="输出JSONL文件（默认输出到标准输出）")
+    args = parser.parse_args(argv)
 
-def check_material(material):
-    # 模拟材质检查逻辑
-    if not os.path.exists(material['diffuseMap']):
-        return material
-    return None
-
-def main(materials):
-    missing_maps = []
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        results = executor.map(check_material, materials)
-        for result in results:
-            if result:
-                missing_maps.append(result)
-    return missing_maps
+    options = {
+        "workers": max(1, args.workers),
+        "size": args.size,
+        "algorithm": args.algorithm,
+        "all": args.all
+    }
+    stream = sys.stdin if args.input == "-" else open(args.input, 'r', encoding='utf-8')
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        checked, with_missing, errors = run(stream, out, options)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if out is not sys.stdout:
+            out.close()
+    print(f"检查 {checked} 个材质，{with_missing} 个有丢失贴图，{errors} 行无法解析", file=sys.stderr)
+    return 1 if errors else 0
 
 if __name__ == "__main__":
-    import sys
-    materials = json.loads(sys.argv[1])
-    missing_maps = main(materials)
-    print(json.dumps(missing_maps))
\ No newline at end of file
+    sys.exit(main())